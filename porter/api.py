@@ -11,6 +11,7 @@ import flask
 import werkzeug.exceptions as werkzeug_exc
 
 from . import config as cf
+from . import timing
 
 
 def request_method():
@@ -18,6 +19,11 @@ def request_method():
     return flask.request.method
 
 
+def request_header(name, default=None):
+    """Return the value of the header ``name`` of the current request."""
+    return flask.request.headers.get(name, default)
+
+
 def request_json(silent=False):
     """Return the JSON from the current request.
 
@@ -102,6 +108,39 @@ def get_model_context():
     # http://flask.pocoo.org/docs/dev/tutorial/dbcon/
     return getattr(flask.g, 'model_context', None)
 
+def set_stage_timer(timer):
+    """Register a :class:`porter.timing.StageTimer` on the request context."""
+    if flask.has_app_context():
+        flask.g.stage_timer = timer
+
+def stage_timer():
+    """Return the :class:`porter.timing.StageTimer` of the current request.
+
+    A timer that records nothing is returned if no timer was registered, e.g.
+    when instrumentation is disabled or outside of a request.
+    """
+    if flask.has_app_context():
+        return flask.g.get('stage_timer', timing.NULL_TIMER)
+    return timing.NULL_TIMER
+
+def set_batch_size(batch_size):
+    """Register the number of instances in the current request."""
+    if flask.has_app_context():
+        flask.g.batch_size = batch_size
+
+def get_batch_size():
+    """Return the number of instances in the current request or None."""
+    return getattr(flask.g, 'batch_size', None)
+
+def set_validated_count(validated_count):
+    """Register the number of instances validated in the current request."""
+    if flask.has_app_context():
+        flask.g.validated_count = validated_count
+
+def get_validated_count():
+    """Return the number of instances validated in the current request or None."""
+    return getattr(flask.g, 'validated_count', None)
+
 
 App = flask.Flask
 """alias of ``flask.app.Flask``."""
@@ -0,0 +1,211 @@
+"""A local disk cache for model artifacts stored on S3.
+
+Downloading the same artifacts every time a server (or each of its worker
+processes) starts is slow and expensive. When ``porter.config.artifact_cache_dir``
+is set, :func:`porter.loading.load_file` downloads each S3 object once into
+that directory and loads it from disk afterwards.
+
+Cached objects are keyed by bucket, key and the ``VersionId`` or ``ETag`` of the
+object, so a new version of an object is always downloaded. Processes sharing
+a cache directory synchronize with file locks so that each object is only
+downloaded once, and the SHA-256 checksum of each cached file is verified
+before it is used. If ``porter.config.artifact_cache_max_bytes`` is set, the
+least recently used objects are evicted once the cache exceeds that size.
+Objects are not evicted while they are being loaded.
+
+Locking relies on :func:`fcntl.flock` and is only supported on POSIX systems.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+
+_logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class ArtifactCache:
+    """A directory caching S3 objects.
+
+    Args:
+        directory (str): Directory in which objects are stored. Created if it
+            does not exist.
+        max_bytes (int or None): If not ``None``, the least recently used
+            objects are evicted after an object is added to the cache until
+            the total size of the cached objects is at most ``max_bytes``.
+            The object just added is never evicted.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError('`max_bytes` must be a non-negative integer or None')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def get(self, s3_client, bucket, key, transfer_config=None):
+        """Context manager yielding the path of a local copy of
+        ``s3://<bucket>/<key>``, downloading the object with ``s3_client``
+        unless a verified copy of its current version is cached.
+        ``transfer_config`` is an optional
+        :class:`boto3.s3.transfer.TransferConfig` used for the download.
+
+        The copy is not evicted by any process before the context exits.
+        """
+        import fcntl
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        version = head.get('VersionId') or head['ETag']
+        entry = self._entry_name(bucket, key, version)
+        path = os.path.join(self.directory, entry)
+        with open(os.path.join(self.directory, entry + '.lock'), 'a') as lock_file:
+            while True:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                downloaded = not self._verify(entry)
+                if downloaded:
+                    self._download(s3_client, bucket, key, head, entry, transfer_config)
+                else:
+                    # the modification time records when an entry was last used
+                    os.utime(path)
+                    _logger.info(f'loading s3://{bucket}/{key} from cache {path}',
+                                 extra={'event': 'artifact_cache_hit'})
+                # entries in use are shared with other readers and skipped by
+                # evict(). The lock is released while it is converted, so the
+                # entry may have been evicted in the meantime.
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+                if os.path.exists(path):
+                    break
+            try:
+                if downloaded and self.max_bytes is not None:
+                    self.evict(keep=entry)
+                yield path
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def evict(self, keep=None):
+        """Remove the least recently used objects until the cache is at most
+        ``max_bytes`` large. Objects that are currently being downloaded,
+        verified or loaded are skipped."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            entry = name[:-len('.json')]
+            try:
+                stat = os.stat(os.path.join(self.directory, entry))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            with self._lock(entry, blocking=False) as locked:
+                if not locked:
+                    continue
+                self._remove(entry)
+            total -= size
+            _logger.info(f'evicted {entry} from cache {self.directory}',
+                         extra={'event': 'artifact_cache_evict'})
+
+    def _download(self, s3_client, bucket, key, head, entry, transfer_config):
+        # pin the download to the version we looked up. Unversioned objects
+        # that change during the download fail the size and checksum checks
+        # below, since downloads do not accept IfMatch.
+        extra_args = {'VersionId': head['VersionId']} if head.get('VersionId') else {}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.download-')
+        os.close(fd)
+        try:
+            s3_client.download_file(bucket, key, tmp_path, ExtraArgs=extra_args,
+                                    Config=transfer_config)
+            size = os.path.getsize(tmp_path)
+            if size != head['ContentLength']:
+                raise ValueError(f'downloaded {size} bytes of s3://{bucket}/{key} '
+                                 f'but expected {head["ContentLength"]}')
+            md5, sha256 = _file_digests(tmp_path, 'md5', 'sha256')
+            # the ETag of objects uploaded in a single part is their MD5 hash
+            etag = head['ETag'].strip('"')
+            if '-' not in etag and len(etag) == 32 and md5 != etag:
+                raise ValueError(f'checksum of s3://{bucket}/{key} does not match its ETag')
+            # the data is moved into place before the metadata is written so
+            # that an entry with metadata is always complete.
+            os.replace(tmp_path, os.path.join(self.directory, entry))
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        meta = {'bucket': bucket, 'key': key, 'etag': head['ETag'],
+                'version_id': head.get('VersionId'), 'size': size, 'sha256': sha256}
+        _write_atomic(os.path.join(self.directory, entry + '.json'), json.dumps(meta))
+        _logger.info(f'cached s3://{bucket}/{key} in {self.directory}',
+                     extra={'event': 'artifact_cache_miss'})
+
+    def _verify(self, entry):
+        """Return ``True`` if ``entry`` is cached and its checksum is
+        correct. Invalid entries are removed."""
+        try:
+            with open(os.path.join(self.directory, entry + '.json')) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        try:
+            sha256, = _file_digests(os.path.join(self.directory, entry), 'sha256')
+        except FileNotFoundError:
+            sha256 = None
+        if sha256 != meta['sha256']:
+            _logger.warning(f'removing corrupt entry {entry} from cache {self.directory}',
+                            extra={'event': 'artifact_cache_corrupt'})
+            self._remove(entry)
+            return False
+        return True
+
+    def _remove(self, entry):
+        # the lock file is kept since other processes may be waiting on it
+        for name in (entry + '.json', entry):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.directory, name))
+
+    @contextlib.contextmanager
+    def _lock(self, entry, blocking=True):
+        """Context manager holding an exclusive lock on ``entry``. Yields
+        ``False`` if ``blocking`` is ``False`` and the lock is held
+        elsewhere."""
+        import fcntl
+        with open(os.path.join(self.directory, entry + '.lock'), 'a') as f:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(f, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _entry_name(bucket, key, version):
+        return hashlib.sha256(f'{bucket}\0{key}\0{version}'.encode()).hexdigest()
+
+
+def _file_digests(path, *algorithms):
+    hashes = [hashlib.new(algorithm) for algorithm in algorithms]
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            for h in hashes:
+                h.update(chunk)
+    return [h.hexdigest() for h in hashes]
+
+
+def _write_atomic(path, content):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.meta-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
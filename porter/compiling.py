@@ -0,0 +1,701 @@
+"""Fast paths for predicting with and transforming by fitted scikit-learn
+estimators and predicting with Keras models.
+
+For single instances and small batches, ``predict()`` and ``transform()`` of
+scikit-learn estimators spend most of their time validating their input and
+dispatching between Python functions rather than computing.
+:func:`compile_model` and :func:`compile_transformer` extract the fitted
+parameters of supported estimators and return a function computing the same
+output with a handful of NumPy operations:
+
+    >>> from porter.compiling import compile_model, compile_transformer
+    >>> predict = compile_model(pipeline)
+    >>> predict(X)
+    >>> transform = compile_transformer(column_transformer)
+    >>> transform(X)
+
+Supported are
+
+- linear models: ``LinearRegression``, ``Ridge``, ``Lasso``, ``ElasticNet``,
+  ``SGDRegressor``, ``LogisticRegression``, ``SGDClassifier``, ``Perceptron``
+  and ``LinearSVC``,
+- trees and tree ensembles with a single output: ``DecisionTreeRegressor``,
+  ``DecisionTreeClassifier``, ``RandomForestRegressor``,
+  ``RandomForestClassifier``, ``ExtraTreesRegressor`` and
+  ``ExtraTreesClassifier``. All trees of an ensemble are evaluated at once,
+- the transformers ``StandardScaler``, ``MinMaxScaler`` and ``MaxAbsScaler``,
+  which are applied as arrays of offsets and scales, ``OneHotEncoder`` and
+  ``OrdinalEncoder``, which look up the index of each category in precomputed
+  tables, ``ColumnTransformer`` combining them and pipelines of them,
+- pipelines of supported transformers ending with a supported model,
+- Keras models with a single input of fixed shape apart from the batch size,
+  e.g. as loaded by :func:`porter.loading.load_h5`.
+
+Input the fast path does not handle, e.g. sparse matrices, missing or infinite
+values, unknown categories that raise errors or columns in the wrong order, is
+passed on to the ``predict()`` or ``transform()`` method of the estimator, so
+that errors and output are the same as without compiling. Encoders and
+``ColumnTransformer`` produce sparse matrices where scikit-learn does, except
+within pipelines ending with a model. Predictions are computed with the same
+floating point operations as scikit-learn except that dense arrays replace the
+sparse outputs of encoders within those pipelines, which may change the
+rounding of the last digits.
+
+``model.predict()`` of Keras models sets up a data pipeline and callbacks on
+every call, which costs far more than evaluating a small model on a few
+instances. Compiled Keras models instead call a TensorFlow graph of the model
+traced once with an unknown batch size, so that batches of any size run
+without retracing. Batches larger than 1024 instances are split, as
+``model.predict()`` splits them, to bound the memory used by intermediate
+outputs.
+"""
+
+import functools
+import logging
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+_logger = logging.getLogger(__name__)
+
+
+class _Unsupported(Exception):
+    """Raised by compilers for estimators and by compiled functions for input
+    that the fast path does not handle."""
+
+
+def compile_model(model):
+    """Return a function computing ``model.predict(X)`` with NumPy.
+
+    Args:
+        model: A fitted scikit-learn estimator or a Keras model.
+
+    Returns:
+        A function of ``X`` returning the same predictions as
+        ``model.predict(X)``, or ``None`` if ``model`` is not supported.
+    """
+    if _is_keras_model(model):
+        return _compile_method(model, 'predict', lambda: _compile_keras_model(model),
+                               input_checker=_keras_input_checker)
+    return _compile_method(model, 'predict', lambda: _compile(model, _model_compilers()))
+
+
+def compile_transformer(transformer):
+    """Return a function computing ``transformer.transform(X)`` with NumPy.
+
+    Args:
+        transformer: A fitted scikit-learn transformer.
+
+    Returns:
+        A function of ``X`` returning the same output as
+        ``transformer.transform(X)``, or ``None`` if ``transformer`` is not
+        supported.
+    """
+    return _compile_method(transformer, 'transform',
+                           lambda: _compile_transformer(transformer, dense=False))
+
+
+def _compile_method(estimator, method, compile, input_checker=None):
+    try:
+        function = compile()
+        check_input = (input_checker or _input_checker)(estimator)
+    except (_Unsupported, AttributeError):
+        _logger.info(f'no fast path for {type(estimator).__name__}, using its .{method}()',
+                     extra={'event': 'compile'})
+        return None
+    fallback = getattr(estimator, method)
+
+    def compiled_function(X):
+        try:
+            return function(check_input(X))
+        except _Unsupported:
+            return fallback(X)
+    return compiled_function
+
+
+def _compile(estimator, compilers):
+    compiler = compilers.get(type(estimator))
+    if compiler is None:
+        raise _Unsupported(type(estimator).__name__)
+    return compiler(estimator)
+
+
+def _compile_transformer(transformer, dense):
+    """Compile ``transformer``. Its output is always dense if ``dense``, e.g.
+    when it is passed on to a model, and otherwise has the type of the output
+    of ``transformer.transform()``."""
+    output_config = getattr(transformer, '_sklearn_output_config', {})
+    if output_config.get('transform', _sklearn_config('transform_output')) != 'default':
+        # e.g. transformers returning DataFrames
+        raise _Unsupported('output container')
+    compiler = _transformer_compilers().get(type(transformer))
+    if compiler is None:
+        raise _Unsupported(type(transformer).__name__)
+    return compiler(transformer, dense)
+
+
+def _input_checker(estimator):
+    """Return a function returning the input of ``estimator`` as a DataFrame
+    or 2D array, or raising :class:`_Unsupported` if the input is left to
+    scikit-learn."""
+    n_features = estimator.n_features_in_
+    feature_names = getattr(estimator, 'feature_names_in_', None)
+    if feature_names is not None:
+        feature_names = list(feature_names)
+    first_step = estimator
+    while hasattr(first_step, 'steps'):
+        first_step = [step for _, step in first_step.steps if not _is_passthrough(step)][0]
+    # a ColumnTransformer fitted on a DataFrame selects the columns of
+    # DataFrames by name and ignores other columns
+    select_by_name = feature_names is not None and hasattr(first_step, 'transformers_')
+
+    def check_input(X):
+        if isinstance(X, pd.DataFrame):
+            if select_by_name:
+                if len(X) == 0:
+                    raise _Unsupported('shape')
+                return X
+            # scikit-learn only warns about missing feature names, but
+            # raises errors for columns that do not match the names seen in
+            # fit
+            if feature_names is not None and list(X.columns) != feature_names:
+                raise _Unsupported('feature names')
+        elif isinstance(X, (np.ndarray, list)):
+            X = np.asarray(X)
+            if X.ndim != 2:
+                raise _Unsupported('shape')
+        else:
+            # e.g. sparse matrices
+            raise _Unsupported(type(X).__name__)
+        if X.shape[0] == 0 or X.shape[1] != n_features:
+            raise _Unsupported('shape')
+        return X
+    return check_input
+
+
+def _is_passthrough(step):
+    return step is None or (isinstance(step, str) and step == 'passthrough')
+
+
+def _to_array(X):
+    """Return a DataFrame, selected columns or array as an array."""
+    if isinstance(X, (pd.DataFrame, _Columns)):
+        return X.to_numpy()
+    if not isinstance(X, np.ndarray):
+        # e.g. sparse output of a previous step
+        raise _Unsupported(type(X).__name__)
+    return X
+
+
+def _as_float64(X, copy=True):
+    """Return ``X`` as a float64 array as created by scikit-learn's input
+    validation."""
+    X = _to_array(X)
+    if X.dtype.kind not in 'biuf' or (X.dtype.kind == 'f' and X.dtype != np.float64):
+        # object arrays are left to scikit-learn as well as other float types,
+        # which some estimators preserve
+        raise _Unsupported(X.dtype)
+    # the memory layout is kept, since it determines the order in which
+    # matrix products are summed
+    return X.astype(np.float64, copy=copy)
+
+
+def _as_finite_float64(X):
+    X = _as_float64(X, copy=False)
+    if not np.isfinite(X).all():
+        raise _Unsupported('non-finite values')
+    return X
+
+
+# Linear models
+
+def _compile_linear_regressor(model):
+    coef, intercept = model.coef_, model.intercept_
+
+    def predict(X):
+        X = _as_finite_float64(X)
+        return X @ (coef.T if coef.ndim == 2 else coef) + intercept
+    return predict
+
+
+def _compile_linear_classifier(model):
+    coef, intercept, classes = model.coef_, model.intercept_, model.classes_
+
+    def predict(X):
+        X = _as_finite_float64(X)
+        scores = X @ coef.T + intercept
+        if scores.shape[1] == 1:
+            indices = (scores.reshape(-1) > 0).astype(np.intp)
+        else:
+            indices = scores.argmax(axis=1)
+        return classes.take(indices, axis=0)
+    return predict
+
+
+# Trees
+
+class _Trees:
+    """The nodes of several fitted trees concatenated into flat arrays, so that
+    all trees are evaluated at once."""
+    def __init__(self, estimators):
+        trees = [estimator.tree_ for estimator in estimators]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        self.roots = offsets[:-1]
+        self.feature = np.concatenate([tree.feature for tree in trees]).astype(np.intp)
+        self.threshold = np.concatenate([tree.threshold for tree in trees])
+        # children[node] is (right child, left child), leaves are their own
+        # children so that all samples can take the same number of steps
+        self.children = np.empty((offsets[-1], 2), dtype=np.intp)
+        for tree, offset in zip(trees, self.roots):
+            nodes = np.arange(offset, offset + tree.node_count)
+            is_leaf = tree.children_left == -1
+            self.children[nodes, 0] = np.where(is_leaf, nodes, tree.children_right + offset)
+            self.children[nodes, 1] = np.where(is_leaf, nodes, tree.children_left + offset)
+        self.feature[self.children[:, 0] == np.arange(offsets[-1])] = 0
+        self.depth = max(tree.max_depth for tree in trees)
+
+    def apply(self, X):
+        """Return the leaves of all trees reached by the samples ``X`` as an
+        array of shape (samples, trees)."""
+        X = _to_array(X)
+        if X.dtype.kind not in 'biuf':
+            raise _Unsupported(X.dtype)
+        # trees compare float32 features to float64 thresholds
+        X = X.astype(np.float32)
+        if not np.isfinite(X).all():
+            raise _Unsupported('non-finite values')
+        nodes = np.tile(self.roots, (len(X), 1))
+        rows = np.arange(len(X))[:, np.newaxis]
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = self.children[nodes, go_left.view(np.int8)]
+        return nodes
+
+
+def _check_single_output(estimator):
+    if estimator.n_outputs_ != 1:
+        raise _Unsupported('multiple outputs')
+
+
+def _tree_probabilities(estimator):
+    """Return the class probabilities of each node as returned by
+    ``predict_proba()`` of a fitted tree."""
+    probabilities = estimator.tree_.value[:, 0, :estimator.n_classes_]
+    if _sklearn_version() < (1, 4):
+        # older versions store weighted counts of samples
+        normalizer = probabilities.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        probabilities = probabilities / normalizer
+    return probabilities
+
+
+def _compile_tree_regressor(model):
+    _check_single_output(model)
+    trees = _Trees([model])
+    values = model.tree_.value[:, 0, 0]
+    return lambda X: values[trees.apply(X)[:, 0]]
+
+
+def _compile_tree_classifier(model):
+    _check_single_output(model)
+    trees = _Trees([model])
+    values, classes = model.tree_.value[:, 0], model.classes_
+    return lambda X: classes.take(values[trees.apply(X)[:, 0]].argmax(axis=1), axis=0)
+
+
+def _compile_forest_regressor(model):
+    _check_single_output(model)
+    trees = _Trees(model.estimators_)
+    values = np.concatenate([estimator.tree_.value[:, 0, 0] for estimator in model.estimators_])
+    n_trees = len(model.estimators_)
+
+    def predict(X):
+        # scikit-learn sums the predictions of the trees one after the other
+        return values[trees.apply(X)].cumsum(axis=1)[:, -1] / n_trees
+    return predict
+
+
+def _compile_forest_classifier(model):
+    _check_single_output(model)
+    trees = _Trees(model.estimators_)
+    probabilities = np.concatenate([_tree_probabilities(estimator)
+                                    for estimator in model.estimators_])
+    n_trees, classes = len(model.estimators_), model.classes_
+
+    def predict(X):
+        proba = probabilities[trees.apply(X)].cumsum(axis=1)[:, -1] / n_trees
+        return classes.take(proba.argmax(axis=1), axis=0)
+    return predict
+
+
+# Transformers
+
+def _compile_standard_scaler(transformer, dense):
+    mean = transformer.mean_ if transformer.with_mean else None
+    scale = transformer.scale_ if transformer.with_std else None
+
+    def transform(X):
+        X = _as_float64(X)
+        if mean is not None:
+            X -= mean
+        if scale is not None:
+            X /= scale
+        return X
+    return transform
+
+
+def _compile_min_max_scaler(transformer, dense):
+    scale, minimum = transformer.scale_, transformer.min_
+    clip = getattr(transformer, 'clip', False)
+    feature_range = transformer.feature_range
+
+    def transform(X):
+        X = _as_float64(X)
+        X *= scale
+        X += minimum
+        if clip:
+            np.clip(X, feature_range[0], feature_range[1], out=X)
+        return X
+    return transform
+
+
+def _compile_max_abs_scaler(transformer, dense):
+    scale = transformer.scale_
+    clip = getattr(transformer, 'clip', False)
+
+    def transform(X):
+        X = _as_float64(X)
+        X /= scale
+        if clip:
+            np.clip(X, -1.0, 1.0, out=X)
+        return X
+    return transform
+
+
+class _CategoryCodes:
+    """Lookup tables mapping the categories of each column of a fitted encoder
+    to their index."""
+    def __init__(self, encoder):
+        if getattr(encoder, '_infrequent_enabled', False):
+            raise _Unsupported('infrequent categories')
+        self.tables, self.missing_codes = [], []
+        for categories in encoder.categories_:
+            categories = categories.tolist()
+            # scikit-learn places missing values last
+            missing = categories[-1] if categories else None
+            has_missing = missing is not None and missing != missing
+            self.missing_codes.append(len(categories) - 1 if has_missing else -1)
+            self.tables.append({category: code for code, category in enumerate(categories)
+                                if not (has_missing and category is missing)})
+
+    def encode(self, X):
+        """Return the codes of the values of ``X``, -1 for unknown values."""
+        if X.shape[1] != len(self.tables):
+            raise _Unsupported('shape')
+        if isinstance(X, _Columns):
+            columns = [array.tolist() for array in X.arrays]
+        else:
+            X = _to_array(X)
+            if X.dtype.kind not in 'biufUO':
+                raise _Unsupported(X.dtype)
+            columns = X.T.tolist()
+        codes = np.empty(X.shape, dtype=np.intp)
+        try:
+            for index, (table, missing_code, column) in enumerate(
+                    zip(self.tables, self.missing_codes, columns)):
+                get = table.get
+                codes[:, index] = [get(value, missing_code if value != value else -1)
+                                   for value in column]
+        except TypeError:
+            # e.g. unhashable values or pandas.NA
+            raise _Unsupported('values')
+        return codes
+
+
+def _compile_one_hot_encoder(transformer, dense):
+    codes = _CategoryCodes(transformer)
+    drop = transformer.drop_idx_
+    if drop is None:
+        drop = [None] * len(transformer.categories_)
+    drop = np.array([-1 if index is None else index for index in drop], dtype=np.intp)
+    widths = np.array([len(categories) for categories in transformer.categories_]) - (drop >= 0)
+    offsets = np.cumsum(widths) - widths
+    n_columns = int(widths.sum())
+    # unknown categories of encoders dropping categories are encoded with a
+    # warning
+    ignore_unknown = (transformer.handle_unknown in ('ignore', 'infrequent_if_exist')
+                      and (drop < 0).all())
+    dtype = transformer.dtype
+    sparse_type = None if dense else _sparse_output_type(transformer)
+
+    def transform(X):
+        X_codes = codes.encode(X)
+        unknown = X_codes < 0
+        if not ignore_unknown and unknown.any():
+            raise _Unsupported('unknown categories')
+        encoded = ~unknown & (X_codes != drop)
+        # categories after the dropped category move one column to the left
+        X_codes -= (drop >= 0) & (X_codes > drop)
+        columns = (X_codes + offsets)[encoded]
+        if sparse_type is not None:
+            indptr = np.zeros(len(X_codes) + 1, dtype=np.int32)
+            np.cumsum(encoded.sum(axis=1), out=indptr[1:])
+            return sparse_type((np.ones(len(columns), dtype=dtype), columns.astype(np.int32),
+                                indptr), shape=(len(X_codes), n_columns))
+        output = np.zeros((len(X_codes), n_columns), dtype=dtype)
+        output[np.nonzero(encoded)[0], columns] = 1
+        return output
+    return transform
+
+
+def _sparse_output_type(encoder):
+    """Return the type of sparse matrices returned by ``encoder``, or
+    ``None`` if it returns dense arrays."""
+    if not encoder.sparse_output:
+        return None
+    # the type depends on the version and configuration of scikit-learn
+    X = pd.DataFrame([[categories[0] for categories in encoder.categories_]],
+                     columns=getattr(encoder, 'feature_names_in_', None), dtype=object)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return type(encoder.transform(X))
+
+
+def _compile_ordinal_encoder(transformer, dense):
+    codes = _CategoryCodes(transformer)
+    missing_code = np.array(codes.missing_codes)
+    handle_unknown = transformer.handle_unknown
+    unknown_value, encoded_missing_value = transformer.unknown_value, transformer.encoded_missing_value
+    dtype = transformer.dtype
+
+    def transform(X):
+        X_codes = codes.encode(X)
+        unknown = X_codes < 0
+        if unknown.any() and handle_unknown == 'error':
+            raise _Unsupported('unknown categories')
+        output = X_codes.astype(dtype)
+        output[(X_codes == missing_code) & (missing_code >= 0)] = encoded_missing_value
+        if unknown.any():
+            output[unknown] = unknown_value
+        return output
+    return transform
+
+
+def _compile_column_transformer(transformer, dense):
+    if transformer.transformer_weights:
+        raise _Unsupported('transformer weights')
+    sparse_output = transformer.sparse_output_ and not dense
+    feature_names = getattr(transformer, 'feature_names_in_', None)
+    parts = []
+    for name, step, columns in transformer.transformers_:
+        indices = transformer._transformer_to_input_indices[name]
+        if (isinstance(step, str) and step == 'drop') or len(indices) == 0:
+            continue
+        if np.isscalar(columns):
+            # the step is passed a single column as 1D array
+            raise _Unsupported('scalar column')
+        names = None if feature_names is None else feature_names[indices].tolist()
+        if isinstance(step, str) and step == 'passthrough' or _is_passthrough_function(step):
+            transform = _to_array
+        else:
+            transform = _compile_transformer(step, dense=not sparse_output)
+        parts.append((names, indices, transform))
+    if not parts:
+        raise _Unsupported('no columns')
+    if sparse_output:
+        from scipy import sparse
+
+    def transform(X):
+        outputs = [transform(_select_columns(X, names, indices))
+                   for names, indices, transform in parts]
+        if sparse_output:
+            for output in outputs:
+                if not sparse.issparse(output) and output.dtype.kind not in 'biuf':
+                    raise _Unsupported(output.dtype)
+            return sparse.hstack(outputs).tocsr()
+        return np.hstack(outputs)
+    return transform
+
+
+def _is_passthrough_function(step):
+    """Return whether ``step`` is the transformer that a fitted
+    ColumnTransformer substitutes for "passthrough"."""
+    return (type(step).__name__ == 'FunctionTransformer' and step.func is None
+            and not step.validate)
+
+
+class _Columns:
+    """Columns of a DataFrame selected by name. The columns are kept as
+    separate arrays, since creating a DataFrame of them takes longer than
+    transforming small inputs."""
+    def __init__(self, frame, names):
+        if not frame.columns.is_unique:
+            raise _Unsupported('duplicate columns')
+        try:
+            self.arrays = [frame[name].to_numpy() for name in names]
+        except KeyError:
+            raise _Unsupported('missing columns')
+        self.frame, self.names = frame, names
+        self.shape = (len(frame), len(names))
+
+    def to_numpy(self):
+        dtypes = {array.dtype for array in self.arrays}
+        if len(dtypes) == 1 and next(iter(dtypes)).kind in 'biuf':
+            return np.column_stack(self.arrays)
+        # pandas determines the type of the array of other columns
+        return self.frame[self.names].to_numpy()
+
+
+def _select_columns(X, names, indices):
+    if isinstance(X, pd.DataFrame):
+        if names is None:
+            return X.iloc[:, indices]
+        return _Columns(X, names)
+    if names is not None:
+        # columns were selected by name when fitting
+        raise _Unsupported('columns selected by name')
+    return X[:, indices]
+
+
+def _compile_transformer_pipeline(pipeline, dense):
+    steps = [step for _, step in pipeline.steps if not _is_passthrough(step)]
+    if not steps:
+        raise _Unsupported('pipeline without transformers')
+    transforms = [_compile_transformer(step, dense) for step in steps]
+
+    def transform(X):
+        for step_transform in transforms:
+            X = step_transform(X)
+        return X
+    return transform
+
+
+def _compile_pipeline(pipeline):
+    steps = [step for _, step in pipeline.steps if not _is_passthrough(step)]
+    if not steps or pipeline.steps[-1][1] is not steps[-1]:
+        raise _Unsupported('pipeline without final estimator')
+    transforms = [_compile_transformer(step, dense=True) for step in steps[:-1]]
+    predict = _compile(steps[-1], _model_compilers())
+
+    def compiled_predict(X):
+        for transform in transforms:
+            X = transform(X)
+        return predict(X)
+    return compiled_predict
+
+
+# Keras models
+
+
+# inputs with more instances are predicted in batches of this size
+_KERAS_MAX_BATCH_SIZE = 1024
+
+
+def _is_keras_model(model):
+    # tensorflow has been imported if model is a Keras model, and is not
+    # imported for other models
+    tf = sys.modules.get('tensorflow')
+    return tf is not None and isinstance(model, tf.keras.Model)
+
+
+def _keras_input_spec(model):
+    """Return the shape without the batch size and the dtype of the input of
+    ``model``."""
+    import tensorflow as tf
+    # subclassed models do not know their inputs before they are called
+    inputs = getattr(model, 'inputs', None)
+    if not inputs or len(inputs) != 1:
+        raise _Unsupported('inputs')
+    shape = tuple(inputs[0].shape)
+    if len(shape) < 2 or shape[0] is not None or None in shape[1:]:
+        raise _Unsupported('input shape')
+    return shape[1:], tf.as_dtype(inputs[0].dtype)
+
+
+def _compile_keras_model(model):
+    import tensorflow as tf
+    shape, dtype = _keras_input_spec(model)
+    # a single graph for all batch sizes, traced once
+    call = tf.function(lambda X: model(X, training=False),
+                       input_signature=[tf.TensorSpec((None,) + shape, dtype)])
+    call = call.get_concrete_function()
+
+    def compiled_predict(X):
+        outputs = [call(X[start:start + _KERAS_MAX_BATCH_SIZE])
+                   for start in range(0, len(X), _KERAS_MAX_BATCH_SIZE)]
+        return tf.nest.map_structure(
+            lambda *batches: np.concatenate([batch.numpy() for batch in batches]), *outputs)
+    return compiled_predict
+
+
+def _keras_input_checker(model):
+    shape, dtype = _keras_input_spec(model)
+    dtype = dtype.as_numpy_dtype
+
+    def check_input(X):
+        if isinstance(X, pd.DataFrame):
+            X = X.to_numpy()
+        elif isinstance(X, (np.ndarray, list)):
+            X = np.asarray(X)
+        else:
+            raise _Unsupported(type(X).__name__)
+        if X.dtype.kind not in 'biuf' or X.shape[1:] != shape or X.shape[0] == 0:
+            raise _Unsupported('input')
+        return X.astype(dtype, copy=False)
+    return check_input
+
+
+@functools.lru_cache(maxsize=None)
+def _sklearn_version():
+    import sklearn
+    return tuple(int(part) for part in sklearn.__version__.split('.')[:2])
+
+
+def _sklearn_config(name):
+    import sklearn
+    return sklearn.get_config().get(name, 'default')
+
+
+@functools.lru_cache(maxsize=None)
+def _model_compilers():
+    # scikit-learn is not a dependency of porter
+    try:
+        from sklearn import ensemble, linear_model, pipeline, svm, tree
+    except ImportError:
+        return {}
+    compilers = {
+        tree.DecisionTreeRegressor: _compile_tree_regressor,
+        tree.DecisionTreeClassifier: _compile_tree_classifier,
+        ensemble.RandomForestRegressor: _compile_forest_regressor,
+        ensemble.ExtraTreesRegressor: _compile_forest_regressor,
+        ensemble.RandomForestClassifier: _compile_forest_classifier,
+        ensemble.ExtraTreesClassifier: _compile_forest_classifier,
+        pipeline.Pipeline: _compile_pipeline,
+    }
+    for model in (linear_model.LinearRegression, linear_model.Ridge, linear_model.Lasso,
+                  linear_model.ElasticNet, linear_model.SGDRegressor):
+        compilers[model] = _compile_linear_regressor
+    for model in (linear_model.LogisticRegression, linear_model.SGDClassifier,
+                  linear_model.Perceptron, svm.LinearSVC):
+        compilers[model] = _compile_linear_classifier
+    return compilers
+
+
+@functools.lru_cache(maxsize=None)
+def _transformer_compilers():
+    try:
+        from sklearn import compose, pipeline, preprocessing
+    except ImportError:
+        return {}
+    return {
+        preprocessing.StandardScaler: _compile_standard_scaler,
+        preprocessing.MinMaxScaler: _compile_min_max_scaler,
+        preprocessing.MaxAbsScaler: _compile_max_abs_scaler,
+        preprocessing.OneHotEncoder: _compile_one_hot_encoder,
+        preprocessing.OrdinalEncoder: _compile_ordinal_encoder,
+        compose.ColumnTransformer: _compile_column_transformer,
+        pipeline.Pipeline: _compile_transformer_pipeline,
+    }
@@ -19,3 +19,41 @@ return_request_id = True
 
 # Support response compression
 support_response_gzip = False
+
+# Per-stage latency instrumentation. If True, the duration of each stage of
+# serving a request is recorded and returned in a ``Server-Timing`` header.
+record_stage_timings = False
+# Optional callable with signature ``hook(service, timings)`` called after each
+# request when ``record_stage_timings`` is True. ``timings`` is a ``dict``
+# mapping stage names to durations in seconds.
+stage_timings_hook = None
+
+# Directory shared by all worker processes of a server in which metrics are
+# stored when ``ModelApp(expose_metrics=True)``. If None, metrics are kept in
+# the memory of each process. See porter.metrics for details.
+metrics_multiprocess_dir = None
+
+# Directory in which objects loaded from S3 are cached on local disk. If None,
+# objects are downloaded every time they are loaded. See porter.artifact_cache.
+artifact_cache_dir = None
+# Optional maximum size in bytes of artifact_cache_dir. Least recently used
+# objects are evicted when it is exceeded.
+artifact_cache_max_bytes = None
+
+# Directory in which the code of schema validators is cached. If None, the
+# code is generated when a schema is first used to validate data in each
+# process. See porter.schemas.openapi.ApiObject.compile.
+schema_cache_dir = None
+
+# Objects on S3 larger than s3_multipart_chunksize bytes are downloaded in
+# parts of that size on up to s3_max_concurrency threads.
+s3_multipart_chunksize = 8 * 1024 * 1024
+s3_max_concurrency = 10
+
+# Number of threads TensorFlow uses within a single operation, e.g. a matrix
+# product, and to run independent operations in parallel. If None, TensorFlow
+# uses one thread per CPU core, which oversubscribes the CPU when several
+# worker processes serve requests. They are applied when porter first loads a
+# TensorFlow model, and cannot be changed once TensorFlow has run operations.
+tensorflow_intra_op_threads = None
+tensorflow_inter_op_threads = None
@@ -13,6 +13,7 @@ _PREDICTIONS = 'predictions'
 
 LIVENESS_ENDPOINT = '/-/alive'
 READINESS_ENDPOINT = '/-/ready'
+METRICS_ENDPOINT = '/-/metrics'
 ENDPOINT_TEMPLATE = '{namespace}/{service_name}/{api_version}/{action}'
 
 
@@ -29,6 +30,8 @@ class HEALTH_CHECK_KEYS(BASE_KEYS):
 
 class HEALTH_CHECK_VALUES:
     IS_READY = 'READY'
+    IS_WARMING = 'WARMING'
+    IS_LOADING = 'LOADING'
     DEPLOYED_ON = datetime.datetime.now().isoformat()
 
 
@@ -62,8 +65,15 @@ class MODEL_CONTEXT_KEYS:
 class PREDICTION_KEYS(BASE_KEYS):
     MODEL_CONTEXT = _MODEL_CONTEXT
     PREDICTIONS = _PREDICTIONS 
+    ERRORS = 'errors'
 
 
 class PREDICTION_PREDICTIONS_KEYS:
     ID = 'id'
     PREDICTION = 'prediction'
+
+
+class PREDICTION_ERRORS_KEYS:
+    INDEX = 'index'
+    ID = 'id'
+    MESSAGES = 'messages'
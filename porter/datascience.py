@@ -1,11 +1,19 @@
 """Definitions of interfaces for data science objects expected by :mod:`porter.services`."""
 
 import abc
+import os
+import threading
 
-from porter.loading import load_file
+from porter.loading import load_file, load_files
+from porter import compiling
 from porter import utils
 
 
+# values of the ``lazy`` argument of ``from_file()``
+LAZY_BACKGROUND = 'background'
+LAZY_REQUEST = 'request'
+
+
 class BaseModel(abc.ABC):
     """Class defining the model interface required by
     :meth:`porter.services.ModelApp.add_service`."""
@@ -51,50 +59,295 @@ class BasePostProcessor(abc.ABC):
         """
 
 
-class WrappedModel(BaseModel):
+class _DeferredLoad:
+    """Placeholder for an object that is loaded by calling ``loader``."""
+    def __init__(self, loader, mode):
+        if mode not in (LAZY_BACKGROUND, LAZY_REQUEST):
+            raise ValueError(f'lazy must be False, "{LAZY_BACKGROUND}" or "{LAZY_REQUEST}"')
+        self.loader = loader
+        self.mode = mode
+
+
+class _LazyLoadMixin:
+    """Support for wrapping an object whose loading is deferred.
+
+    Subclasses store the wrapped object with :meth:`_init_wrapped` and access
+    it with :meth:`_get_wrapped`.
+    """
+    _deferred = None
+    # options of from_file() or from_files() the object was loaded with
+    _file_options = {}
+
+    def _init_wrapped(self, obj):
+        if isinstance(obj, _DeferredLoad):
+            self._deferred = obj
+            self._load_lock = threading.Lock()
+            self._load_lock_pid = os.getpid()
+        else:
+            self._check_wrapped(obj)
+            self._set_wrapped(obj)
+
+    def _get_wrapped(self):
+        if self._deferred is not None:
+            self.load()
+        return self._wrapped
+
+    def _set_wrapped(self, obj):
+        self._wrapped = obj
+        self._deferred = None
+
+    @property
+    def loaded(self):
+        """``True`` if the wrapped object has been loaded."""
+        return self._deferred is None
+
+    @property
+    def loading(self):
+        """``True`` if the wrapped object is waiting to be loaded in the
+        background, i.e. it was created with ``lazy="background"`` and has not
+        been loaded yet."""
+        deferred = self._deferred
+        return deferred is not None and deferred.mode == LAZY_BACKGROUND
+
+    def _reload_options(self):
+        """Return the keyword arguments of ``from_file()`` wrapping a new
+        version of the file of this object in the same way."""
+        return {**self._file_options, 'compile': self._compile}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # locks cannot be pickled, load() creates a new one if needed
+        state.pop('_load_lock', None)
+        state.pop('_load_lock_pid', None)
+        return state
+
+    def __setstate__(self, state):
+        # wrappers pickled by earlier versions of porter hold the wrapped
+        # object as an attribute named after it
+        for name in ('model', 'transformer'):
+            if name in state:
+                state['_wrapped'] = state.pop(name)
+        self.__dict__.update(state)
+
+    def load(self):
+        """Load the wrapped object if its loading was deferred. Safe to call
+        from multiple threads; the object is only loaded once."""
+        if self._deferred is None:
+            return
+        # a lock inherited from a parent process may have been held by a
+        # thread that does not exist in this process.
+        if getattr(self, '_load_lock_pid', None) != os.getpid():
+            self._load_lock = threading.Lock()
+            self._load_lock_pid = os.getpid()
+        with self._load_lock:
+            if self._deferred is None:
+                return
+            obj = self._deferred.loader()
+            self._check_wrapped(obj)
+            self._set_wrapped(obj)
+
+
+def _load_file(path, lazy, s3_access_key_id, s3_secret_access_key, mmap_mode, shared):
+    def load():
+        return load_file(path, s3_access_key_id, s3_secret_access_key, mmap_mode=mmap_mode,
+                         shared=shared)
+    if not lazy:
+        return load()
+    return _DeferredLoad(load, lazy)
+
+
+class WrappedModel(_LazyLoadMixin, BaseModel):
     """A convenience class that exposes a model persisted to disk with the
     :class:`BaseModel` interface.
 
     Args:
         model: An object with a scikit-learn-compatible ``.predict()`` method.
+        compile (bool): If ``True``, predictions of supported scikit-learn
+            estimators and Keras models are computed by a fast path built with
+            :func:`porter.compiling.compile_model` when the model is loaded.
+            Other models are used as they are. The compiled trees of tree
+            ensembles are copies that are not shared with ``mmap_mode``.
+            Default is ``False``.
     """
-    def __init__(self, model):
+    def __init__(self, model, compile=False):
+        self._compile = compile
+        self._compiled_predict = None
+        self._init_wrapped(model)
+        super(WrappedModel, self).__init__()
+
+    @staticmethod
+    def _check_wrapped(model):
         if not hasattr(model, 'predict') or not callable(model.predict):
             raise TypeError('model must have a .predict() method:\n{}'
                             .format(model))
-        self.model = model
-        super(WrappedModel, self).__init__()
+
+    @property
+    def model(self):
+        """The wrapped model. Loaded on first access if loading was deferred."""
+        return self._get_wrapped()
+
+    @model.setter
+    def model(self, model):
+        self._set_wrapped(model)
+
+    def _set_wrapped(self, model):
+        self._compiled_predict = compiling.compile_model(model) if self._compile else None
+        super(WrappedModel, self)._set_wrapped(model)
+
+    def __getstate__(self):
+        state = super(WrappedModel, self).__getstate__()
+        # the compiled function is a closure, which cannot be pickled
+        state.pop('_compiled_predict', None)
+        return state
+
+    def __setstate__(self, state):
+        super(WrappedModel, self).__setstate__(state)
+        # earlier versions of porter did not compile models
+        self._compile = state.get('_compile', False)
+        self._compiled_predict = (compiling.compile_model(self._wrapped)
+                                  if self._compile and self.loaded else None)
 
     def predict(self, X):
-        return self.model.predict(X)
+        model = self.model
+        if self._compiled_predict is not None:
+            return self._compiled_predict(X)
+        return model.predict(X)
+
+    @classmethod
+    def from_file(cls, path, *args, lazy=False, s3_access_key_id=None,
+                  s3_secret_access_key=None, mmap_mode=None, shared=False, **kwargs):
+        """Load a model with :func:`porter.loading.load_file` and wrap it.
+
+        Args:
+            path (str): Path of the model file. The file is loaded by the
+                loader registered for its type, see
+                :func:`porter.loading.register_loader`.
+            lazy (bool or str): If ``False`` the model is loaded immediately.
+                If "background", loading is deferred until the service the
+                model belongs to is loaded by :class:`porter.services.ModelApp`
+                in a background thread after startup. If "request", loading
+                is deferred until the model is first used. Default is ``False``.
+            s3_access_key_id (str or None): Credentials used for paths on S3.
+            s3_secret_access_key (str or None): Credentials used for paths on S3.
+            mmap_mode (str or None): If "r", NumPy arrays in ``.pkl`` and
+                ``.joblib`` files are memory-mapped read-only and shared by
+                all processes loading the same file. See
+                :func:`porter.loading.load_pkl`.
+            shared (bool): If ``True``, models loaded from files with the
+                same content share a single instance, e.g. when the same
+                model is served under several names or API versions. Only the
+                model is shared, each instance of this class wraps it
+                separately. See :func:`porter.loading.load_file`. Default is
+                ``False``.
+            *args: Positional arguments passed on to the constructor.
+            **kwargs: Keyword arguments passed on to the constructor.
+        """
+        model = _load_file(path, lazy, s3_access_key_id, s3_secret_access_key, mmap_mode,
+                           shared)
+        wrapped = cls(model, *args, **kwargs)
+        wrapped._file_options = {'lazy': lazy, 'mmap_mode': mmap_mode, 'shared': shared}
+        return wrapped
 
     @classmethod
-    def from_file(cls, path, *args, s3_access_key_id=None,
-                  s3_secret_access_key=None, **kwargs):
-        model = load_file(path, s3_access_key_id, s3_secret_access_key)
-        return cls(model, *args, **kwargs)
+    def from_files(cls, paths, *args, max_workers=None, progress=None,
+                   s3_access_key_id=None, s3_secret_access_key=None,
+                   mmap_mode=None, shared=False, **kwargs):
+        """Load several models concurrently with
+        :func:`porter.loading.load_files` and return a list of instances in the
+        order of ``paths``."""
+        models = load_files(paths, max_workers=max_workers, progress=progress,
+                            s3_access_key_id=s3_access_key_id,
+                            s3_secret_access_key=s3_secret_access_key,
+                            mmap_mode=mmap_mode, shared=shared)
+        wrapped = [cls(model, *args, **kwargs) for model in models]
+        for model in wrapped:
+            model._file_options = {'mmap_mode': mmap_mode, 'shared': shared}
+        return wrapped
 
 
-class WrappedTransformer(BasePreProcessor):
+class WrappedTransformer(_LazyLoadMixin, BasePreProcessor):
     """A convenience class that exposes a transformer persisted to disk with
     the :class:`BasePreProcessor` interface.
 
     Args:
         transformer: An object with a scikit-learn-compatible ``.transform()``
             method.
+        compile (bool): If ``True``, supported scikit-learn transformers are
+            applied by a fast path built with
+            :func:`porter.compiling.compile_transformer` when the transformer
+            is loaded. Other transformers are used as they are. Default is
+            ``False``.
     """
-    def __init__(self, transformer):
+    def __init__(self, transformer, compile=False):
+        self._compile = compile
+        self._compiled_transform = None
+        self._init_wrapped(transformer)
+        super(WrappedTransformer, self).__init__()
+
+    @staticmethod
+    def _check_wrapped(transformer):
         if not hasattr(transformer, 'transform') or not callable(transformer.transform):
             raise TypeError('transformer must have a .transform() method:\n{}'
                             .format(transformer))
-        self.transformer = transformer
-        super(WrappedTransformer, self).__init__()
+
+    @property
+    def transformer(self):
+        """The wrapped transformer. Loaded on first access if loading was
+        deferred."""
+        return self._get_wrapped()
+
+    @transformer.setter
+    def transformer(self, transformer):
+        self._set_wrapped(transformer)
+
+    def _set_wrapped(self, transformer):
+        self._compiled_transform = (compiling.compile_transformer(transformer)
+                                    if self._compile else None)
+        super(WrappedTransformer, self)._set_wrapped(transformer)
+
+    def __getstate__(self):
+        state = super(WrappedTransformer, self).__getstate__()
+        # the compiled function is a closure, which cannot be pickled
+        state.pop('_compiled_transform', None)
+        return state
+
+    def __setstate__(self, state):
+        super(WrappedTransformer, self).__setstate__(state)
+        # earlier versions of porter did not compile transformers
+        self._compile = state.get('_compile', False)
+        self._compiled_transform = (compiling.compile_transformer(self._wrapped)
+                                    if self._compile and self.loaded else None)
 
     def process(self, X):
-        return self.transformer.transform(X)
+        transformer = self.transformer
+        if self._compiled_transform is not None:
+            return self._compiled_transform(X)
+        return transformer.transform(X)
+
+    @classmethod
+    def from_file(cls, path, *args, lazy=False, s3_access_key_id=None,
+                  s3_secret_access_key=None, mmap_mode=None, shared=False, **kwargs):
+        """Load a transformer with :func:`porter.loading.load_file` and wrap
+        it. See :meth:`WrappedModel.from_file` for a description of the
+        arguments."""
+        transformer = _load_file(path, lazy, s3_access_key_id, s3_secret_access_key,
+                                 mmap_mode, shared)
+        wrapped = cls(transformer, *args, **kwargs)
+        wrapped._file_options = {'lazy': lazy, 'mmap_mode': mmap_mode, 'shared': shared}
+        return wrapped
 
     @classmethod
-    def from_file(cls, path, *args, s3_access_key_id=None,
-                  s3_secret_access_key=None, **kwargs):
-        transformer = load_file(path, s3_access_key_id, s3_secret_access_key)
-        return cls(transformer, *args, **kwargs)
+    def from_files(cls, paths, *args, max_workers=None, progress=None,
+                   s3_access_key_id=None, s3_secret_access_key=None,
+                   mmap_mode=None, shared=False, **kwargs):
+        """Load several transformers concurrently with
+        :func:`porter.loading.load_files` and return a list of instances in the
+        order of ``paths``."""
+        transformers = load_files(paths, max_workers=max_workers, progress=progress,
+                                  s3_access_key_id=s3_access_key_id,
+                                  s3_secret_access_key=s3_secret_access_key,
+                                  mmap_mode=mmap_mode, shared=shared)
+        wrapped = [cls(transformer, *args, **kwargs) for transformer in transformers]
+        for transformer in wrapped:
+            transformer._file_options = {'mmap_mode': mmap_mode, 'shared': shared}
+        return wrapped
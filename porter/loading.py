@@ -1,79 +1,588 @@
 """Loading utilities."""
 
 
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
 import io
+import logging
 import os
+import shutil
 import tempfile
+import threading
+import time
+import weakref
+import zipfile
 
 import joblib
+import numpy as np
 
+from . import artifact_cache
+from . import config as cf
 
-def load_file(path, s3_access_key_id=None, s3_secret_access_key=None):
+
+_logger = logging.getLogger(__name__)
+
+
+LoadTiming = collections.namedtuple('LoadTiming', ['path', 'fetch_seconds', 'load_seconds'])
+LoadTiming.__doc__ = """Time spent loading a file by :func:`load_files`.
+
+``fetch_seconds`` is the time spent retrieving the file, e.g. downloading it
+from S3, and ``load_seconds`` the time spent deserializing it."""
+
+
+def load_file(path, s3_access_key_id=None, s3_secret_access_key=None, *,
+              mmap_mode=None, shared=False):
     """Load a file and return the result.
 
+    Args:
+        path (str): Local path or S3 URI ("s3://<bucket>/<key>") of a file
+            of a type registered with :func:`register_loader`. Built-in
+            loaders support ``.pkl`` and ``.joblib`` files (:func:`load_pkl`),
+            ``.h5`` files (:func:`load_h5`), zipped TensorFlow SavedModels
+            (:func:`load_saved_model`), ``.onnx`` files
+            (:func:`load_onnx`), native ``xgboost`` models saved as ``.ubj``,
+            ``.bst`` or ``.xgb`` files (:func:`load_xgboost`) and native
+            ``lightgbm`` models (:func:`load_lightgbm`), which are identified
+            by their content.
+        s3_access_key_id (str or None): Credentials used for paths on S3.
+        s3_secret_access_key (str or None): Credentials used for paths on S3.
+        mmap_mode (str or None): Passed on to :func:`load_pkl` for ``.pkl``
+            and ``.joblib`` files.
+        shared (bool): If ``True``, return the object already loaded from a
+            file with the same content and the same loader options, if any,
+            rather than loading a separate copy. Shared objects are only
+            referenced weakly and are freed once no longer used elsewhere.
+            Objects that do not support weak references, e.g. dicts, are
+            never shared. Default is ``False``.
+
     Raises:
-        ValueError: If ``path`` specifies an unknown file type or specifies an
-            s3 resource but credentials are not provided.
+        ValueError: If no loader is registered for the type of the file or
+            ``path`` specifies an s3 resource but credentials are not provided.
     """
-    extension = os.path.splitext(path)[-1]
-    if path.startswith('s3://'):
-        if s3_access_key_id is None or s3_secret_access_key is None:
-            raise ValueError(
-                's3_access_key_id and s3_secret_access_key cannot be None '
-                'when loading a resource from S3.')
-        path_or_stream = load_s3(path, s3_access_key_id, s3_secret_access_key)
-    else:
-        path_or_stream = path
-    if extension == '.pkl':
-        obj = load_pkl(path_or_stream)
-    elif extension == '.h5':
-        # keras does not support loading a model from stream like joblib does.
-        # as a workaround write the stream to a temporary file and load from
-        # there.
-        # See,
-        # https://github.com/keras-team/keras/issues/9343
-        if hasattr(path_or_stream, 'read'):
-            with tempfile.NamedTemporaryFile() as tmp:
-                with open(tmp.name, 'wb') as f:
-                    # get buffer avoids copying the entire file contents
-                    # like path_or_stream.read() would.
-                    # https://docs.python.org/3/library/io.html#io.BytesIO.getbuffer
-                    f.write(path_or_stream.getbuffer())
-                obj = load_h5(tmp.name)
-        else:
-            obj = load_h5(path_or_stream)
-    else:
-        raise ValueError('unkown file type')
-    return obj
-
-def load_pkl(path):
-    """Load and return a pickled object with ``joblib``."""
-    model = joblib.load(path)
+    with _fetch(path, s3_access_key_id, s3_secret_access_key, _in_memory(path)) as local_path:
+        return _deserialize(path, local_path, mmap_mode, shared)
+
+
+def load_files(paths, *, max_workers=None, progress=None, s3_access_key_id=None,
+               s3_secret_access_key=None, mmap_mode=None, shared=False):
+    """Load several files concurrently and return the results in the order of
+    ``paths``.
+
+    Each file is fetched (e.g. downloaded from S3) and deserialized on a pool
+    of threads, so that the downloads of some files overlap with the
+    deserialization of others. The time spent fetching and deserializing each
+    file is logged.
+
+    Args:
+        paths (list of str): Paths of the files to load. See :func:`load_file`.
+        max_workers (int or None): Maximum number of files loaded at once.
+            Defaults to the default of :class:`concurrent.futures.ThreadPoolExecutor`.
+        progress (callable or None): Called from the loading thread after each
+            file has been loaded as ``progress(n_loaded, n_total, timing)``,
+            where ``timing`` is a :class:`LoadTiming`. Optional.
+        s3_access_key_id (str or None): Credentials used for paths on S3.
+        s3_secret_access_key (str or None): Credentials used for paths on S3.
+        mmap_mode (str or None): Passed on to :func:`load_pkl` for ``.pkl``
+            and ``.joblib`` files.
+        shared (bool): Whether identical files share a single object. See
+            :func:`load_file`.
+
+    Raises:
+        ValueError: Under the same conditions as :func:`load_file`. If any file
+            fails to load, files that have not started loading are skipped
+            and the first exception is raised.
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    start = time.perf_counter()
+    lock = threading.Lock()
+    n_loaded = 0
+
+    def load(path):
+        nonlocal n_loaded
+        fetch_start = time.perf_counter()
+        with _fetch(path, s3_access_key_id, s3_secret_access_key,
+                    _in_memory(path)) as local_path:
+            load_start = time.perf_counter()
+            obj = _deserialize(path, local_path, mmap_mode, shared)
+            load_end = time.perf_counter()
+        timing = LoadTiming(path, load_start - fetch_start, load_end - load_start)
+        _logger.info(
+            f'loaded {path} in {timing.fetch_seconds + timing.load_seconds:.3f}s '
+            f'(fetch {timing.fetch_seconds:.3f}s, load {timing.load_seconds:.3f}s)')
+        if progress is not None:
+            with lock:
+                n_loaded += 1
+                progress(n_loaded, len(paths), timing)
+        return obj
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(load, path) for path in paths]
+        try:
+            objs = [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    _logger.info(f'loaded {len(paths)} files in {time.perf_counter() - start:.3f}s')
+    return objs
+
+
+@contextlib.contextmanager
+def _fetch(path, s3_access_key_id, s3_secret_access_key, in_memory=False):
+    """Context manager yielding the path of a local copy of ``path``.
+
+    Objects on S3 are downloaded to a temporary file that is removed on exit,
+    unless ``porter.config.artifact_cache_dir`` is set. If ``in_memory`` is
+    true and the cache is not enabled, objects on S3 are instead downloaded
+    into memory and a binary file object is yielded.
+    """
+    if not path.startswith('s3://'):
+        yield path
+        return
+    if s3_access_key_id is None or s3_secret_access_key is None:
+        raise ValueError(
+            's3_access_key_id and s3_secret_access_key cannot be None '
+            'when loading a resource from S3.')
+    if cf.artifact_cache_dir is not None:
+        s3_client = _get_s3_client(s3_access_key_id, s3_secret_access_key)
+        cache = artifact_cache.ArtifactCache(cf.artifact_cache_dir, cf.artifact_cache_max_bytes)
+        bucket, key = split_s3_path(path)
+        with cache.get(s3_client, bucket, key,
+                       transfer_config=_s3_transfer_config()) as local_path:
+            yield local_path
+        return
+    if in_memory:
+        yield load_s3(path, s3_access_key_id, s3_secret_access_key)
+        return
+    with tempfile.TemporaryDirectory(prefix='porter-') as tmpdir:
+        # keep the file name, some loaders depend on the extension
+        filename = os.path.join(tmpdir, os.path.basename(path))
+        download_s3(path, filename, s3_access_key_id, s3_secret_access_key)
+        yield filename
+
+
+def _deserialize(path, local_path, mmap_mode=None, shared=False):
+    loader = _find_loader(path, local_path)
+    options = {'mmap_mode': mmap_mode} if loader.accepts_mmap_mode else {}
+    if not shared:
+        return loader.load(local_path, **options)
+    key = (_content_digest(local_path), loader.load, tuple(sorted(options.items())))
+    # loading is serialized per key so that concurrent loads of the same
+    # content load it once.
+    with _shared_objects_lock:
+        key_lock = _shared_key_locks.setdefault(key, threading.Lock())
+    try:
+        with key_lock:
+            obj = _shared_objects.get(key)
+            if obj is not None:
+                _logger.info(f'reusing the object loaded from a file identical to {path}')
+                return obj
+            obj = loader.load(local_path, **options)
+            try:
+                _shared_objects[key] = obj
+            except TypeError:
+                # the object does not support weak references
+                pass
+            return obj
+    finally:
+        with _shared_objects_lock:
+            _shared_key_locks.pop(key, None)
+
+
+# objects loaded with shared=True keyed by the content of the file and the
+# loader options. Objects are removed when they are garbage collected.
+_shared_objects = weakref.WeakValueDictionary()
+_shared_objects_lock = threading.Lock()
+_shared_key_locks = {}
+
+
+def _content_digest(local_path):
+    """Return the sha256 digest of a local file or a binary file object."""
+    if not isinstance(local_path, (str, os.PathLike)):
+        return hashlib.sha256(local_path.getbuffer()).hexdigest()
+    return artifact_cache._file_digests(local_path, 'sha256')[0]
+
+
+_Loader = collections.namedtuple(
+    '_Loader', ['load', 'extensions', 'sniff', 'accepts_mmap_mode', 'accepts_stream'])
+
+# registered loaders, most recently registered first
+_loaders = []
+
+# number of bytes at the start of a file passed to the ``sniff`` functions
+_HEADER_SIZE = 64
+
+
+def register_loader(load, *, extensions=(), sniff=None, accepts_mmap_mode=False,
+                    accepts_stream=False):
+    """Register a function used by :func:`load_file` and :func:`load_files`
+    to load a type of file.
+
+    The loader of a file is chosen by the extension of its path. Files with
+    an extension for which no loader is registered are identified by their
+    first bytes using the ``sniff`` functions of the loaders. Loaders
+    registered later take precedence over loaders registered earlier, so that
+    the built-in loaders can be replaced.
+
+    Args:
+        load (callable): Called with the path of a local file and returns the
+            loaded object.
+        extensions (list of str): Extensions loaded by ``load``, e.g.
+            ``['.pkl']``. Extensions are matched case-insensitively.
+        sniff (callable or None): Called with the first bytes of a file and
+            returns ``True`` if ``load`` can load the file. Optional.
+        accepts_mmap_mode (bool): Whether ``mmap_mode`` is passed on to
+            ``load`` as a keyword argument. Default is ``False``.
+        accepts_stream (bool): Whether ``load`` can also be called with a
+            binary file object. If ``True``, files on S3 whose extension is
+            registered for ``load`` are downloaded into memory and passed on
+            as a file object rather than written to a temporary file. Default
+            is ``False``.
+
+    Raises:
+        ValueError: If neither ``extensions`` nor ``sniff`` is given.
+    """
+    extensions = tuple(extension.lower() for extension in extensions)
+    if not extensions and sniff is None:
+        raise ValueError('at least one of `extensions` and `sniff` is required')
+    if not all(extension.startswith('.') for extension in extensions):
+        raise ValueError('extensions must start with "."')
+    _loaders.insert(0, _Loader(load, extensions, sniff, accepts_mmap_mode, accepts_stream))
+
+
+def _extension_loader(path):
+    extension = os.path.splitext(path)[-1].lower()
+    for loader in _loaders:
+        if extension in loader.extensions:
+            return loader
+    return None
+
+
+def _in_memory(path):
+    """Return whether ``path`` should be loaded from memory rather than from a
+    local file if it is downloaded."""
+    loader = _extension_loader(path)
+    return loader is not None and loader.accepts_stream
+
+
+def _find_loader(path, local_path):
+    loader = _extension_loader(path)
+    if loader is not None:
+        return loader
+    with open(local_path, 'rb') as f:
+        header = f.read(_HEADER_SIZE)
+    for loader in _loaders:
+        if loader.sniff is not None and loader.sniff(header):
+            return loader
+    raise ValueError(f'unkown file type: {path}')
+
+def load_pkl(path, mmap_mode=None):
+    """Load and return a pickled object with ``joblib``.
+
+    Args:
+        path (str): Path of the file.
+        mmap_mode (str or None): If "r", NumPy arrays stored in the file are
+            memory-mapped read-only instead of being read into memory, so that
+            all processes loading the same file share a single copy of the
+            arrays through the page cache of the operating system. Only
+            arrays of files saved with ``joblib.dump()`` without compression
+            can be memory-mapped. See :func:`joblib.load` for other modes.
+    """
+    model = joblib.load(path, mmap_mode=mmap_mode)
     return model
 
 # on the reasonableness of imports inside a function, see
 # https://stackoverflow.com/questions/3095071/in-python-what-happens-when-you-import-inside-of-a-function/3095167#3095167
 def load_h5(path):
-    """Load and return an object stored in h5 with ``tensorflow``."""
+    """Load and return a keras model stored in h5 with ``tensorflow``.
+
+    Args:
+        path (str or file object): Path of the file or a binary file object,
+            e.g. a :class:`io.BytesIO` holding the contents of the file, which
+            is read with the in-memory file support of ``h5py`` rather than
+            written to disk first.
+    """
+    tf = _import_tensorflow()
+    if isinstance(path, (str, os.PathLike)):
+        return tf.keras.models.load_model(path)
+    import h5py
+    if _keras_major_version() < 3:
+        with h5py.File(path, 'r') as h5_file:
+            return tf.keras.models.load_model(h5_file)
+    # keras 3 only loads h5 files from paths with load_model(), and file
+    # objects with its legacy h5 loader, which is not public
+    legacy_h5_format = _keras_legacy_h5_format()
+    if legacy_h5_format is not None:
+        with h5py.File(path, 'r') as h5_file:
+            return legacy_h5_format.load_model_from_hdf5(h5_file)
+    with tempfile.TemporaryDirectory(prefix='porter-') as tmpdir:
+        filename = os.path.join(tmpdir, 'model.h5')
+        with open(filename, 'wb') as f:
+            shutil.copyfileobj(path, f)
+        return tf.keras.models.load_model(filename)
+
+def _keras_legacy_h5_format():
+    """Return the legacy h5 loader of keras 3, or ``None`` if it has been
+    moved or removed."""
+    try:
+        from keras.src.legacy.saving import legacy_h5_format
+    except ImportError:
+        _logger.warning('keras.src.legacy.saving is not available, loading h5 files '
+                        'from memory through temporary files')
+        return None
+    return legacy_h5_format
+
+def load_saved_model(path):
+    """Load a TensorFlow SavedModel from a directory or a zip archive of one.
+
+    Archives are extracted to a temporary directory that is removed once the
+    model has been loaded. The directory holding ``saved_model.pb`` may be
+    at the root of the archive or in a subdirectory.
+
+    Args:
+        path (str or file object): Path of the directory or archive, or a
+            binary file object holding the archive.
+
+    Returns:
+        The keras model if the SavedModel can be loaded with
+        ``tf.keras.models.load_model()``, i.e. with keras 2, and a
+        :class:`SavedModelSignature` otherwise.
+
+    Raises:
+        ValueError: If the archive does not contain a SavedModel.
+    """
+    if isinstance(path, (str, os.PathLike)) and os.path.isdir(path):
+        return _load_saved_model_dir(path)
+    with zipfile.ZipFile(path) as archive, \
+            tempfile.TemporaryDirectory(prefix='porter-') as tmpdir:
+        archive.extractall(tmpdir)
+        for directory, _, filenames in os.walk(tmpdir):
+            if 'saved_model.pb' in filenames:
+                return _load_saved_model_dir(directory)
+    raise ValueError('archive does not contain a SavedModel (saved_model.pb)')
+
+def _load_saved_model_dir(directory):
+    tf = _import_tensorflow()
+    if _keras_major_version() < 3:
+        return tf.keras.models.load_model(directory)
+    # keras 3 cannot load SavedModels with load_model()
+    return SavedModelSignature(tf.saved_model.load(directory))
+
+def _import_tensorflow():
+    """Import and return ``tensorflow`` with the numbers of threads set in
+    ``porter.config``."""
     import tensorflow as tf
-    model = tf.keras.models.load_model(path)
-    return model
+    for kind, threads in (('intra_op', cf.tensorflow_intra_op_threads),
+                          ('inter_op', cf.tensorflow_inter_op_threads)):
+        get_threads = getattr(tf.config.threading, f'get_{kind}_parallelism_threads')
+        if threads is None or get_threads() == threads:
+            continue
+        try:
+            getattr(tf.config.threading, f'set_{kind}_parallelism_threads')(threads)
+        except RuntimeError:
+            # TensorFlow has already been initialized
+            _logger.warning(f'cannot use {threads} {kind} threads, TensorFlow uses '
+                            f'{get_threads()}; set porter.config.tensorflow_{kind}_threads '
+                            f'before TensorFlow runs any operation')
+    return tf
+
+def _keras_major_version():
+    import tensorflow as tf
+    return int(tf.keras.__version__.split('.')[0])
+
+def load_onnx(path):
+    """Load an ONNX model and return it as an :class:`OnnxModel` running on
+    the CPU with ``onnxruntime``."""
+    import onnxruntime
+    session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+    return OnnxModel(session)
+
+def load_xgboost(path):
+    """Load a model saved in the native format of ``xgboost`` and return it as
+    an :class:`XGBoostModel`."""
+    import xgboost
+    booster = xgboost.Booster()
+    booster.load_model(path)
+    return XGBoostModel(booster)
+
+def load_lightgbm(path):
+    """Load a model saved in the native text format of ``lightgbm`` and return
+    a ``lightgbm.Booster``."""
+    import lightgbm
+    return lightgbm.Booster(model_file=path)
+
+
+class OnnxModel:
+    """A model or transformer served with an ``onnxruntime.InferenceSession``.
+
+    The input of :meth:`predict` and :meth:`transform` is converted to an
+    array of the type of the first input of the ONNX graph and the first
+    output of the graph is returned, e.g. the labels of a classifier converted
+    with ``skl2onnx``.
+
+    Args:
+        session (onnxruntime.InferenceSession): The session running the model.
+    """
+
+    # element types of ONNX tensors and the corresponding numpy dtypes
+    _DTYPES = {
+        'tensor(float)': np.float32,
+        'tensor(double)': np.float64,
+        'tensor(int32)': np.int32,
+        'tensor(int64)': np.int64,
+        'tensor(string)': np.object_,
+        'tensor(bool)': np.bool_,
+    }
+
+    def __init__(self, session):
+        self.session = session
+        model_input = session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._input_dtype = self._DTYPES.get(model_input.type, np.float32)
+
+    def predict(self, X):
+        """Return the first output of the model, with the second dimension
+        removed if it has size one."""
+        preds = self.transform(X)
+        if preds.ndim == 2 and preds.shape[1] == 1:
+            preds = preds[:, 0]
+        return preds
+
+    def transform(self, X):
+        """Return the first output of the model."""
+        X = np.asarray(X, dtype=self._input_dtype)
+        return self.session.run(None, {self._input_name: X})[0]
+
+
+class XGBoostModel:
+    """A model served with an ``xgboost.Booster``.
+
+    Args:
+        booster (xgboost.Booster): The booster. The output of ``predict`` is
+            that of the booster, i.e. probabilities for classifiers.
+    """
+
+    def __init__(self, booster):
+        self.booster = booster
+
+    def predict(self, X):
+        # inplace_predict avoids copying X into a DMatrix
+        return self.booster.inplace_predict(X)
+
+
+class SavedModelSignature:
+    """A model served with a signature of a SavedModel loaded with
+    ``tf.saved_model.load()``.
+
+    Args:
+        saved_model: The object returned by ``tf.saved_model.load()``.
+        signature (str): Name of the signature to call. The signature must
+            have a single input. Default is "serving_default".
+    """
+
+    def __init__(self, saved_model, signature='serving_default'):
+        # keep a reference to the SavedModel, which owns the variables used by
+        # the signature
+        self.saved_model = saved_model
+        self.signature = saved_model.signatures[signature]
+        inputs = self.signature.structured_input_signature[1]
+        if len(inputs) != 1:
+            raise ValueError(f'signature {signature} must have a single input')
+        (self._input_name, input_spec), = inputs.items()
+        self._input_dtype = input_spec.dtype.as_numpy_dtype
+
+    def predict(self, X):
+        """Return the first output of the signature."""
+        X = np.asarray(X, dtype=self._input_dtype)
+        outputs = self.signature(**{self._input_name: X})
+        return next(iter(outputs.values())).numpy()
+
+
+def _sniff_pickle(header):
+    # pickle protocols 2 and later start with the PROTO opcode, joblib's
+    # compressed files with the magic number of the compressor
+    return header[:1] == b'\x80' or header[:2] in _JOBLIB_COMPRESSED_MAGIC
+
+_JOBLIB_COMPRESSED_MAGIC = (b'\x1f\x8b', b'x\x01', b'x\x5e', b'x\x9c', b'x\xda')
+
+def _sniff_h5(header):
+    return header.startswith(b'\x89HDF\r\n\x1a\n')
+
+def _sniff_lightgbm(header):
+    return header.startswith(b'tree\n')
+
+
+register_loader(load_pkl, extensions=['.pkl', '.joblib'], sniff=_sniff_pickle,
+                accepts_mmap_mode=True)
+register_loader(load_h5, extensions=['.h5'], sniff=_sniff_h5, accepts_stream=True)
+register_loader(load_saved_model, extensions=['.zip'], accepts_stream=True)
+register_loader(load_onnx, extensions=['.onnx'])
+register_loader(load_xgboost, extensions=['.ubj', '.bst', '.xgb'])
+register_loader(load_lightgbm, extensions=['.lgb'], sniff=_sniff_lightgbm)
+
 
 def load_s3(path, s3_access_key_id, s3_secret_access_key):
-    import boto3
-    import botocore
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=s3_access_key_id,
-        aws_secret_access_key=s3_secret_access_key)
+    """Download ``path`` from S3 into memory and return it as a stream.
+
+    Note that the stream holds the entire object in memory. Use
+    :func:`download_s3` to load large objects.
+    """
+    s3_client = _get_s3_client(s3_access_key_id, s3_secret_access_key)
     bucket, key = split_s3_path(path)
     # previously, we tried to reinterpret 404s specifically here,
     # but it's better not to be so tighty coupled to the AWS API
     stream = io.BytesIO()
-    _ = s3_client.download_fileobj(bucket, key, stream)
+    _ = s3_client.download_fileobj(bucket, key, stream, Config=_s3_transfer_config())
     stream.seek(0)
     return stream
 
+def download_s3(path, filename, s3_access_key_id, s3_secret_access_key):
+    """Download ``path`` from S3 to the local file ``filename``.
+
+    The object is streamed to disk. Large objects are downloaded in parts of
+    ``porter.config.s3_multipart_chunksize`` bytes on up to
+    ``porter.config.s3_max_concurrency`` threads.
+    """
+    s3_client = _get_s3_client(s3_access_key_id, s3_secret_access_key)
+    bucket, key = split_s3_path(path)
+    s3_client.download_file(bucket, key, filename, Config=_s3_transfer_config())
+
+def _get_s3_client(s3_access_key_id, s3_secret_access_key):
+    """Return an S3 client for the given credentials.
+
+    Clients are thread-safe and are reused so that their connection pools are
+    shared by all downloads. Clients are not shared across processes.
+    """
+    import boto3
+    import botocore.config
+    client_key = (os.getpid(), s3_access_key_id, s3_secret_access_key)
+    with _s3_clients_lock:
+        s3_client = _s3_clients.get(client_key)
+        if s3_client is None:
+            # boto3.client() shares the default session, which is not
+            # thread-safe, so create the client from a new session.
+            s3_client = boto3.session.Session().client(
+                's3',
+                aws_access_key_id=s3_access_key_id,
+                aws_secret_access_key=s3_secret_access_key,
+                config=botocore.config.Config(max_pool_connections=cf.s3_max_concurrency))
+            _s3_clients[client_key] = s3_client
+        return s3_client
+
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+def _s3_transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=cf.s3_multipart_chunksize,
+        multipart_chunksize=cf.s3_multipart_chunksize,
+        max_concurrency=cf.s3_max_concurrency)
+
 def split_s3_path(path):
     if path.startswith('s3://'):
         _, path = path.split('s3://')
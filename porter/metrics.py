@@ -0,0 +1,399 @@
+"""Prometheus metrics for ``porter`` apps.
+
+Metrics are exposed in the Prometheus text format by instances of
+:class:`porter.services.ModelApp` created with ``expose_metrics=True``. No
+external service or library is required.
+
+By default metrics are kept in the memory of the process serving the
+requests. When an app is served by several worker processes, e.g. with
+gunicorn, set ``porter.config.metrics_multiprocess_dir`` to a directory shared
+by all workers. Each process then stores its values in its own memory-mapped
+file in that directory and the values of all files are summed when metrics
+are requested, so that each scrape reports the metrics of the whole server.
+The directory should be emptied whenever the server (re)starts.
+"""
+
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+
+from . import config as cf
+from . import timing
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75,
+    1.0, 2.5, 5.0, 7.5, 10.0)
+
+DEFAULT_BATCH_SIZE_BUCKETS = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000,
+    50000, 100000)
+
+
+class Counter:
+    """A monotonically increasing value.
+
+    Args:
+        registry (:class:`MetricsRegistry`): The registry storing the values.
+        name (str): Name of the metric.
+        documentation (str): Help text of the metric.
+        labelnames (sequence of str): Names of the labels of the metric.
+    """
+
+    type_name = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, amount=1, **labels):
+        """Increment the value of the counter identified by ``labels``."""
+        self.registry.inc(_sample_key(self.name, self._labels(labels)), amount)
+
+    def samples(self, values):
+        """Return a list of ``(name, labels, value)`` samples of the metric
+        found in ``values``."""
+        return [(name, labels, value) for (name, labels), value in values.items()
+                if name == self.name]
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'labels of {self.name} must be {self.labelnames}')
+        return [(label, str(labels[label])) for label in self.labelnames]
+
+
+class Histogram(Counter):
+    """Counts of observed values in configurable buckets.
+
+    Args:
+        registry (:class:`MetricsRegistry`): The registry storing the values.
+        name (str): Name of the metric.
+        documentation (str): Help text of the metric.
+        labelnames (sequence of str): Names of the labels of the metric.
+        buckets (sequence of float): Upper bounds of the buckets.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets)) + (math.inf,)
+        self._bucket_labels = [_format_value(bucket) for bucket in self.buckets]
+
+    def observe(self, value, **labels):
+        """Add ``value`` to the histogram identified by ``labels``."""
+        labels = self._labels(labels)
+        for bucket, bucket_label in zip(self.buckets, self._bucket_labels):
+            if value <= bucket:
+                break
+        # buckets are stored individually and made cumulative when the
+        # samples are collected.
+        self.registry.inc(_sample_key(f'{self.name}_bucket', labels + [('le', bucket_label)]), 1)
+        self.registry.inc(_sample_key(f'{self.name}_sum', labels), value)
+        self.registry.inc(_sample_key(f'{self.name}_count', labels), 1)
+
+    def samples(self, values):
+        samples = []
+        count_name = f'{self.name}_count'
+        for (name, labels), count in values.items():
+            if name != count_name:
+                continue
+            cumulative = 0.0
+            for bucket_label in self._bucket_labels:
+                bucket_labels = labels + (('le', bucket_label),)
+                cumulative += values.get((f'{self.name}_bucket', bucket_labels), 0.0)
+                samples.append((f'{self.name}_bucket', bucket_labels, cumulative))
+            samples.append((f'{self.name}_sum', labels, values.get((f'{self.name}_sum', labels), 0.0)))
+            samples.append((count_name, labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """A collection of metrics and the storage of their values.
+
+    Args:
+        directory (str or None): If ``None`` values are stored in memory.
+            Otherwise values are stored in a memory-mapped file per process
+            in ``directory`` and the values of all processes are aggregated
+            by :meth:`collect`.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.metrics = []
+        self._memory_values = _InMemoryValues()
+
+    def counter(self, name, documentation, labelnames=()):
+        """Create, register and return a :class:`Counter`."""
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        """Create, register and return a :class:`Histogram`."""
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def inc(self, key, amount):
+        """Increment the value stored for ``key`` by ``amount``."""
+        if self.directory is None:
+            self._memory_values.inc(key, amount)
+        else:
+            _mmap_values(self.directory).inc(key, amount)
+
+    def collect(self):
+        """Return a ``dict`` mapping ``(sample name, labels)`` to values,
+        summed over all processes sharing ``directory``."""
+        if self.directory is None:
+            items = self._memory_values.items()
+        else:
+            items = []
+            for path in sorted(glob.glob(os.path.join(self.directory, '*.db'))):
+                items.extend(_read_mmap_file(path))
+        values = {}
+        for key, value in items:
+            name, labels = json.loads(key)
+            sample = (name, tuple(tuple(label) for label in labels))
+            values[sample] = values.get(sample, 0.0) + value
+        return values
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        values = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples(values):
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class AppMetrics:
+    """The metrics collected by :class:`porter.services.ModelApp`.
+
+    Args:
+        directory (str or None): See :class:`MetricsRegistry`. Defaults to
+            ``porter.config.metrics_multiprocess_dir``.
+        latency_buckets (sequence of float): Buckets of the latency
+            histograms, in seconds.
+        batch_size_buckets (sequence of float): Buckets of the batch size
+            histogram.
+    """
+
+    def __init__(self, directory=None, latency_buckets=DEFAULT_LATENCY_BUCKETS,
+                 batch_size_buckets=DEFAULT_BATCH_SIZE_BUCKETS):
+        if directory is None:
+            directory = cf.metrics_multiprocess_dir
+        self.registry = registry = MetricsRegistry(directory)
+        self.requests = registry.counter(
+            'porter_requests_total', 'Total number of requests.',
+            ['service', 'method', 'status'])
+        self.errors = registry.counter(
+            'porter_request_errors_total', 'Total number of requests that failed, by status code.',
+            ['service', 'status'])
+        self.latency = registry.histogram(
+            'porter_request_duration_seconds', 'Time spent serving requests.',
+            ['service'], latency_buckets)
+        self.stage_latency = registry.histogram(
+            'porter_request_stage_duration_seconds', 'Time spent in each stage of serving requests.',
+            ['service', 'stage'], latency_buckets)
+        self.cpu = registry.histogram(
+            'porter_request_cpu_seconds', 'CPU time of the thread serving each request.',
+            ['service'], latency_buckets)
+        self.batch_size = registry.histogram(
+            'porter_request_batch_size', 'Number of instances per prediction request.',
+            ['service'], batch_size_buckets)
+        self.validated = registry.counter(
+            'porter_request_validated_instances_total',
+            'Total number of instances validated against the request schema.',
+            ['service'])
+
+    def observe_request(self, service, method, status_code, duration, cpu_time,
+                        stage_timings=None, batch_size=None, validated_count=None):
+        """Record the metrics of a single request.
+
+        Args:
+            service (str): ID of the service that served the request or ""
+                if the request was not served by a service, e.g. health checks.
+            method (str): HTTP method of the request.
+            status_code (int): Status code of the response.
+            duration (float): Time spent serving the request in seconds.
+            cpu_time (float): CPU time spent serving the request in seconds.
+            stage_timings (dict or None): Mapping of stage names to durations
+                as returned by :attr:`porter.timing.StageTimer.timings`.
+            batch_size (int or None): Number of instances in the request.
+            validated_count (int or None): Number of instances of the request
+                validated against the request schema, which is smaller than
+                ``batch_size`` if only a sample was validated.
+        """
+        self.requests.inc(service=service, method=method, status=status_code)
+        if status_code >= 400:
+            self.errors.inc(service=service, status=status_code)
+        self.latency.observe(duration, service=service)
+        self.cpu.observe(cpu_time, service=service)
+        for stage, seconds in (stage_timings or {}).items():
+            # the total is already recorded by the request latency
+            if stage != timing.TOTAL:
+                self.stage_latency.observe(seconds, service=service, stage=stage)
+        if batch_size is not None:
+            self.batch_size.observe(batch_size, service=service)
+        if validated_count is not None:
+            self.validated.inc(validated_count, service=service)
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        return self.registry.render()
+
+
+class _InMemoryValues:
+    """Values of the current process stored in a ``dict``."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+# Layout of the files storing the values of a process: a header holding the
+# number of bytes in use followed by entries, each consisting of the length of
+# the key, the utf-8 encoded key padded to 8 byte alignment and the value as
+# a double.
+_USED = struct.Struct('i')
+_KEY_LENGTH = struct.Struct('i')
+_VALUE = struct.Struct('d')
+_HEADER_SIZE = 8
+_INITIAL_MMAP_SIZE = 1 << 16
+
+
+def _padded_key_length(key_length):
+    return (_KEY_LENGTH.size + key_length + 7) // 8 * 8 - _KEY_LENGTH.size
+
+
+class _MmapValues:
+    """Values of the current process stored in a memory-mapped file.
+
+    Only the owning process writes to the file. Other processes read it with
+    :func:`_read_mmap_file`. Entries are written before the header is updated
+    so that readers never see partially written entries.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        if self._capacity == 0:
+            self._capacity = _INITIAL_MMAP_SIZE
+            self._file.truncate(self._capacity)
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._positions = {}
+        self._used = _USED.unpack_from(self._mmap, 0)[0] or _HEADER_SIZE
+        for key, _, position in _iter_entries(self._mmap, self._used):
+            self._positions[key] = position
+        _USED.pack_into(self._mmap, 0, self._used)
+
+    def inc(self, key, amount):
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._add_key(key)
+            value, = _VALUE.unpack_from(self._mmap, position)
+            _VALUE.pack_into(self._mmap, position, value + amount)
+
+    def _add_key(self, key):
+        encoded = key.encode('utf-8')
+        padded_length = _padded_key_length(len(encoded))
+        entry = struct.pack(f'i{padded_length}sd', len(encoded), encoded, 0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._mmap[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        _USED.pack_into(self._mmap, 0, self._used)
+        position = self._used - _VALUE.size
+        self._positions[key] = position
+        return position
+
+
+def _iter_entries(data, used):
+    """Yield ``(key, value, position of value)`` for each entry in ``data``."""
+    position = _HEADER_SIZE
+    while position < used:
+        key_length, = _KEY_LENGTH.unpack_from(data, position)
+        key_start = position + _KEY_LENGTH.size
+        key = bytes(data[key_start:key_start + key_length]).decode('utf-8')
+        value_position = key_start + _padded_key_length(key_length)
+        value, = _VALUE.unpack_from(data, value_position)
+        yield key, value, value_position
+        position = value_position + _VALUE.size
+
+
+def _read_mmap_file(path):
+    """Return a list of ``(key, value)`` pairs stored in the file at ``path``."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER_SIZE:
+        return []
+    used, = _USED.unpack_from(data, 0)
+    return [(key, value) for key, value, _ in _iter_entries(data, min(used, len(data)))]
+
+
+_mmap_values_by_path = {}
+_mmap_values_lock = threading.Lock()
+
+
+def _mmap_values(directory):
+    """Return the values of the current process stored in ``directory``.
+
+    The file is keyed by the process ID so that worker processes forked from
+    the same parent each write their own file.
+    """
+    path = os.path.join(directory, f'porter_metrics_{os.getpid()}.db')
+    values = _mmap_values_by_path.get(path)
+    if values is None:
+        with _mmap_values_lock:
+            values = _mmap_values_by_path.get(path)
+            if values is None:
+                values = _mmap_values_by_path[path] = _MmapValues(path)
+    return values
+
+
+def _sample_key(name, labels):
+    return json.dumps([name, labels])
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape_help(text):
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    formatted = ','.join(
+        '{}="{}"'.format(name, value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in labels)
+    return '{' + formatted + '}'
@@ -0,0 +1,183 @@
+"""Tools for sharing the memory of models between forked worker processes.
+
+Servers such as gunicorn can build an app once in a parent process and fork
+worker processes from it (``gunicorn --preload``), in which case the memory
+holding the models is shared copy-on-write between the workers. In CPython,
+however, reference counting and cyclic garbage collection write to the header
+of every object they touch, so the pages of long-lived objects are gradually
+copied into each worker. :func:`preload_app` builds an app such that those
+pages stay shared, and :class:`MemoryReporter` reports how many pages each
+worker shares.
+
+For example, in ``app.py``:
+
+    >>> from porter.preload import preload_app
+    >>> model_app = preload_app(build_model_app)
+
+and in ``gunicorn.conf.py``:
+
+    >>> preload_app = True
+    >>> def post_fork(server, worker):
+    ...     from porter.preload import MemoryReporter
+    ...     MemoryReporter(interval=300).start()
+
+Memory usage is read from ``/proc`` and is only available on Linux.
+"""
+
+import gc
+import logging
+import os
+import threading
+import warnings
+
+
+_logger = logging.getLogger(__name__)
+
+# fields of /proc/<pid>/smaps reported by memory_usage()
+_SMAPS_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared_clean',
+    'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean',
+    'Private_Dirty': 'private_dirty',
+}
+
+
+def preload_app(factory, *, freeze_gc=True):
+    """Build an app in a process that will fork the worker processes serving it.
+
+    Calls ``factory`` to build the app, waits until the services of the app are
+    loaded and warmed up (see :meth:`porter.services.ModelApp.warm_up`),
+    compiles their schema validators so that the workers share them as well,
+    and then moves all objects into the permanent generation of the garbage
+    collector with :func:`gc.freeze`. Frozen objects are ignored by garbage
+    collections in the workers, which would otherwise copy the memory pages
+    holding them. The garbage collector is disabled while the app is built to
+    avoid leaving partially freed pages that the workers would write to.
+
+    Args:
+        factory (callable): Callable without arguments returning an instance
+            of :class:`porter.services.ModelApp`.
+        freeze_gc (bool): Whether to disable the garbage collector while
+            building the app and to freeze it afterwards. Default is ``True``.
+
+    Returns:
+        The app returned by ``factory``.
+    """
+    if freeze_gc and not hasattr(gc, 'freeze'):
+        warnings.warn('gc.freeze() requires Python 3.7 or later, freeze_gc is ignored')
+        freeze_gc = False
+    gc_was_enabled = gc.isenabled()
+    if freeze_gc:
+        gc.disable()
+    try:
+        model_app = factory()
+        # forking while a thread is loading the services could leave locks
+        # acquired in the workers, so wait for the background warm up.
+        model_app.wait_for_warm_up()
+        model_app.warm_up()
+        model_app.compile_schemas()
+    finally:
+        if freeze_gc:
+            gc.freeze()
+            if gc_was_enabled:
+                gc.enable()
+    try:
+        _logger.info(f'preloaded app: {memory_usage_summary(memory_usage())}',
+                     extra={'event': 'preload'})
+    except OSError:
+        # /proc is not available on this platform
+        pass
+    return model_app
+
+
+def memory_usage(pid=None):
+    """Return the memory usage of a process as reported by the kernel.
+
+    Args:
+        pid (int or None): ID of the process. Defaults to the current process.
+
+    Returns:
+        dict: Sizes in bytes keyed by "rss", "pss", "shared_clean",
+            "shared_dirty", "private_clean" and "private_dirty". Shared pages
+            are mapped by more than one process, e.g. pages inherited from
+            the parent process that have not been written to, while private
+            pages are only mapped by this process. The proportional set size
+            ("pss") divides each shared page between the processes sharing it.
+    """
+    proc_dir = f'/proc/{pid if pid is not None else "self"}'
+    # smaps_rollup is much cheaper to read but requires Linux 4.14
+    try:
+        with open(f'{proc_dir}/smaps_rollup') as f:
+            return _parse_smaps(f)
+    except FileNotFoundError:
+        with open(f'{proc_dir}/smaps') as f:
+            return _parse_smaps(f)
+
+
+def memory_usage_summary(usage):
+    """Format the output of :func:`memory_usage` for logging."""
+    mb = 1024 * 1024
+    shared = usage['shared_clean'] + usage['shared_dirty']
+    private = usage['private_clean'] + usage['private_dirty']
+    return (f'rss={usage["rss"] / mb:.1f}MB pss={usage["pss"] / mb:.1f}MB '
+            f'shared={shared / mb:.1f}MB private={private / mb:.1f}MB')
+
+
+def _parse_smaps(lines):
+    usage = dict.fromkeys(_SMAPS_FIELDS.values(), 0)
+    for line in lines:
+        name, _, value = line.partition(':')
+        if name in _SMAPS_FIELDS:
+            # values are given in kB
+            usage[_SMAPS_FIELDS[name]] += int(value.split()[0]) * 1024
+    return usage
+
+
+class MemoryReporter:
+    """Periodically report the memory usage of the current process.
+
+    Start a reporter in each worker process, e.g. from a gunicorn ``post_fork``
+    hook, to track how many pages shared with the parent process each worker
+    has copied over time.
+
+    Args:
+        interval (float): Seconds between reports. Default is 60.
+        callback (callable or None): Called with the output of
+            :func:`memory_usage` on each report. By default the usage is
+            logged.
+    """
+
+    def __init__(self, interval=60.0, callback=None):
+        self.interval = interval
+        self.callback = callback or self._log
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start reporting in a daemon thread."""
+        self._thread = threading.Thread(target=self._run, name='porter-memory-reporter',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop reporting and wait for the reporting thread to exit."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                self.callback(memory_usage())
+            except Exception as err:
+                _logger.exception(err, extra={'event': 'memory_usage'})
+            if self._stopped.wait(self.interval):
+                return
+
+    @staticmethod
+    def _log(usage):
+        _logger.info(f'pid {os.getpid()}: {memory_usage_summary(usage)}',
+                     extra={'event': 'memory_usage', 'pid': os.getpid(), **usage})
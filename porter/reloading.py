@@ -0,0 +1,147 @@
+"""Reload the models of running services when their artifacts change.
+
+An :class:`ArtifactWatcher` polls the version of the files a
+:class:`porter.services.PredictionService` was loaded from, i.e. the
+modification time of local files or the version ID or ETag of objects on S3.
+When a file changes, the new version is loaded in the background and swapped
+into the service with :meth:`porter.services.PredictionService.reload`,
+without restarting the server.
+
+Each process polls and reloads independently, so with a pre-forking server
+such as gunicorn the watcher should be started in each worker, e.g. from a
+``post_fork`` hook.
+"""
+
+import logging
+import os
+import threading
+
+from . import datascience
+from . import loading
+
+
+_logger = logging.getLogger(__name__)
+
+
+def artifact_version(path, s3_access_key_id=None, s3_secret_access_key=None):
+    """Return a ``str`` identifying the current version of the file at
+    ``path``.
+
+    The version of a local file is derived from its modification time and
+    size. The version of an object on S3 is its version ID if versioning is
+    enabled for the bucket and its ETag otherwise.
+    """
+    if path.startswith('s3://'):
+        s3_client = loading._get_s3_client(s3_access_key_id, s3_secret_access_key)
+        bucket, key = loading.split_s3_path(path)
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        return head.get('VersionId') or head['ETag'].strip('"')
+    stat = os.stat(path)
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
+class ArtifactWatcher:
+    """Reload the components of a service when the files they were loaded
+    from change.
+
+    The versions of the files when the watcher is created are assumed to be
+    the versions the service is serving.
+
+    Args:
+        service (:class:`porter.services.PredictionService`): The service to
+            reload.
+        model (str or None): Path of the model file. Optional.
+        preprocessor (str or None): Path of the preprocessor file. Optional.
+        postprocessor (str or None): Path of the postprocessor file. Optional.
+        interval (float): Seconds between checks for new versions. Default is
+            60.
+        loader (callable or None): Called as ``loader(component, path)`` to
+            load a new version of a component, where ``component`` is one of
+            "model", "preprocessor" and "postprocessor". By default models are
+            loaded with :meth:`porter.datascience.WrappedModel.from_file` and
+            preprocessors with
+            :meth:`porter.datascience.WrappedTransformer.from_file`, with the
+            options, e.g. ``compile`` and ``mmap_mode``, of the component
+            being replaced if it is an instance of these classes. Required
+            to watch a postprocessor.
+        s3_access_key_id (str or None): Credentials used for paths on S3.
+        s3_secret_access_key (str or None): Credentials used for paths on S3.
+
+    Attributes:
+        paths (dict): Maps each watched component to its path.
+        versions (dict): Maps each watched component to the version being
+            served.
+    """
+
+    def __init__(self, service, *, model=None, preprocessor=None, postprocessor=None,
+                 interval=60.0, loader=None, s3_access_key_id=None,
+                 s3_secret_access_key=None):
+        self.service = service
+        self.paths = {name: path for name, path in [('model', model),
+                                                    ('preprocessor', preprocessor),
+                                                    ('postprocessor', postprocessor)]
+                      if path is not None}
+        if not self.paths:
+            raise ValueError('at least one of `model`, `preprocessor` and `postprocessor` is required')
+        if 'postprocessor' in self.paths and loader is None:
+            raise ValueError('`loader` is required to watch a postprocessor')
+        self.interval = interval
+        self.loader = loader or self._default_loader
+        self.s3_access_key_id = s3_access_key_id
+        self.s3_secret_access_key = s3_secret_access_key
+        self.versions = self._current_versions()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    def check(self):
+        """Check for new versions of the files and reload the service if any
+        changed. Return ``True`` if the service was reloaded."""
+        versions = self._current_versions()
+        changed = [name for name in self.paths if versions[name] != self.versions[name]]
+        if not changed:
+            return False
+        components = {name: self.loader(name, self.paths[name]) for name in changed}
+        self.service.reload(**components,
+                            meta={f'{name}_version': versions[name] for name in changed})
+        self.versions.update({name: versions[name] for name in changed})
+        return True
+
+    def start(self):
+        """Check for new versions every ``interval`` seconds in a daemon
+        thread. Does nothing if the watcher has already been started in the
+        current process."""
+        if self._thread_pid == os.getpid():
+            return self
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='porter-artifact-watcher',
+                                        daemon=True)
+        self._thread_pid = os.getpid()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop checking for new versions."""
+        self._stopped.set()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join()
+        self._thread_pid = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as err:
+                # keep serving the current version and retry on the next check
+                _logger.exception(err, extra={'event': 'reload'})
+
+    def _current_versions(self):
+        return {name: artifact_version(path, self.s3_access_key_id, self.s3_secret_access_key)
+                for name, path in self.paths.items()}
+
+    def _default_loader(self, component, path):
+        cls = datascience.WrappedModel if component == 'model' else datascience.WrappedTransformer
+        current = getattr(self.service, component, None)
+        options = current._reload_options() if isinstance(current, cls) else {}
+        return cls.from_file(path, s3_access_key_id=self.s3_access_key_id,
+                             s3_secret_access_key=self.s3_secret_access_key, **options)
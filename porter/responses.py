@@ -61,7 +61,7 @@ def make_prediction_response(id_value, prediction):
     return Response(payload)
 
 
-def make_batch_prediction_response(id_values, predictions):
+def make_batch_prediction_response(id_values, predictions, errors=None):
     payload = {
         cn.PREDICTION_KEYS.PREDICTIONS: [
             {
@@ -71,6 +71,8 @@ def make_batch_prediction_response(id_values, predictions):
             for id, p in zip(id_values, predictions)
         ]
     }
+    if errors is not None:
+        payload[cn.PREDICTION_KEYS.ERRORS] = errors
     return Response(payload)
 
 
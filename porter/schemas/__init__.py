@@ -7,13 +7,15 @@ from .openapi import (Array, Boolean, Integer, Number, Object, RequestSchema,
                       make_openapi_spec)
 from .schemas import (app_meta, error_body, error_messages, error_name,
                       error_traceback, generic_error, health_check,
-                      model_context, model_context_error, model_meta,
-                      request_id)
+                      instance_error, model_context, model_context_error,
+                      model_meta, request_id)
+from .synthetic import synthetic_data
 
 __all__ = [
     'Array', 'Boolean', 'Integer', 'Number', 'Object', 'RequestSchema',
     'ResponseSchema', 'String', 'make_docs_html', 'make_openapi_spec',
     'app_meta', 'error_body', 'error_messages', 'error_name',
-    'error_traceback', 'generic_error', 'health_check', 'model_context',
-    'model_context_error', 'model_meta', 'request_id'
+    'error_traceback', 'generic_error', 'health_check', 'instance_error',
+    'model_context', 'model_context_error', 'model_meta', 'request_id',
+    'synthetic_data'
 ]
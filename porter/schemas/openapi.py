@@ -1,28 +1,65 @@
 """Tools for integrating the OpenAPI standard in ``porter``."""
 
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import marshal
+import operator
 import os
+import random
+import sys
+import tempfile
+import threading
 
 import fastjsonschema
+import numpy as np
+import pandas as pd
 from jinja2 import Template
 
+from .. import config as cf
 from ..constants import ASSETS_DIR
 
 
-def _numpy_to_builtin(x):
-    """Convert NumPy dtypes (int32, float64, etc) to built-ins (int, float, etc)"""
-    if hasattr(x, 'keys'):
-        # mapping
-        keys = list(x.keys())
-    elif hasattr(x, '__len__'):
-        # sequence
-        keys = range(len(x))
-    else:
-        return
-    for k in keys:
-        if hasattr(x[k], 'tolist'):
-            x[k] = x[k].tolist()
-        elif isinstance(x[k], dict):
-            _numpy_to_builtin(x[k])
+_logger = logging.getLogger(__name__)
+
+
+def _to_builtin(data):
+    """Return ``data`` with NumPy scalars and arrays and pandas objects
+    replaced by the built-in types they are serialized as, e.g. ``int``,
+    ``float`` and ``list``.
+
+    ``data`` itself is returned if it contains no such objects, so that
+    callers can tell whether anything was converted. ``data`` is never
+    modified.
+    """
+    if isinstance(data, dict):
+        converted = {key: _to_builtin(value) for key, value in data.items()}
+        if all(converted[key] is value for key, value in data.items()):
+            return data
+        return converted
+    if isinstance(data, (list, tuple)):
+        converted = [_to_builtin(value) for value in data]
+        if all(new is old for new, old in zip(converted, data)):
+            return data
+        return converted
+    if isinstance(data, pd.DataFrame):
+        return _to_builtin(data.to_dict('records'))
+    if isinstance(data, (np.ndarray, pd.Series)):
+        # tolist() converts the elements, unless they are Python objects
+        return _to_builtin(data.tolist())
+    if isinstance(data, np.generic):
+        return data.item()
+    return data
+
+
+def _validation_error(err):
+    """Return the ``ValueError`` raised for the fastjsonschema error ``err``."""
+    # fastjsonschema raises useful error messsages so we'll reuse them.
+    # However, a ValueError so that other modules don't need to depend
+    # on fastjsonschema exceptions
+    return ValueError(f'Schema validation failed: {err.args[0]}', *err.args[1:])
 
 
 class ApiObject:
@@ -42,31 +79,57 @@ class ApiObject:
         self.description = description
         self.additional_params = additional_params or {}
         self.reference_name = reference_name
+        # the OpenAPI definition and the validator are only built when first
+        # needed, many objects are never used to validate data.
+        self._openapi_cache = {}
+        self._validator = None
+
+    @property
+    def _jsonschema(self):
+        # On compatability with the OpenApi spec and json schema see
+        # https://swagger.io/docs/specification/data-models/keywords/
+        # and
+        # http://json-schema.org/draft-06/json-schema-release-notes.html
         with _RefContext(ignore_refs=True):
-            # On compatability with the OpenApi spec and json schema see
-            # https://swagger.io/docs/specification/data-models/keywords/
-            # and
-            # http://json-schema.org/draft-06/json-schema-release-notes.html
-            self._jsonschema = self.to_openapi()[0]
-            self._validate = fastjsonschema.compile({
-                '$draft': '04',
-                **self._jsonschema
-            })
+            return self.to_openapi()[0]
 
     def to_openapi(self):
         """Return the OpenAPI definition of `self`.
 
+        The definition is computed once and reused by subsequent calls, so
+        objects should not be modified after they have been used.
+
         Returns:
             tuple: Returns two dicts, the first contains the OpenAPI
                 definition of `self` and the second contains any references.
         """
         with _RefContext() as ref_context:
-            openapi_spec = dict(type=self._openapi_type_name, description=self.description, **self.additional_params)
-            openapi_spec.update(self._customized_openapi())
-            if self.reference_name is not None and not _RefContext.context_ignore_refs():
-                _RefContext.add_ref(self.reference_name, openapi_spec)
-                return {'$ref': f'#/components/schemas/{self.reference_name}'}, ref_context.schemas
-        return openapi_spec, ref_context.schemas
+            ignore_refs = _RefContext.context_ignore_refs()
+            cached = self._openapi_cache.get(ignore_refs)
+            if cached is None:
+                openapi_spec = dict(type=self._openapi_type_name, description=self.description, **self.additional_params)
+                openapi_spec.update(self._customized_openapi())
+                if self.reference_name is not None and not ignore_refs:
+                    _RefContext.add_ref(self.reference_name, openapi_spec)
+                    openapi_spec = {'$ref': f'#/components/schemas/{self.reference_name}'}
+                cached = self._openapi_cache[ignore_refs] = (openapi_spec, dict(ref_context.schemas))
+            else:
+                # register the references of nested objects with the
+                # enclosing context
+                ref_context.schemas.update(cached[1])
+        return cached[0], ref_context.schemas
+
+    def compile(self):
+        """Compile the validator used by :meth:`validate` unless it has
+        already been compiled.
+
+        Validators are otherwise compiled on the first call to
+        :meth:`validate`. Compiling ahead of time with
+        ``porter.config.schema_cache_dir`` set caches the code of the
+        validator on disk, see :meth:`porter.services.ModelApp.compile_schemas`.
+        """
+        if self._validator is None:
+            self._validator = _compile_validator(self._jsonschema)
 
     def _customized_openapi(self):
         """Return a mapping of custom values to be added to the OpenAPI spec.
@@ -84,7 +147,10 @@ class ApiObject:
             data (JSON-like data structure): `data` will be evaulated against
                 the OpenAPI spec that describes `self`. It should be a
                 "JSON-like" data structure consisting of types compatible with
-                `dict`, `list`, `int`, `str`, etc.
+                `dict`, `list`, `int`, `str`, etc. NumPy scalars and arrays
+                and pandas objects are validated as the built-in types they
+                are serialized as, e.g. the output of a model can be
+                validated without encoding it to JSON first.
 
         Returns:
             None
@@ -97,15 +163,20 @@ class ApiObject:
                 method and others.
 
         """
-        # possible hack for accepting numpy types
-        #_numpy_to_builtin(data)
+        self.compile()
         try:
-            self._validate(data)
+            self._validator(data)
         except fastjsonschema.exceptions.JsonSchemaException as err:
-            # fastjsonschema raises useful error messsages so we'll reuse them.
-            # However, a ValueError so that other modules don't need to depend
-            # on fastjsonschema exceptions
-            raise ValueError(f'Schema validation failed: {err.args[0]}', *err.args[1:]) from err
+            # fastjsonschema does not accept NumPy and pandas objects, which
+            # are only converted if the data failed validation, i.e. valid
+            # data that contains none are not copied.
+            builtin_data = _to_builtin(data)
+            if builtin_data is data:
+                raise _validation_error(err) from err
+            try:
+                self._validator(builtin_data)
+            except fastjsonschema.exceptions.JsonSchemaException as err:
+                raise _validation_error(err) from err
 
 
 class String(ApiObject):
@@ -134,10 +205,68 @@ class Array(ApiObject):
         """
         self.item_type = item_type
         super().__init__(*args, **kwargs)
+        self._validate_columns = _compile_column_validator(self)
+        self._screen = _compile_screen(self)
 
     def _customized_openapi(self):
         return {'items': self.item_type.to_openapi()[0]}
 
+    def validate(self, data):
+        # Arrays of simple objects, e.g. batch prediction requests, and of
+        # primitive types are first checked one property at a time with
+        # NumPy, which is much faster than fastjsonschema for large arrays and
+        # accepts NumPy arrays and pandas objects directly. If that check
+        # cannot prove that the data is valid fastjsonschema is used, which
+        # also reports the first error.
+        if self._validate_columns is not None and self._validate_columns(data):
+            return
+        super().validate(data)
+
+    def validate_sample(self, data, sample_size):
+        """Validate a random sample of the items in `data` and any items that
+        fail a cheap check of their types.
+
+        The types of all items, and of the properties of items that are
+        objects, are checked against the schema, but only the items failing
+        this check and `sample_size` other items are fully validated. The
+        cost of validating very large arrays is then nearly constant while
+        systematic errors, e.g. a missing or renamed property, are still
+        caught.
+
+        Args:
+            data (JSON-like data structure): The data to validate.
+            sample_size (int): Number of items validated in addition to the
+                items failing the type check. All items are validated if
+                `data` has no more than `sample_size` items.
+
+        Returns:
+            int: The number of items that were validated.
+
+        Raises:
+            ValueError: If the validated items do not conform to the OpenAPI
+                spec that describes `self`, see :meth:`validate`. If only a
+                sample was validated, its ``validated_count`` attribute is
+                the number of items that were to be validated.
+        """
+        if (type(data) is not list or len(data) <= sample_size
+                or self.additional_params or self._screen is None):
+            self.validate(data)
+            return len(data) if type(data) is list else 1
+        indices = self._screen(data)
+        indices.update(random.sample(range(len(data)), sample_size))
+        for index in sorted(indices):
+            try:
+                self.item_type.validate(data[index])
+            except ValueError as err:
+                # report the position of the item in the array, as
+                # fastjsonschema does when validating the whole array
+                message = err.args[0].replace(': data', f': data[{index}]', 1)
+                error = ValueError(message)
+                error.validated_count = len(indices)
+                raise error from err
+        return len(indices)
+
+
 class Object(ApiObject):
     """Object type."""
 
@@ -180,6 +309,238 @@ class Object(ApiObject):
                 spec['additionalProperties'] = self.additional_properties_type
         return spec
 
+    def validate(self, data):
+        # Objects holding arrays, e.g. batch prediction responses, are first
+        # checked one property at a time so that the arrays are checked with
+        # the fast paths of Array.validate. As for arrays, fastjsonschema is
+        # used if that check fails, which also reports the first error.
+        if self._validate_properties(data):
+            return
+        super().validate(data)
+
+    def _validate_properties(self, data):
+        if (self.additional_params or self.properties is None
+                or self.additional_properties_type is not None
+                or not any(isinstance(prop, (Array, Object)) for prop in self.properties.values())):
+            return False
+        if type(data) is not dict or not all(name in data for name in self.required):
+            return False
+        try:
+            for name, prop in self.properties.items():
+                if name in data:
+                    prop.validate(data[name])
+        except ValueError:
+            return False
+        return True
+
+
+class _Missing:
+    """Placeholder for properties missing from an object."""
+
+_MISSING = _Missing()
+
+_NUMPY_INTEGER_TYPES = {np.dtype(code).type for code in np.typecodes['AllInteger']}
+_NUMPY_FLOAT_TYPES = {np.dtype(code).type for code in np.typecodes['Float']}
+_INTEGER_TYPES = {int} | _NUMPY_INTEGER_TYPES
+_FLOAT_TYPES = {float} | _NUMPY_FLOAT_TYPES
+
+# types of the decoded JSON values, and of the NumPy scalars serialized as
+# them, satisfying each primitive type. Integers may also be floats with an
+# integral value.
+_COLUMN_TYPES = {
+    String: {str, np.str_},
+    Number: _INTEGER_TYPES | _FLOAT_TYPES,
+    Integer: _INTEGER_TYPES | _FLOAT_TYPES,
+    Boolean: {bool, np.bool_},
+}
+
+# additional_params that can be checked one property at a time
+_COLUMN_KEYWORDS = {'enum', 'minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum'}
+
+# floats represent all integers up to this magnitude exactly
+_MAX_EXACT_FLOAT = 2 ** 53
+
+
+def _compile_column_validator(api_obj):
+    """Return a function checking an array of objects one property at a time,
+    or an array of primitive values at once, or ``None`` if the constraints
+    of ``api_obj`` cannot be checked that way.
+
+    The function returns ``True`` if the data conforms to ``api_obj`` and
+    ``False`` if it does not or the data can not be checked column-wise,
+    e.g. because it contains very large integers. Arrays of objects may be
+    given as a ``pandas.DataFrame`` and arrays of primitive values as a
+    one-dimensional ``numpy.ndarray`` or ``pandas.Series``.
+    """
+    item = api_obj.item_type
+    if api_obj.additional_params:
+        return None
+    if type(item) in _COLUMN_TYPES:
+        return _compile_values_validator(item)
+    if (type(item) is not Object or item.additional_params
+            or item.properties is None or item.additional_properties_type is not None):
+        return None
+    checks = []
+    for name, prop in item.properties.items():
+        check = _compile_column_check(prop, required=name in item.required)
+        if check is None:
+            return None
+        checks.append((name, name in item.required, check))
+
+    def validate(data):
+        if isinstance(data, pd.DataFrame):
+            return validate_frame(data)
+        if type(data) is not list or set(map(type, data)) != {dict}:
+            return False
+        for name, required, check in checks:
+            if required:
+                try:
+                    values = list(map(operator.itemgetter(name), data))
+                except KeyError:
+                    return False
+            else:
+                values = [row.get(name, _MISSING) for row in data]
+            if not check(values):
+                return False
+        return True
+
+    def validate_frame(frame):
+        if not frame.columns.is_unique:
+            return False
+        for name, required, check in checks:
+            if name in frame.columns:
+                if not check(frame[name].to_numpy()):
+                    return False
+            elif required:
+                return False
+        return True
+
+    return validate
+
+
+def _compile_values_validator(item):
+    """Return a function checking an array of primitive values at once, or
+    ``None`` if the constraints of ``item`` are not supported."""
+    check = _compile_column_check(item, required=True)
+    if check is None:
+        return None
+
+    def validate(data):
+        if isinstance(data, (np.ndarray, pd.Series)):
+            return data.ndim == 1 and check(np.asarray(data))
+        return type(data) is list and check(data)
+
+    return validate
+
+
+def _compile_column_check(api_obj, required):
+    """Return a function checking the values of a property of all objects,
+    or ``None`` if the constraints of ``api_obj`` are not supported."""
+    allowed_types = _COLUMN_TYPES.get(type(api_obj))
+    params = api_obj.additional_params
+    if allowed_types is None or not set(params) <= _COLUMN_KEYWORDS:
+        return None
+    if not required:
+        allowed_types = allowed_types | {_Missing}
+    enum = params.get('enum')
+    if enum is not None:
+        try:
+            enum = set(enum)
+        except TypeError:
+            # unhashable values
+            return None
+    bounds = [(params[keyword], compare) for keyword, compare in [
+        ('minimum', np.less), ('maximum', np.greater),
+        ('exclusiveMinimum', np.less_equal), ('exclusiveMaximum', np.greater_equal)]
+        if keyword in params]
+    for bound, _ in bounds:
+        # boolean exclusive bounds of draft 4 are not supported
+        if type(api_obj) not in (Number, Integer) or type(bound) not in (int, float):
+            return None
+    is_integer = type(api_obj) is Integer
+
+    def check(values):
+        if type(values) is np.ndarray and values.dtype.kind != 'O':
+            # all values have the type of the array
+            types = {values.dtype.type}
+        else:
+            types = set(map(type, values))
+        if not types <= allowed_types:
+            return False
+        if _Missing in types:
+            values = [value for value in values if value is not _MISSING]
+        if enum is not None and not set(values) <= enum:
+            return False
+        if not len(values) or (not bounds and not (is_integer and types & _FLOAT_TYPES)):
+            return True
+        array = np.asarray(values)
+        if array.dtype.kind not in 'iuf':
+            # e.g. integers too large for int64
+            return False
+        if array.dtype.kind == 'f':
+            if types & _INTEGER_TYPES and np.abs(array).max() >= _MAX_EXACT_FLOAT:
+                return False
+            if is_integer and not (np.isfinite(array).all() and (array == np.floor(array)).all()):
+                return False
+        return not any(compare(array, bound).any() for bound, compare in bounds)
+
+    return check
+
+
+# types of the values that can satisfy each type
+_SCREEN_TYPES = {
+    **_COLUMN_TYPES,
+    Array: {list},
+    Object: {dict},
+}
+
+
+def _compile_screen(api_obj):
+    """Return a function returning the set of indices of the items in an array
+    whose types, or the types of whose properties, do not conform to
+    ``api_obj``, or ``None`` if the type of the items is not supported.
+
+    Items passing the check are not necessarily valid.
+    """
+    item = api_obj.item_type
+    item_types = _SCREEN_TYPES.get(type(item))
+    if item_types is None:
+        return None
+    columns = []
+    if type(item) is Object and item.properties is not None:
+        for name, prop in item.properties.items():
+            types = _SCREEN_TYPES.get(type(prop))
+            if types is not None:
+                columns.append((name, types if name in item.required else types | {_Missing}))
+
+    def conforms(signature):
+        property_types = dict(zip(*signature))
+        return all(property_types.get(name, _Missing) in types for name, types in columns)
+
+    def screen(data):
+        flagged = {index for index, item_type in enumerate(map(type, data))
+                   if item_type not in item_types}
+        if flagged or not columns:
+            # items with the wrong type are invalid anyway
+            return flagged
+        # the items of a batch usually share very few distinct combinations
+        # of property names and types, which are collected without
+        # evaluating any Python code per item and checked once each.
+        invalid = {signature for signature in set(_signatures(data)) if not conforms(signature)}
+        if invalid:
+            flagged.update(index for index, signature in enumerate(_signatures(data))
+                           if signature in invalid)
+        return flagged
+
+    return screen
+
+
+def _signatures(objects):
+    """Yield the names and the types of the values of the properties of each
+    object in ``objects``."""
+    return zip(map(tuple, objects),
+               map(tuple, map(functools.partial(map, type), map(dict.values, objects))))
+
 
 class _RefContext:
     """Helper class to keep track of all referenced objects created when a
@@ -202,43 +563,135 @@ class _RefContext:
     We handle this by placing an instance of `_RefContext` on to a `stack`
     (last in/first out) every time an object is converted to its OpenAPI spec.
     Additionally each object "registers" the spec of any of its immediate
-    references with `_RefContext` (which means they are attached to the first
-    item in the stack). When the outer most object is ready to return all
-    referenced dependencies will have attached their spec to the instance of
-    `_RefContext` instantiated in that call.
+    references with `_RefContext` (which means they are attached to the last
+    item in the stack). When a context exits its references are passed on to
+    the enclosing context, so that each call returns the references of the
+    object and all objects nested in it, and when the outer most object is
+    ready to return all referenced dependencies will have attached their spec
+    to the instance of `_RefContext` instantiated in that call.
+
+    Objects may be converted lazily, e.g. while serving requests, so each
+    thread has its own stack.
     """
 
-    _context = []
+    _local = threading.local()
 
     def __init__(self, ignore_refs=False):
         self.schemas = {}
         self.ignore_refs = ignore_refs
 
+    @classmethod
+    def _stack(cls):
+        try:
+            return cls._local.stack
+        except AttributeError:
+            cls._local.stack = []
+            return cls._local.stack
+
     def __enter__(self):
-        # it's tempting to do something like the following here:
-        #     if not self._context:
-        #         self._context.append(self)
-        # but then we would never know when to clear _context in __exit__()
-        self._context.append(self)
+        self._stack().append(self)
         return self
 
     def __exit__(self, *exc):
-        self._context.pop()  # clean up the stack
+        stack = self._stack()
+        stack.pop()  # clean up the stack
+        if stack:
+            stack[-1].schemas.update(self.schemas)
         return False
 
     @classmethod
     def add_ref(cls, ref_name, openapi_spec):
-        current_context = cls._context[0]  # always add definitions to the first
-                                           # item in the stack!
-        current_context.schemas[ref_name] = openapi_spec
+        cls._stack()[-1].schemas[ref_name] = openapi_spec
 
     @classmethod
     def context_ignore_refs(cls):
-        current_context = cls._context[0]  # always add definitions to the first
-                                           # item in the stack!
+        current_context = cls._stack()[0]  # whether references are ignored
+                                           # is set by the first item in the
+                                           # stack!
         return current_context.ignore_refs
 
 
+# validators compiled by _compile_validator() keyed by a hash of the schema
+_validators = {}
+_validators_lock = threading.Lock()
+
+
+def _compile_validator(jsonschema):
+    """Return a fastjsonschema validator for ``jsonschema``.
+
+    Validators are cached by a canonical hash of the schema and the version
+    of fastjsonschema, so that objects with identical schemas, e.g. the
+    schemas of several services, share a single validator. If
+    ``porter.config.schema_cache_dir`` is set, the code of the validators is
+    also cached on disk.
+    """
+    schema = {'$draft': '04', **jsonschema}
+    canonical = json.dumps(schema, sort_keys=True, separators=(',', ':'), default=repr)
+    key = hashlib.sha256(f'{fastjsonschema.VERSION}\0{canonical}'.encode()).hexdigest()
+    with _validators_lock:
+        validate = _validators.get(key)
+        if validate is None:
+            if cf.schema_cache_dir is None:
+                validate = fastjsonschema.compile(schema)
+            else:
+                validate = _load_cached_validator(schema, key, cf.schema_cache_dir)
+            _validators[key] = validate
+    return validate
+
+
+def _load_cached_validator(schema, key, directory):
+    """Load the validator generated for ``schema`` from ``directory``,
+    generating it first if it is not cached.
+
+    Both the generated code and its bytecode are cached, the latter keyed by
+    the version of the interpreter. The cache can be populated ahead of time,
+    e.g. while building a container image, so that processes load the
+    validators without generating or compiling any code.
+    """
+    source_path = os.path.join(directory, f'validator_{key}.py')
+    code_path = os.path.join(directory, f'validator_{key}.{sys.implementation.cache_tag}.bin')
+    code = _read_code(code_path)
+    if code is None:
+        source = fastjsonschema.compile_to_code(schema)
+        code = compile(source, source_path, 'exec')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _write_atomic(source_path, source.encode())
+            _write_atomic(code_path, marshal.dumps(code))
+        except OSError as err:
+            # e.g. a read-only directory
+            _logger.warning(f'could not cache schema validator in {directory}: {err}')
+    namespace = {}
+    exec(code, namespace)
+    # the generated function is named after the id of the schema, if any
+    name = fastjsonschema.RefResolver.from_schema(schema, store={}).get_scope_name()
+    if name not in namespace:
+        return fastjsonschema.compile(schema)
+    return namespace[name]
+
+
+def _read_code(path):
+    try:
+        with open(path, 'rb') as f:
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        # missing or corrupt
+        return None
+
+
+def _write_atomic(path, content):
+    # other processes may be reading the same file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.validator-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
 class RequestSchema:
     def __init__(self, api_obj, description=None):
         self.api_obj = api_obj
@@ -28,6 +28,17 @@ error_messages = openapi.Array('An array of messages describing the error.', ite
 error_name = openapi.String('Name of the error')
 error_traceback = openapi.String('The error traceback')
 
+instance_error = openapi.Object(
+    'An instance of a batch that was not predicted on.',
+    properties={
+        'index': openapi.Integer('Position of the instance in the POST body.'),
+        'id': openapi.Integer('The ID of the instance, if it is an integer.'),
+        'messages': error_messages,
+    },
+    required=['index', 'messages'],
+    reference_name='InstanceError'
+)
+
 
 # define response objects determined by app configurations
 #=========================================================
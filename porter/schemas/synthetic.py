@@ -0,0 +1,185 @@
+"""Generate synthetic data conforming to schemas, e.g. request payloads for
+load tests, benchmarks and warm up requests.
+
+    >>> from porter.schemas import Integer, Object, String, synthetic_data
+    >>> feature_schema = Object(properties={
+    ...     'user_id': Integer(additional_params={'minimum': 1}),
+    ...     'genre': String(additional_params={'enum': ['comedy', 'drama']})})
+    >>> payload = synthetic_data(feature_schema, size=1000000, seed=0)
+
+Values are drawn at random but deterministically from ``seed``, honouring the
+type of each value, ``enum``, ``minimum``, ``maximum`` and their exclusive
+variants, ``minLength``, ``maxLength``, ``minItems``, ``maxItems`` and
+``required``. Other constraints, e.g. ``pattern``, are not supported. Data
+are generated one property at a time with NumPy, so that payloads of millions
+of instances are generated in seconds.
+"""
+
+import itertools
+
+import numpy as np
+
+from . import openapi
+
+
+# width of the ranges of numbers with at most one bound and default length of
+# strings
+_DEFAULT_RANGE = 100
+_DEFAULT_STRING_LENGTH = 8
+# probability that an optional property is present
+_OPTIONAL_PROBABILITY = 0.5
+
+_ALPHABET = np.frombuffer(b'abcdefghijklmnopqrstuvwxyz', dtype=np.uint8)
+
+
+def synthetic_data(schema, size=None, *, seed=0, definitions=None):
+    """Return data conforming to ``schema``.
+
+    Args:
+        schema (:class:`porter.schemas.ApiObject` or dict): The schema, either
+            as an object or as an OpenAPI schema, e.g. as found in the
+            documentation of an app at "/_docs.json".
+        size (int or None): If ``None`` a single value is returned, otherwise
+            a list of ``size`` values.
+        seed (int): Seed of the random number generator. The same schema,
+            size and seed always produce the same data.
+        definitions (dict or None): Maps the names of schemas referenced by
+            ``schema`` with "$ref" to their OpenAPI schemas, e.g.
+            "components/schemas" of the documentation of an app. Only needed
+            if ``schema`` is a dict containing references.
+
+    Returns:
+        The generated value, or a list of values if ``size`` is not ``None``.
+
+    Raises:
+        ValueError: If ``schema`` has a type that is not supported or its
+            constraints cannot be satisfied.
+    """
+    if isinstance(schema, openapi.ApiObject):
+        # without references
+        schema = schema._jsonschema
+    # RandomState produces the same values for a seed in all NumPy versions
+    rng = np.random.RandomState(seed)
+    values = _generate(schema, 1 if size is None else size, rng, definitions or {})
+    return values[0] if size is None else values
+
+
+def _generate(schema, size, rng, definitions):
+    """Return a list of ``size`` values conforming to ``schema``."""
+    if '$ref' in schema:
+        return _generate(definitions[schema['$ref'].rsplit('/', 1)[-1]], size, rng, definitions)
+    if 'enum' in schema:
+        # filled element-wise as the values may be lists themselves
+        enum = np.empty(len(schema['enum']), dtype=object)
+        enum[:] = list(schema['enum'])
+        return enum[rng.randint(0, len(enum), size)].tolist()
+    generate = _GENERATORS.get(schema.get('type'))
+    if generate is None:
+        raise ValueError(f'cannot generate data of type {schema.get("type")!r}')
+    return generate(schema, size, rng, definitions)
+
+
+def _range(schema):
+    """Return the bounds of a number as ``(low, low is exclusive, high, high
+    is exclusive)``."""
+    bounds = []
+    for bound, exclusive, sign in (('minimum', 'exclusiveMinimum', 1),
+                                   ('maximum', 'exclusiveMaximum', -1)):
+        value, is_exclusive = schema.get(bound), False
+        # exclusive bounds may be given as numbers (draft 6+) or booleans
+        # modifying minimum/maximum (draft 4)
+        exclusive_value = schema.get(exclusive)
+        if isinstance(exclusive_value, bool):
+            is_exclusive = exclusive_value and value is not None
+        elif exclusive_value is not None and (value is None or sign * (exclusive_value - value) >= 0):
+            value, is_exclusive = exclusive_value, True
+        bounds += [value, is_exclusive]
+    low, low_exclusive, high, high_exclusive = bounds
+    if low is None and high is None:
+        low, high = 0, _DEFAULT_RANGE
+    elif low is None:
+        low = high - _DEFAULT_RANGE
+    elif high is None:
+        high = low + _DEFAULT_RANGE
+    return low, low_exclusive, high, high_exclusive
+
+
+def _generate_integers(schema, size, rng, definitions):
+    low, low_exclusive, high, high_exclusive = _range(schema)
+    low = int(np.floor(low)) + 1 if low_exclusive else int(np.ceil(low))
+    high = int(np.ceil(high)) - 1 if high_exclusive else int(np.floor(high))
+    if low > high:
+        raise ValueError(f'no integer satisfies {schema}')
+    return rng.randint(low, high + 1, size, dtype=np.int64).tolist()
+
+
+def _generate_numbers(schema, size, rng, definitions):
+    low, low_exclusive, high, high_exclusive = _range(schema)
+    if low > high or (low == high and (low_exclusive or high_exclusive)):
+        raise ValueError(f'no number satisfies {schema}')
+    values = rng.uniform(low, high, size)
+    # rounding may produce values on or outside of the bounds
+    values = np.clip(values, np.nextafter(low, np.inf) if low_exclusive else low,
+                     np.nextafter(high, -np.inf) if high_exclusive else high)
+    return values.tolist()
+
+
+def _generate_booleans(schema, size, rng, definitions):
+    return (rng.random_sample(size) < 0.5).tolist()
+
+
+def _generate_strings(schema, size, rng, definitions):
+    min_length = schema.get('minLength', 0)
+    max_length = schema.get('maxLength', max(min_length, _DEFAULT_STRING_LENGTH))
+    if min_length > max_length:
+        raise ValueError(f'no string satisfies {schema}')
+    length = max(min_length, min(max_length, _DEFAULT_STRING_LENGTH))
+    if length == 0:
+        return [''] * size
+    # the characters of all strings are drawn at once and each row of the
+    # array is reinterpreted as a byte string
+    characters = _ALPHABET[rng.randint(0, len(_ALPHABET), (size, length))]
+    return characters.view(f'S{length}').ravel().astype(f'U{length}').tolist()
+
+
+def _generate_arrays(schema, size, rng, definitions):
+    # arrays are not empty unless they must be
+    min_items = schema.get('minItems', min(1, schema.get('maxItems', 1)))
+    max_items = schema.get('maxItems', min_items + 2)
+    if min_items > max_items:
+        raise ValueError(f'no array satisfies {schema}')
+    lengths = rng.randint(min_items, max_items + 1, size)
+    # the items of all arrays are generated at once
+    items = _generate(schema.get('items', {}), int(lengths.sum()), rng, definitions)
+    ends = np.cumsum(lengths).tolist()
+    return [items[end - length:end] for end, length in zip(ends, lengths.tolist())]
+
+
+def _generate_objects(schema, size, rng, definitions):
+    properties = schema.get('properties') or {}
+    if not properties:
+        return [{} for _ in range(size)]
+    required = set(schema.get('required', ()))
+    names = list(properties)
+    columns = [_generate(properties[name], size, rng, definitions) for name in names]
+    if required.issuperset(names):
+        return list(map(dict, map(zip, itertools.repeat(names), zip(*columns))))
+    for index, name in enumerate(names):
+        if name not in required:
+            present = (rng.random_sample(size) < _OPTIONAL_PROBABILITY).tolist()
+            columns[index] = [value if is_present else _MISSING
+                              for value, is_present in zip(columns[index], present)]
+    return [{name: value for name, value in zip(names, row) if value is not _MISSING}
+            for row in zip(*columns)]
+
+
+_MISSING = object()
+
+_GENERATORS = {
+    'integer': _generate_integers,
+    'number': _generate_numbers,
+    'boolean': _generate_booleans,
+    'string': _generate_strings,
+    'array': _generate_arrays,
+    'object': _generate_objects,
+}
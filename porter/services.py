@@ -20,25 +20,42 @@ example of running the app in production ``$ gunicorn my_module:model_app``.
 """
 
 import abc
+import collections
+import concurrent.futures
+import datetime
+import functools
 import json
 import logging
+import numbers
+import os
+import sys
+import threading
+import time
 import warnings
 
 import flask
+import numpy as np
 import pandas as pd
 import werkzeug.exceptions as werkzeug_exc
 
 from . import api
 from . import config as cf
 from . import constants as cn
+from . import metrics as porter_metrics
 from . import responses as porter_responses
 from . import schemas
+from . import timing
 from .exceptions import PorterException
 from . import __version__ as VERSION
 
 # alias for convenience
 _ID = cn.PREDICTION_PREDICTIONS_KEYS.ID
 
+# The components used by PredictionService to serve a request. They are kept
+# in a single immutable object so that a request that started before the
+# service was reloaded finishes with a consistent set of components.
+_Pipeline = collections.namedtuple('_Pipeline', ['model', 'preprocessor', 'postprocessor'])
+
 _logger = logging.getLogger(__name__)
 
 
@@ -112,11 +129,30 @@ class ServeReady(StatefulRoute):
 
     def __call__(self):
         """Serve readiness response."""
+        # services of an app created before the server forked its workers
+        # need to be loaded and warmed up in each worker.
+        self.app.start_warm_up()
         response = porter_responses.make_ready_response(self.app)
         self.logger.info(response.data)
         return response.jsonify()
 
 
+class ServeMetrics(StatefulRoute):
+    """Class for building stateful metrics routes.
+
+    Args:
+        app (object): A :class:`ModelApp` instance with ``expose_metrics=True``.
+            Instances of this class serve the metrics collected by ``app``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self):
+        """Serve the metrics in the Prometheus text format."""
+        return flask.Response(self.app.metrics.render(), content_type=porter_metrics.CONTENT_TYPE)
+
+
 class BaseService(abc.ABC, StatefulRoute):
     """
     A service class contains all necessary state and functionality to route a
@@ -140,6 +176,12 @@ class BaseService(abc.ABC, StatefulRoute):
         validate_response_data (bool): Whether to validate the response data
             or not.  Applies to all HTTP methods and does nothing if
             :meth:`add_response_schema()` is never called.
+        validation_sample_size (int or None): If not ``None`` and the request
+            data is an array only this many randomly sampled items, plus any
+            items failing a cheap check of their types, are validated. See
+            :meth:`porter.schemas.Array.validate_sample`. Intended for trusted
+            clients sending very large batches. Default is ``None``, i.e. all
+            items are validated.
 
     Attributes:
         id (str): A unique ID for the service.
@@ -156,6 +198,12 @@ class BaseService(abc.ABC, StatefulRoute):
         validate_response_data (bool): Whether to validate the response data
             or not.  Applies to all HTTP methods and does nothing if
             :meth:`add_response_schema()` is never called.
+        validation_sample_size (int or None): If not ``None`` and the request
+            data is an array only this many randomly sampled items, plus any
+            items failing a cheap check of their types, are validated. See
+            :meth:`porter.schemas.Array.validate_sample`. Intended for trusted
+            clients sending very large batches. Default is ``None``, i.e. all
+            items are validated.
         action (str): ``str`` describing the action of the service, e.g.
             "prediction". Used to determine the final routed endpoint.
         endpoint (str): The endpoint where the service is exposed.
@@ -185,7 +233,7 @@ class BaseService(abc.ABC, StatefulRoute):
 
     def __init__(self, *, name, api_version, meta=None, log_api_calls=False,
                  namespace='', validate_request_data=False,
-                 validate_response_data=False):
+                 validate_response_data=False, validation_sample_size=None):
         self.name = name
         self.api_version = api_version
         self.meta = {} if meta is None else meta
@@ -193,6 +241,11 @@ class BaseService(abc.ABC, StatefulRoute):
         self.namespace = namespace
         self.validate_request_data = validate_request_data
         self.validate_response_data = validate_response_data
+        if validation_sample_size is not None and (
+                not isinstance(validation_sample_size, numbers.Integral)
+                or validation_sample_size < 1):
+            raise ValueError('`validation_sample_size` must be a positive integer or None')
+        self.validation_sample_size = validation_sample_size
         if self.validate_response_data:
             warnings.warn('Setting ``validate_response_data`` may significantly '
                           'impact the latency of responses and return confusing '
@@ -233,6 +286,8 @@ class BaseService(abc.ABC, StatefulRoute):
         - Logging API requests.
         - Error handling.
         - Validation of response schemas.
+        - Recording stage timings if ``porter.config.record_stage_timings``
+          is ``True``.
 
         Returns:
             A "Response" object or ``None``: The output of ``self.serve()`` converted
@@ -243,6 +298,7 @@ class BaseService(abc.ABC, StatefulRoute):
         Raises:
             :class:`werkzeug.exceptions.HTTPException`
         """
+        start = time.perf_counter()
         # Default response is `null` in the event that an error occurs in
         # self.serve()
         response = None
@@ -255,6 +311,7 @@ class BaseService(abc.ABC, StatefulRoute):
         # This allows us to determine how to approach error handling in
         # resonses.py (or anywhere else for that matter).
         api.set_model_context(self)
+        timer = self._init_stage_timer()
         try:
             response = self.serve()
             # Allow users to return a JSON-like object instead of a `Response`.
@@ -283,7 +340,8 @@ class BaseService(abc.ABC, StatefulRoute):
             response = porter_responses.make_error_response(wrapped_error)
             raise wrapped_error from error
         finally:
-            response = response.jsonify()
+            with timer.time(timing.SERIALIZE):
+                response = response.jsonify()
 
             # log the original error, not necessarily the one we raised
             # (i.e. InternalServerError)
@@ -298,19 +356,47 @@ class BaseService(abc.ABC, StatefulRoute):
             if self.validate_response_data:
                 schema = self._response_schemas.get((api.request_method(), response.status_code))
                 if schema is not None:
-                    # eh, this is a bit of hack to work around
-                    # fastjsonschema not understanding how to validate numpy
-                    # types.
-                    # There is probably a better way to do this, but this validates
-                    # exactly what we want to and is a quick fix for a feature that
-                    # is experimental anyway.
-                    validation_data = response.data
-                    if response.headers.get('Content-Encoding', None) == 'gzip':
-                        validation_data = gzip.decompress(validation_data).decode('utf-8')
-                    schema.validate(json.loads(validation_data))
+                    # validate the data before they were serialized, schemas
+                    # accept the NumPy types returned by models.
+                    schema.validate(response.raw_data)
+
+            if timer.enabled:
+                timer.record(timing.TOTAL, time.perf_counter() - start)
+                if cf.record_stage_timings:
+                    self._report_stage_timings(response, timer)
 
         return response
 
+    def _init_stage_timer(self):
+        """Register a timer for the current request and return it."""
+        # a timer may have been registered already, e.g. by an app collecting
+        # metrics.
+        timer = api.stage_timer()
+        if not timer.enabled:
+            if not cf.record_stage_timings:
+                return timer
+            timer = timing.StageTimer()
+            api.set_stage_timer(timer)
+        request_start = api.request_header('X-Request-Start')
+        if request_start is not None:
+            queue_time = timing.parse_request_start(request_start)
+            if queue_time is not None:
+                timer.record(timing.QUEUE, queue_time)
+        return timer
+
+    def _report_stage_timings(self, response, timer):
+        """Add the ``Server-Timing`` header to ``response`` and pass the
+        timings on to ``porter.config.stage_timings_hook``."""
+        response.headers['Server-Timing'] = timer.server_timing_header()
+        if cf.stage_timings_hook is not None:
+            try:
+                cf.stage_timings_hook(self, timer.timings)
+            except Exception as err:
+                self._logger.exception(err,
+                    extra={'request_id': api.request_id(),
+                           'service_class': self.__class__.__name__,
+                           'event': 'exception'})
+
     def define_endpoint(self):
         """Return the service endpoint derived from instance attributes."""
         endpoint = cn.ENDPOINT_TEMPLATE.format(
@@ -335,6 +421,37 @@ class BaseService(abc.ABC, StatefulRoute):
     def status(self):
         """Return ``str`` representing the status of the service."""
 
+    def load(self):
+        """Load any components of the service whose loading was deferred to
+        the background.
+
+        This is called by :class:`ModelApp` in a background thread before
+        :meth:`warm_up`. By default it does nothing.
+        """
+
+    def warm_up(self, client):
+        """Send requests to the service to pay the latency penalty of the first
+        requests before it reports that it is ready.
+
+        This is called by :class:`ModelApp` when the service is added to an
+        app. By default it does nothing.
+
+        Args:
+            client (object): A test client of the app the service was added to,
+                e.g. an instance of ``flask.testing.FlaskClient``.
+        """
+
+    def compile_schemas(self):
+        """Compile the validators of the schemas the service validates data
+        against, which are otherwise compiled when first used. See
+        :meth:`porter.schemas.openapi.ApiObject.compile`."""
+        if self.validate_request_data:
+            for api_obj in self._request_schemas.values():
+                api_obj.compile()
+        if self.validate_response_data:
+            for api_obj in self._response_schemas.values():
+                api_obj.compile()
+
     @property
     def route_kwargs(self):
         """Keyword arguments to use when routing ``self.serve()``."""
@@ -438,12 +555,15 @@ class BaseService(abc.ABC, StatefulRoute):
         If ``self.validate_request_data is True`` and a request schema has
         been defined the data will be validated against the schema.
         """
-        data = api.request_json()
+        timer = api.stage_timer()
+        with timer.time(timing.DECODE):
+            data = api.request_json()
         if self.validate_request_data:
             schema = self._request_schemas.get('POST')
             if schema is not None:
                 try:
-                    schema.validate(data)
+                    with timer.time(timing.VALIDATE):
+                        self._validate_request_data(schema, data)
                 except ValueError as err:
                     if err.args[0].startswith('Schema validation failed'):
                         raise werkzeug_exc.UnprocessableEntity(*err.args)
@@ -451,6 +571,23 @@ class BaseService(abc.ABC, StatefulRoute):
                         raise err
         return data
 
+    def _validate_request_data(self, schema, data):
+        """Validate ``data`` against ``schema`` and register the number of
+        instances validated with :func:`porter.api.set_validated_count`, also
+        if ``data`` is invalid."""
+        n_instances = len(data) if isinstance(data, list) else 1
+        try:
+            if self.validation_sample_size is not None and isinstance(schema, schemas.Array):
+                validated = schema.validate_sample(data, self.validation_sample_size)
+            else:
+                schema.validate(data)
+                validated = n_instances
+        except ValueError as err:
+            # errors of sampled validation report the size of the sample
+            api.set_validated_count(getattr(err, 'validated_count', n_instances))
+            raise
+        api.set_validated_count(validated)
+
     def _log_api_call(self, request_data, response_data):
         self._logger.info('api logging',
             extra={'request_id': api.request_id(),
@@ -529,6 +666,15 @@ class PredictionService(BaseService):
             supported or not. If ``True`` the API will accept an array of objects
             to predict on. If ``False`` the API will only accept a single object
             per request. Optional.
+        partial_batch (bool): If ``True`` instances of a batch that fail
+            schema validation or ``additional_checks`` are left out instead
+            of failing the whole request with a 422 response. The remaining
+            instances are predicted on and the response reports the invalid
+            instances under "errors", see :obj:`porter.schemas.instance_error`.
+            ``additional_checks`` must then check each instance independently
+            of the others, as it is called on subsets of the batch to find
+            the failing instances. Requires ``batch_prediction=True``.
+            Default is ``False``.
         additional_checks (callable): If ``additional_checks`` raises a
             ``ValueError`` when called, a 422 UnprocessableEntity response
             will be returned to the user. This method allows users to
@@ -545,6 +691,23 @@ class PredictionService(BaseService):
             outputs if ``validate_request_data=True`` and document the API if
             added to an instance of :class:`ModelApp` where
             ``expose_docs=True``.
+        batch_chunk_size (int or None): If not ``None``, batches with more
+            than ``batch_chunk_size`` instances are split into chunks of at
+            most ``batch_chunk_size`` rows. Each chunk is preprocessed,
+            predicted on and postprocessed separately and the results are
+            concatenated, which bounds peak memory by the chunk size rather
+            than the request size. Optional.
+        batch_chunk_workers (int): Number of threads used to process chunks
+            concurrently. Only useful for models that release the GIL, e.g.
+            most numerical libraries. Ignored if ``batch_chunk_size`` is
+            ``None``. Default is 1, i.e. chunks are processed sequentially.
+        warm_up (list, bool or None): Request payloads sent through the full
+            pipeline by :meth:`warm_up` before the service reports that it is
+            ready, which avoids paying for the lazy initialization of the
+            underlying libraries on the first user requests. If ``True`` a
+            payload is generated from ``feature_schema`` with
+            :func:`porter.schemas.synthetic_data`. Until the service
+            is warmed up, its status is "WARMING". Optional.
         **kwargs: Keyword arguments passed on to :class:`BaseService`.
 
     Attributes:
@@ -575,6 +738,8 @@ class PredictionService(BaseService):
             predictions or not. If ``True`` the API will accept an array of
             objects to predict on. If ``False`` the API will only accept a
             single object per request. Optional.
+        partial_batch (bool): Whether invalid instances of a batch are
+            reported in the response instead of failing the request.
         additional_checks (callable): Raises ValueError or subclass thereof if
             POST request is invalid.
         feature_schema (:class:`porter.schemas.Object` or None): Description of an
@@ -591,28 +756,50 @@ class PredictionService(BaseService):
             ``batch_prediction=True``.  Can be used for validation outside of ``porter``.
         response_schema (:class:`porter.schemas.Object` or None) Description of valid
             POST 200 response format, including ``request_id``, ``model_context``, etc.
+        batch_chunk_size (int or None): Maximum number of instances passed
+            through the model pipeline at once.
+        batch_chunk_workers (int): Number of threads used to process chunks
+            concurrently.
+        warm_up_payloads (list): Request payloads sent to the service by
+            :meth:`warm_up`.
     """
 
     route_kwargs = {'methods': ['GET', 'POST'], 'strict_slashes': False}
     _service_default_schemas = [
         ('GET', 200, schemas.String(), None)
     ]
+    # services without warm up payloads are always warmed up
+    _warmed_up = True
+    _pipeline = _Pipeline(None, None, None)
 
     def __init__(self, *, model, preprocessor=None, postprocessor=None,
-                 action='prediction', batch_prediction=True,
+                 action='prediction', batch_prediction=True, partial_batch=False,
                  additional_checks=None, feature_schema=None,
-                 prediction_schema=None, **kwargs):
-        self.model = model
-        self.preprocessor = preprocessor
-        self.postprocessor = postprocessor
+                 prediction_schema=None, batch_chunk_size=None,
+                 batch_chunk_workers=1, warm_up=None, **kwargs):
+        # the model and processors are replaced together by reload(), see
+        # _Pipeline.
+        self._pipeline = _Pipeline(model, preprocessor, postprocessor)
         self.batch_prediction = batch_prediction
+        if partial_batch and not batch_prediction:
+            raise ValueError('`partial_batch` requires `batch_prediction=True`')
+        self.partial_batch = partial_batch
         if additional_checks is not None and not callable(additional_checks):
             raise ValueError('`additional_checks` must be callable')
+        if batch_chunk_size is not None and batch_chunk_size < 1:
+            raise ValueError('`batch_chunk_size` must be a positive integer or None')
+        if batch_chunk_workers < 1:
+            raise ValueError('`batch_chunk_workers` must be a positive integer')
         self._action = action
         self.additional_checks = additional_checks
-
-        self._preprocess_model_input = self.preprocessor is not None
-        self._postprocess_model_output = self.postprocessor is not None
+        self.batch_chunk_size = batch_chunk_size
+        self.batch_chunk_workers = batch_chunk_workers
+        # the executor is created lazily (see _get_chunk_executor()) so that
+        # no threads are started before a server forks its workers.
+        self._chunk_executor = None
+        self._chunk_executor_pid = None
+        self._chunk_executor_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
 
         # need to do this before handling schemas
         super().__init__(**kwargs)
@@ -629,11 +816,37 @@ class PredictionService(BaseService):
         # if None, we'll add the default schema anyway
         self._add_prediction_schema(self.prediction_schema)
 
+        if warm_up is True:
+            if self.feature_schema is None:
+                raise ValueError('`feature_schema` is required to generate warm up payloads')
+            warm_up = [self._make_warm_up_payload()]
+        self.warm_up_payloads = list(warm_up or [])
+        if self.warm_up_payloads:
+            self._warmed_up = False
+
     @property
     def status(self):
-        """Return 'READY'. Instances of this class are always ready."""
+        """Return 'LOADING' while components created with
+        ``lazy="background"`` (see :meth:`porter.datascience.WrappedModel.from_file`)
+        have not been loaded, 'WARMING' until the service has been warmed up
+        and 'READY' afterwards."""
+        if any(_is_loading(component) for component in self._components()):
+            return cn.HEALTH_CHECK_VALUES.IS_LOADING
+        if not self._warmed_up:
+            return cn.HEALTH_CHECK_VALUES.IS_WARMING
         return cn.HEALTH_CHECK_VALUES.IS_READY
 
+    def _components(self):
+        """Return the model and processors of the service."""
+        return [getattr(self, name, None) for name in ('model', 'preprocessor', 'postprocessor')]
+
+    def load(self):
+        """Load the components of the service whose loading was deferred to
+        the background."""
+        for component in self._components():
+            if _is_loading(component):
+                component.load()
+
     @property
     def action(self):
         """``str`` describing the action of the service. Used to
@@ -641,6 +854,81 @@ class PredictionService(BaseService):
         will become "/<namespace>/<name>/<api version>/<action>/"."""
         return self._action
 
+    @property
+    def model(self):
+        """The model. Use :meth:`reload` to replace it while serving requests."""
+        return self._pipeline.model
+
+    @model.setter
+    def model(self, model):
+        self._pipeline = self._pipeline._replace(model=model)
+
+    @property
+    def preprocessor(self):
+        """The preprocessor. Use :meth:`reload` to replace it while serving
+        requests."""
+        return self._pipeline.preprocessor
+
+    @preprocessor.setter
+    def preprocessor(self, preprocessor):
+        self._pipeline = self._pipeline._replace(preprocessor=preprocessor)
+
+    @property
+    def postprocessor(self):
+        """The postprocessor. Use :meth:`reload` to replace it while serving
+        requests."""
+        return self._pipeline.postprocessor
+
+    @postprocessor.setter
+    def postprocessor(self, postprocessor):
+        self._pipeline = self._pipeline._replace(postprocessor=postprocessor)
+
+    def reload(self, *, model=None, preprocessor=None, postprocessor=None, meta=None):
+        """Atomically replace the model and/or processors of the service.
+
+        Components that are not given are kept. If the service has
+        ``warm_up_payloads``, they are passed through the new components
+        before these replace the current ones, and the current components are
+        kept if this raises an exception. Requests being served while the
+        service is reloaded finish with the previous components.
+
+        The time of the reload is recorded in ``meta`` as "reloaded_at", which
+        is returned in the ``model_context`` of responses and health checks.
+
+        Args:
+            model (object or None): The new model.
+            preprocessor (object or None): The new preprocessor.
+            postprocessor (object or None): The new postprocessor.
+            meta (dict or None): Values to add to ``meta``, e.g. the versions
+                of the new components. Optional.
+        """
+        with self._reload_lock:
+            current = self._pipeline
+            pipeline = _Pipeline(
+                current.model if model is None else model,
+                current.preprocessor if preprocessor is None else preprocessor,
+                current.postprocessor if postprocessor is None else postprocessor)
+            for component in pipeline:
+                if _is_loading(component):
+                    component.load()
+            self._warm_up_pipeline(pipeline)
+            new_meta = {**self.meta, **(meta or {}),
+                        'reloaded_at': datetime.datetime.now().isoformat()}
+            self.check_meta(new_meta)
+            self._pipeline = pipeline
+            self.meta = new_meta
+        self._logger.info(
+            f'reloaded {self.endpoint}',
+            extra={'service_class': self.__class__.__name__,
+                   'event': 'reload'})
+
+    def _warm_up_pipeline(self, pipeline):
+        """Pass ``warm_up_payloads`` through ``pipeline``."""
+        for payload in self.warm_up_payloads:
+            X_input = pd.DataFrame(payload if self.batch_prediction else [payload])
+            X_features = X_input[self.feature_columns] if self.feature_columns else X_input
+            self._run_pipeline(X_input, X_features, pipeline=pipeline)
+
     def serve(self):
         """Retrive POST request data from flask and return a response
         containing the corresponding predictions.
@@ -664,10 +952,15 @@ class PredictionService(BaseService):
         return self._predict()
 
     def _predict(self):
+        if self.partial_batch:
+            return self._predict_partial_batch()
+
         # retrieve the data and validate the inputs. If
         # self.validate_request_data is True and a feature schema was
         # provided, the schema is vetted in get_post_data()
         X_input = self.get_post_data()
+        api.set_batch_size(len(X_input))
+        timer = api.stage_timer()
 
         # Only perform user checks after the schema has been (optionally)
         # validated. This way users don't need to do any error handling in
@@ -675,37 +968,203 @@ class PredictionService(BaseService):
         # If the user checks fail (ValueError raised) raise a 422.
         if self.additional_checks is not None:
             try:
-                self.additional_checks(X_input)
+                with timer.time(timing.ADDITIONAL_CHECKS):
+                    self.additional_checks(X_input)
             except ValueError as err:
                 raise werkzeug_exc.UnprocessableEntity(*err.args) from err
 
+        preds = self._predict_instances(X_input, timer)
+
+        # finally format the predictions and return
+        if self.batch_prediction:
+            response = porter_responses.make_batch_prediction_response(X_input[_ID], preds)
+        else:
+            response = porter_responses.make_prediction_response(X_input[_ID].iloc[0], preds[0])
+
+        return response
+
+    def _predict_partial_batch(self):
+        # invalid instances are collected in errors, keyed by their position
+        # in the request, and the remaining instances are predicted on at
+        # once.
+        X_input, errors = self._get_partial_batch_data()
+        api.set_batch_size(len(X_input) + len(errors))
+        timer = api.stage_timer()
+        if self.additional_checks is not None and len(X_input):
+            with timer.time(timing.ADDITIONAL_CHECKS):
+                failed = self._find_failed_checks(X_input)
+            if failed:
+                errors.update(failed)
+                X_input = X_input.drop(index=list(failed))
+                if len(X_input):
+                    # the remaining instances may still fail together, e.g.
+                    # checks of duplicates across the halves of the batch
+                    with timer.time(timing.ADDITIONAL_CHECKS):
+                        try:
+                            self.additional_checks(X_input)
+                        except ValueError as err:
+                            raise werkzeug_exc.UnprocessableEntity(*err.args) from err
+        X_input = X_input.reset_index(drop=True)
+        if len(X_input):
+            ids, preds = X_input[_ID], self._predict_instances(X_input, timer)
+        else:
+            ids, preds = [], []
+        errors = [errors[index] for index in sorted(errors)]
+        return porter_responses.make_batch_prediction_response(ids, preds, errors)
+
+    def _get_partial_batch_data(self):
+        """Return the instances of the POST data that conform to the request
+        schema as a ``pandas.DataFrame`` indexed by their position in the
+        request, and a ``dict`` mapping the positions of the other instances
+        to their errors."""
+        timer = api.stage_timer()
+        with timer.time(timing.DECODE):
+            data = api.request_json()
+        errors = {}
+        schema = self._request_schemas.get('POST')
+        if self.validate_request_data and schema is not None:
+            with timer.time(timing.VALIDATE):
+                try:
+                    self._validate_request_data(schema, data)
+                except ValueError as err:
+                    if not err.args[0].startswith('Schema validation failed'):
+                        raise err
+                    if not isinstance(data, list) or not isinstance(schema, schemas.Array):
+                        raise werkzeug_exc.UnprocessableEntity(*err.args)
+                    # only look for the invalid instances if there are any
+                    errors = self._validate_instances(schema.item_type, data)
+                    api.set_validated_count(len(data))
+        with timer.time(timing.DATAFRAME):
+            if not errors:
+                return pd.DataFrame(data), errors
+            positions = [index for index in range(len(data)) if index not in errors]
+            return pd.DataFrame([data[index] for index in positions], index=positions), errors
+
+    @staticmethod
+    def _validate_instances(item_schema, data):
+        """Validate each instance in ``data`` and return a ``dict`` mapping
+        the positions of the invalid instances to their errors."""
+        errors = {}
+        for index, instance in enumerate(data):
+            try:
+                item_schema.validate(instance)
+            except ValueError as err:
+                message = err.args[0].replace(': data', f': data[{index}]', 1)
+                instance_id = instance.get(_ID) if isinstance(instance, dict) else None
+                errors[index] = _instance_error(index, instance_id, [message])
+        return errors
+
+    def _find_failed_checks(self, X_input):
+        """Return a ``dict`` mapping the positions of the instances in
+        ``X_input`` failing ``additional_checks`` to their errors.
+
+        Batches failing the checks are split in halves until the failing
+        instances are isolated, so only a few calls are needed if few
+        instances fail.
+
+        Raises:
+            werkzeug.exceptions.UnprocessableEntity: If instances fail the
+                checks together but not on their own, e.g. checks of
+                duplicates.
+        """
+        try:
+            self.additional_checks(X_input)
+            return {}
+        except ValueError as err:
+            if len(X_input) == 1:
+                index = X_input.index[0]
+                return {index: _instance_error(index, X_input[_ID].iloc[0],
+                                               [str(arg) for arg in err.args])}
+            error = err
+        middle = len(X_input) // 2
+        failed = {**self._find_failed_checks(X_input.iloc[:middle]),
+                  **self._find_failed_checks(X_input.iloc[middle:])}
+        if not failed:
+            raise werkzeug_exc.UnprocessableEntity(*error.args) from error
+        return failed
+
+    def _predict_instances(self, X_input, timer):
+        """Return the predictions of the current pipeline on the validated
+        instances ``X_input``."""
         # Once the input data has been fully validated, extract the feature
         # columns (all features provided in ``feature_schema``) if provided.
         # This allows the user to fully anticipate what features are passed
         # to the preprocessor.
         if self.feature_columns:
-            X_preprocessed = X_input[self.feature_columns]
+            X_features = X_input[self.feature_columns]
+        else:
+            X_features = X_input
+
+        # large batches are optionally split into chunks to bound the memory
+        # used by the preprocessor and model.
+        # use the same pipeline for the entire request even if the service is
+        # reloaded concurrently.
+        pipeline = self._pipeline
+        if self.batch_chunk_size is not None and len(X_input) > self.batch_chunk_size:
+            preds = self._run_pipeline_chunked(X_input, X_features, timer, pipeline)
         else:
-            X_preprocessed = X_input
+            preds = self._run_pipeline(X_input, X_features, timer, pipeline)
+
+        return preds
+
+    def _run_pipeline(self, X_input, X_features, timer=timing.NULL_TIMER, pipeline=None):
+        """Preprocess ``X_features``, predict and postprocess with
+        ``pipeline``, which defaults to the current pipeline. Return the
+        predictions."""
+        if pipeline is None:
+            pipeline = self._pipeline
+        X_preprocessed = X_features
 
         # preprocess if user specified a preprocessor
-        if self._preprocess_model_input:
-            X_preprocessed = self.preprocessor.process(X_preprocessed)
+        if pipeline.preprocessor is not None:
+            with timer.time(timing.PREPROCESS):
+                X_preprocessed = pipeline.preprocessor.process(X_preprocessed)
 
         # get the predictions
-        preds = self.model.predict(X_preprocessed)
+        with timer.time(timing.PREDICT):
+            preds = self._model_predict(pipeline.model, X_preprocessed)
 
         # postprocess
-        if self._postprocess_model_output:
-            preds = self.postprocessor.process(X_input, X_preprocessed, preds)
-
-        # finally format the predictions and return
-        if self.batch_prediction:
-            response = porter_responses.make_batch_prediction_response(X_input[_ID], preds)
+        if pipeline.postprocessor is not None:
+            with timer.time(timing.POSTPROCESS):
+                preds = pipeline.postprocessor.process(X_input, X_preprocessed, preds)
+
+        return preds
+
+    def _model_predict(self, model, X):
+        """Return the predictions of ``model`` on the preprocessed input
+        ``X``."""
+        return model.predict(X)
+
+    def _run_pipeline_chunked(self, X_input, X_features, timer=timing.NULL_TIMER,
+                              pipeline=None):
+        """Run the pipeline on chunks of at most ``self.batch_chunk_size``
+        rows and concatenate the predictions of each chunk."""
+        chunk_size = self.batch_chunk_size
+        if pipeline is None:
+            pipeline = self._pipeline
+        # the timer is passed explicitly since worker threads do not share
+        # the request context.
+        def run_chunk(start):
+            stop = start + chunk_size
+            return self._run_pipeline(X_input.iloc[start:stop], X_features.iloc[start:stop],
+                                      timer, pipeline)
+        starts = range(0, len(X_input), chunk_size)
+        if self.batch_chunk_workers > 1:
+            chunks = list(self._get_chunk_executor().map(run_chunk, starts))
         else:
-            response = porter_responses.make_prediction_response(X_input[_ID].iloc[0], preds[0])
-
-        return response
+            chunks = [run_chunk(start) for start in starts]
+        return _concat_predictions(chunks)
+
+    def _get_chunk_executor(self):
+        # an executor inherited from a parent process has no running threads,
+        # so create a new one whenever we find ourselves in a new process.
+        with self._chunk_executor_lock:
+            if self._chunk_executor is None or self._chunk_executor_pid != os.getpid():
+                self._chunk_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.batch_chunk_workers)
+                self._chunk_executor_pid = os.getpid()
+            return self._chunk_executor
 
     def get_post_data(self):
         """Return data from the most recent POST request as a ``pandas.DataFrame``.
@@ -718,7 +1177,36 @@ class PredictionService(BaseService):
         data = super().get_post_data()
         if not self.batch_prediction:
             data = [data]
-        return pd.DataFrame(data)
+        with api.stage_timer().time(timing.DATAFRAME):
+            return pd.DataFrame(data)
+
+    def warm_up(self, client):
+        """Send each of ``warm_up_payloads`` to the service through ``client``
+        and mark the service as ready.
+
+        Responses with a status code other than 200 are logged but do not
+        prevent the service from becoming ready.
+
+        Args:
+            client (object): A test client of the app the service was added to,
+                e.g. an instance of ``flask.testing.FlaskClient``.
+        """
+        if self._warmed_up:
+            return
+        for payload in self.warm_up_payloads:
+            response = client.post(self.endpoint, data=json.dumps(payload, cls=cf.json_encoder))
+            if response.status_code != 200:
+                self._logger.warning(
+                    f'warm up request to {self.endpoint} returned status code {response.status_code}',
+                    extra={'service_class': self.__class__.__name__,
+                           'event': 'warm_up'})
+        self._warmed_up = True
+
+    def _make_warm_up_payload(self):
+        # a batch holds a single instance
+        if self.batch_prediction:
+            return schemas.synthetic_data(self.request_schema.item_type, size=1)
+        return schemas.synthetic_data(self.request_schema)
 
     def _add_feature_schema(self, user_schema):
         assert isinstance(user_schema, schemas.Object), '``feature_schema`` must be an Object'
@@ -749,13 +1237,15 @@ class PredictionService(BaseService):
         if self.batch_prediction:
             prediction_schema = schemas.Array(item_type=prediction_schema)
 
-        response_schema = schemas.Object(
-            properties={
-                'request_id': schemas.request_id,
-                'model_context': schemas.model_context,
-                'predictions': prediction_schema
-            }
-        )
+        response_properties = {
+            'request_id': schemas.request_id,
+            'model_context': schemas.model_context,
+            'predictions': prediction_schema
+        }
+        if self.partial_batch:
+            response_properties['errors'] = schemas.Array(
+                'Instances that were not predicted on.', item_type=schemas.instance_error)
+        response_schema = schemas.Object(properties=response_properties)
 
         # save this so the user can access it
         self.response_schema = response_schema
@@ -765,6 +1255,183 @@ class PredictionService(BaseService):
         self.add_response_schema('POST', 200, response_schema)
 
 
+class EnsemblePredictionService(PredictionService):
+    """
+    A prediction service combining the predictions of several models.
+
+    The request is validated and preprocessed once, after which each member
+    model predicts on the preprocessed input concurrently. The predictions of
+    the members are stacked into an array of shape ``(n_models, n_instances,
+    ...)`` and combined with ``reducer``. The latency of the ensemble is
+    therefore close to the latency of the slowest member rather than the sum
+    over all members.
+
+    Args:
+        models (list): Objects implementing the interface defined by
+            :class:`porter.datascience.BaseModel`.
+        reducer (str or callable): How the predictions of the members are
+            combined. One of "mean", "median", "min" or "max", or a callable
+            accepting the stacked predictions as a :obj:`numpy.ndarray` with
+            the members along the first axis and returning the combined
+            predictions. Default is "mean".
+        weights (list or None): Weights of each member used by the "mean"
+            reducer. Optional.
+        ensemble_workers (int or None): Number of workers calling the member
+            models. Defaults to the number of models.
+        ensemble_executor (str): Either "thread" or "process". Threads are
+            cheap and suitable for models that release the GIL, e.g. most
+            numerical libraries. Processes avoid contention for the GIL but
+            require models and inputs to be picklable, and copy the input to
+            the workers on each request. Default is "thread".
+        **kwargs: Keyword arguments passed on to :class:`PredictionService`,
+            except for ``model``.
+
+    Attributes:
+        models (list): The member models.
+        reducer (callable): Function combining the stacked predictions.
+        weights (list or None): Weights of each member.
+        ensemble_workers (int): Number of workers calling the member models.
+        ensemble_executor (str): Either "thread" or "process".
+    """
+
+    _reducers = {
+        'mean': np.mean,
+        'median': np.median,
+        'min': np.min,
+        'max': np.max,
+    }
+
+    def __init__(self, *, models, reducer='mean', weights=None,
+                 ensemble_workers=None, ensemble_executor='thread', **kwargs):
+        self.models = list(models)
+        if not self.models:
+            raise ValueError('`models` must contain at least one model')
+        if weights is not None and not (isinstance(reducer, str) and reducer == 'mean'):
+            raise ValueError('`weights` are only supported by the "mean" reducer')
+        if isinstance(reducer, str):
+            if reducer not in self._reducers:
+                raise ValueError(f'`reducer` must be callable or one of {sorted(self._reducers)}')
+            reducer = functools.partial(self._reducers[reducer], axis=0)
+        elif not callable(reducer):
+            raise ValueError('`reducer` must be a string or callable')
+        if weights is not None:
+            if len(weights) != len(self.models):
+                raise ValueError('`weights` must have the same length as `models`')
+            reducer = functools.partial(np.average, axis=0, weights=weights)
+        if ensemble_executor not in ('thread', 'process'):
+            raise ValueError('`ensemble_executor` must be "thread" or "process"')
+        if ensemble_workers is not None and ensemble_workers < 1:
+            raise ValueError('`ensemble_workers` must be a positive integer or None')
+        self.reducer = reducer
+        self.weights = weights
+        self.ensemble_workers = ensemble_workers or len(self.models)
+        self.ensemble_executor = ensemble_executor
+        # like the chunk executor the pool is created lazily and recreated in
+        # forked processes.
+        self._ensemble_pool = None
+        self._ensemble_pool_pid = None
+        self._ensemble_pool_lock = threading.Lock()
+        super().__init__(model=None, **kwargs)
+
+    def _components(self):
+        return [*self.models, self.preprocessor, self.postprocessor]
+
+    def reload(self, *, model=None, **kwargs):
+        """Atomically replace the processors of the service. See
+        :meth:`PredictionService.reload`.
+
+        Raises:
+            ValueError: If ``model`` is given, since the member models of an
+                ensemble cannot be reloaded.
+        """
+        if model is not None:
+            raise ValueError('the models of an EnsemblePredictionService cannot be reloaded')
+        super().reload(**kwargs)
+
+    def _model_predict(self, model, X):
+        """Return the combined predictions of the member models."""
+        if len(self.models) == 1:
+            member_preds = [self.models[0].predict(X)]
+        elif self.ensemble_executor == 'process' and _process_pool_initializer:
+            futures = [self._get_ensemble_pool().submit(_predict_ensemble_member, i, X)
+                       for i in range(len(self.models))]
+            member_preds = [future.result() for future in futures]
+        else:
+            futures = [self._get_ensemble_pool().submit(model.predict, X)
+                       for model in self.models]
+            member_preds = [future.result() for future in futures]
+        return self.reducer(np.stack([np.asarray(pred) for pred in member_preds]))
+
+    def _get_ensemble_pool(self):
+        with self._ensemble_pool_lock:
+            if self._ensemble_pool is None or self._ensemble_pool_pid != os.getpid():
+                if self.ensemble_executor == 'process' and _process_pool_initializer:
+                    # the models are sent to each worker once rather than
+                    # with every request.
+                    self._ensemble_pool = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.ensemble_workers,
+                        initializer=_init_ensemble_worker,
+                        initargs=(self.models,))
+                elif self.ensemble_executor == 'process':
+                    # before Python 3.7 the models are sent with each request
+                    # by submitting their bound predict methods.
+                    self._ensemble_pool = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.ensemble_workers)
+                else:
+                    self._ensemble_pool = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.ensemble_workers)
+                self._ensemble_pool_pid = os.getpid()
+            return self._ensemble_pool
+
+
+def _is_loading(component):
+    # components are duck-typed, so only trust an explicit True
+    return getattr(component, 'loading', False) is True
+
+
+# member models of the ensemble served by a worker process of
+# EnsemblePredictionService
+_ensemble_models = None
+
+# process pools accept an initializer from Python 3.7 on
+_process_pool_initializer = sys.version_info >= (3, 7)
+
+
+def _init_ensemble_worker(models):
+    global _ensemble_models
+    _ensemble_models = models
+
+
+def _predict_ensemble_member(index, X):
+    return _ensemble_models[index].predict(X)
+
+
+# CPU time of the current thread if the platform supports it
+_thread_time = getattr(time, 'thread_time', time.process_time)
+
+
+def _instance_error(index, instance_id, messages):
+    """Return the description of an invalid instance of a batch as reported
+    in the responses of services with ``partial_batch=True``."""
+    error = {cn.PREDICTION_ERRORS_KEYS.INDEX: int(index)}
+    # the ID may be missing or invalid itself
+    if isinstance(instance_id, numbers.Integral) and not isinstance(instance_id, bool):
+        error[cn.PREDICTION_ERRORS_KEYS.ID] = int(instance_id)
+    error[cn.PREDICTION_ERRORS_KEYS.MESSAGES] = messages
+    return error
+
+
+def _concat_predictions(chunks):
+    """Concatenate the predictions of each chunk of a batch into a single
+    object of the same type."""
+    first = chunks[0]
+    if isinstance(first, (pd.Series, pd.DataFrame)):
+        return pd.concat(chunks)
+    if isinstance(first, np.ndarray):
+        return np.concatenate(chunks)
+    return [pred for chunk in chunks for pred in chunk]
+
+
 class ModelApp:
     """
     Abstraction used to simplify building REST APIs that expose predictive
@@ -793,6 +1460,16 @@ class ModelApp:
             _not_ override `docs_prefix`.
         docs_prefix (str): Prefix to applied to all documentation endpoints.
             Must begin with a `/` and end without one.
+        expose_metrics (bool): If ``True`` metrics such as request counts,
+            latencies and batch sizes are collected and served in the
+            Prometheus text format at "/-/metrics". See :mod:`porter.metrics`
+            for aggregating metrics across worker processes. Default is
+            ``False``.
+        background_warm_up (bool): If ``True`` services are loaded and warmed
+            up (see :meth:`warm_up`) in a background thread so that the app
+            can serve health checks immediately. Otherwise services are
+            loaded and warmed up before the constructor returns. Default is
+            ``True``.
 
     Attributes:
         name (str): Name for the application.
@@ -807,6 +1484,8 @@ class ModelApp:
         docs_prefix (str): Prefix to applied to all documentation endpoints.
         docs_json (dict or None): The OpenAPI spec used to serve the Swagger
             documentation. `None` if `expose_docs` is `False`.
+        metrics (:class:`porter.metrics.AppMetrics` or None): The metrics
+            collected by the app. `None` if `expose_metrics` is `False`.
     """
 
     # note: eventually we may want to save this state somewhere else.
@@ -818,7 +1497,8 @@ class ModelApp:
     _health_check_response_schemas = {'GET': [schemas.ResponseSchema(schemas.health_check, 200)]}
 
     def __init__(self, services, *, name=None, description=None, version=None, meta=None,
-                 expose_docs=False, docs_url='/docs/', docs_json_url='/_docs.json', docs_prefix=''):
+                 expose_docs=False, docs_url='/docs/', docs_json_url='/_docs.json', docs_prefix='',
+                 expose_metrics=False, background_warm_up=True):
         self.services = services
         self.name = name
         self.meta = {} if meta is None else meta
@@ -831,6 +1511,7 @@ class ModelApp:
         self.docs_url = docs_prefix + docs_url
         self.docs_json_url = docs_prefix + docs_json_url
         self.docs_prefix = docs_prefix
+        self.metrics = porter_metrics.AppMetrics() if expose_metrics else None
         self.app = self._init_app()
 
         self._request_schemas = {}
@@ -846,6 +1527,15 @@ class ModelApp:
 
         self._build_app()
 
+        # the ID of the process in which services are being warmed up
+        self._warm_up_pid = None
+        self._warm_up_thread = None
+        self._warm_up_lock = threading.Lock()
+        if background_warm_up:
+            self.start_warm_up()
+        else:
+            self.warm_up()
+
     def __call__(self, *args, **kwargs):
         """Return a WSGI interface to the model app."""
         return self.app(*args, **kwargs)
@@ -860,6 +1550,70 @@ class ModelApp:
         """
         self.app.run(*args, **kwargs)
 
+    def compile_schemas(self):
+        """Compile the validators of all services of the app.
+
+        If ``porter.config.schema_cache_dir`` is set, the generated code is
+        cached in that directory and loaded by later processes instead of
+        being generated again. Calling this while building a container image
+        with a cache directory inside the image means that servers started
+        from the image load the validators without generating any code.
+        """
+        for service in self.services:
+            # getattr() allows duck-typed services
+            compile_schemas = getattr(service, 'compile_schemas', None)
+            if compile_schemas is not None:
+                compile_schemas()
+
+    def warm_up(self):
+        """Load and warm up all services of the app and block until they are
+        ready.
+
+        Components whose loading was deferred to the background are loaded
+        first (see :meth:`BaseService.load`). Each service is then sent
+        requests through a test client of the app (see
+        :meth:`BaseService.warm_up`), which runs the full pipeline from
+        decoding requests to serializing responses. Errors are logged.
+        """
+        client = self.app.test_client()
+        for service in self._warming_services():
+            try:
+                service.load()
+                service.warm_up(client)
+            except Exception as err:
+                _logger.exception(err, extra={'event': 'warm_up'})
+
+    def start_warm_up(self):
+        """Load and warm up all services of the app in a background thread.
+
+        Does nothing if all services are ready or if a warm up has already
+        been started in the current process.
+        """
+        with self._warm_up_lock:
+            if self._warm_up_pid == os.getpid():
+                return
+            if not self._warming_services():
+                return
+            self._warm_up_pid = os.getpid()
+            self._warm_up_thread = threading.Thread(
+                target=self.warm_up, name='porter-warm-up', daemon=True)
+            self._warm_up_thread.start()
+
+    def wait_for_warm_up(self, timeout=None):
+        """Block until a warm up started by :meth:`start_warm_up` in the
+        current process has finished, or until ``timeout`` seconds have passed.
+        Returns immediately if no warm up was started."""
+        with self._warm_up_lock:
+            thread = self._warm_up_thread if self._warm_up_pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+
+    def _warming_services(self):
+        # getattr() allows duck-typed services that do not define a status
+        return [service for service in self.services
+                if getattr(service, 'status', None) in (cn.HEALTH_CHECK_VALUES.IS_LOADING,
+                                                        cn.HEALTH_CHECK_VALUES.IS_WARMING)]
+
     def check_meta(self, meta):
         """Raise ``ValueError`` if ``meta`` contains invalid values, e.g. ``meta``
         cannot be converted to JSON properly.
@@ -912,6 +1666,11 @@ class ModelApp:
         for error in werkzeug_exc.default_exceptions:
             self.app.register_error_handler(error, serve_error_message)
 
+        # collect metrics of every request
+        if self.metrics is not None:
+            self.app.before_request(self._start_request_metrics)
+            self.app.after_request(self._observe_request_metrics)
+
         # route the health checks
         self._route_health_checks()
 
@@ -990,6 +1749,33 @@ class ModelApp:
                              response_schemas=response, additional_params=additional_params)
         self._route_endpoint(cn.READINESS_ENDPOINT, serve_ready, route_kwargs,
                              response_schemas=response, additional_params=additional_params)
+        if self.metrics is not None:
+            # the metrics are plain text and therefore not documented with
+            # the JSON endpoints.
+            self._route_endpoint(cn.METRICS_ENDPOINT, ServeMetrics(self), route_kwargs)
+
+    @staticmethod
+    def _start_request_metrics():
+        # registering a timer here makes services record stage timings even
+        # if porter.config.record_stage_timings is False.
+        api.set_stage_timer(timing.StageTimer())
+        flask.g.metrics_start = (time.perf_counter(), _thread_time())
+
+    def _observe_request_metrics(self, response):
+        start, cpu_start = flask.g.get('metrics_start', (None, None))
+        if start is None:
+            return response
+        service = api.get_model_context()
+        self.metrics.observe_request(
+            service.id if service is not None else '',
+            api.request_method(),
+            response.status_code,
+            time.perf_counter() - start,
+            _thread_time() - cpu_start,
+            stage_timings=api.stage_timer().timings,
+            batch_size=api.get_batch_size(),
+            validated_count=api.get_validated_count())
+        return response
 
     # TODO: perhaps this should be moved into the schemas module at some point
     # https://github.com/CadentTech/porter/issues/32
@@ -0,0 +1,127 @@
+"""Per-stage latency instrumentation of requests.
+
+When ``porter.config.record_stage_timings`` is ``True`` each request served by
+a service records how long each stage of serving the request took, e.g.
+decoding the request body, validating it against a schema, calling the model
+or serializing the response. The timings are returned to the client in a
+``Server-Timing`` header and passed to ``porter.config.stage_timings_hook``.
+"""
+
+import contextlib
+import time
+
+
+# Stage names recorded by porter.
+QUEUE = 'queue'
+DECODE = 'decode'
+VALIDATE = 'validate'
+ADDITIONAL_CHECKS = 'additional_checks'
+DATAFRAME = 'dataframe'
+PREPROCESS = 'preprocess'
+PREDICT = 'predict'
+POSTPROCESS = 'postprocess'
+SERIALIZE = 'serialize'
+TOTAL = 'total'
+
+
+class StageTimer:
+    """Record the duration of each stage of serving a request.
+
+    Durations are measured with :func:`time.perf_counter`. Stages recorded
+    more than once, e.g. when a batch is processed in chunks, are summed.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        # list.append() is atomic, which makes it safe to record stages from
+        # several threads, e.g. when chunks are processed concurrently.
+        self._records = []
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        """Context manager recording the time spent in the ``with`` block as
+        ``stage``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._records.append((stage, time.perf_counter() - start))
+
+    def record(self, stage, seconds):
+        """Record that ``stage`` took ``seconds``."""
+        self._records.append((stage, seconds))
+
+    @property
+    def timings(self):
+        """``dict`` mapping each stage to its duration in seconds, in the order
+        the stages were first recorded."""
+        timings = {}
+        for stage, seconds in list(self._records):
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        return timings
+
+    def server_timing_header(self):
+        """Return the timings formatted as the value of a ``Server-Timing``
+        header. Durations are given in milliseconds."""
+        return ', '.join(f'{stage};dur={seconds * 1000:.3f}'
+                         for stage, seconds in self.timings.items())
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullStageTimer:
+    """A timer with the same interface as :class:`StageTimer` that records
+    nothing. Used when instrumentation is disabled."""
+
+    enabled = False
+    timings = {}
+
+    def time(self, stage):
+        return _null_context
+
+    def record(self, stage, seconds):
+        pass
+
+    def server_timing_header(self):
+        return ''
+
+
+_null_context = _NullContext()
+
+NULL_TIMER = _NullStageTimer()
+
+
+def parse_request_start(value, now=None):
+    """Return the number of seconds a request spent queued before reaching
+    the application, or ``None`` if ``value`` cannot be parsed.
+
+    Args:
+        value (str): Value of an ``X-Request-Start`` header set by a proxy.
+            Both ``t=<timestamp>`` and bare timestamps are accepted. The
+            timestamp may be given in seconds, milliseconds or microseconds
+            since the epoch, e.g. as set by nginx, Heroku or Apache
+            respectively.
+        now (float): Current time in seconds since the epoch. Defaults to
+            ``time.time()``.
+    """
+    if now is None:
+        now = time.time()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        start = float(value)
+    except ValueError:
+        return None
+    # infer the unit from the order of magnitude of the timestamp
+    if start > 1e14:
+        start /= 1e6
+    elif start > 1e11:
+        start /= 1e3
+    return max(now - start, 0.0)
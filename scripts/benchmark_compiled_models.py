@@ -0,0 +1,82 @@
+"""Compare the latency of predictions and transformations of scikit-learn
+estimators with and without the fast paths of
+``porter.compiling.compile_model`` and ``porter.compiling.compile_transformer``.
+
+Each estimator is fitted on random data and predicts or transforms batches of
+each size from a ``pandas.DataFrame``, as it would in a ``porter`` service.
+
+    $ python scripts/benchmark_compiled_models.py --batch-sizes 1 10 100 --repeat 200
+"""
+
+import argparse
+import timeit
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn import compose, ensemble, linear_model, pipeline, preprocessing
+
+from porter.compiling import compile_model, compile_transformer
+
+
+def init_cli():
+    """Build the CLI, parse the CLI arguments and return as dict."""
+    cli = argparse.ArgumentParser(description='benchmark compiled scikit-learn models')
+    cli.add_argument('--n-features', type=int, default=20)
+    cli.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100])
+    cli.add_argument('--repeat', type=int, default=100)
+    return vars(cli.parse_args())
+
+
+def build_estimators(n_features):
+    """Return named estimators fitted on random numeric and categorical data
+    with their method, compiled method and data."""
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.normal(size=(5000, n_features)),
+                     columns=[f'x{i}' for i in range(n_features)])
+    y = X.to_numpy() @ rng.normal(size=n_features)
+    X_categorical = pd.DataFrame({f'c{i}': rng.choice(list('abcdefgh'), 5000)
+                                  for i in range(n_features)})
+    X_mixed = pd.concat([X, X_categorical], axis=1)
+    models = {
+        'linear regression': (linear_model.LinearRegression().fit(X, y), X),
+        'scaled logistic regression': (pipeline.make_pipeline(
+            preprocessing.StandardScaler(), linear_model.LogisticRegression()).fit(X, y > 0), X),
+        'one hot ridge': (pipeline.make_pipeline(
+            preprocessing.OneHotEncoder(handle_unknown='ignore'),
+            linear_model.Ridge()).fit(X_categorical, y), X_categorical),
+        'random forest (100 trees)': (ensemble.RandomForestRegressor(
+            n_estimators=100, max_depth=12, random_state=0).fit(X, y), X),
+    }
+    transformers = {
+        'standard scaler': (preprocessing.StandardScaler().fit(X), X),
+        'one hot encoder': (preprocessing.OneHotEncoder().fit(X_categorical), X_categorical),
+        'ordinal encoder': (preprocessing.OrdinalEncoder().fit(X_categorical), X_categorical),
+        'column transformer': (compose.make_column_transformer(
+            (preprocessing.StandardScaler(), list(X.columns)),
+            (preprocessing.OneHotEncoder(), list(X_categorical.columns))).fit(X_mixed), X_mixed),
+    }
+    estimators = {name: (model.predict, compile_model(model), X)
+                  for name, (model, X) in models.items()}
+    estimators.update({name: (transformer.transform, compile_transformer(transformer), X)
+                       for name, (transformer, X) in transformers.items()})
+    return estimators
+
+
+def main(n_features, batch_sizes, repeat):
+    print(f'{"estimator":>28} {"batch":>6} {"sklearn (ms)":>13} {"compiled (ms)":>14} '
+          f'{"speedup":>8}')
+    for name, (method, compiled_method, X) in build_estimators(n_features).items():
+        for batch_size in batch_sizes:
+            X_batch = X.iloc[:batch_size]
+            milliseconds = []
+            for function in (method, compiled_method):
+                seconds = min(timeit.repeat(lambda: function(X_batch), number=repeat, repeat=3))
+                milliseconds.append(1000 * seconds / repeat)
+            print(f'{name:>28} {batch_size:>6} {milliseconds[0]:>13.3f} {milliseconds[1]:>14.3f} '
+                  f'{milliseconds[0] / milliseconds[1]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    main(**init_cli())
@@ -0,0 +1,74 @@
+"""Compare the latency of predictions of a keras model loaded with
+``porter.loading.load_h5`` with ``model.predict()`` and with the fast path of
+``porter.compiling.compile_model``.
+
+The model is saved to and loaded from a ``.h5`` file. The numbers of threads
+given on the command line are set as ``porter.config.tensorflow_intra_op_threads``
+and ``porter.config.tensorflow_inter_op_threads``.
+
+    $ python scripts/benchmark_keras_inference.py --batch-sizes 1 10 100 --intra-op-threads 1
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+import numpy as np
+import tensorflow as tf
+
+from porter import config as cf
+from porter import loading
+from porter.compiling import compile_model
+
+
+def init_cli():
+    """Build the CLI, parse the CLI arguments and return as dict."""
+    cli = argparse.ArgumentParser(description='benchmark predictions of keras models')
+    cli.add_argument('--n-features', type=int, default=20)
+    cli.add_argument('--width', type=int, default=64, help='width of the hidden layers')
+    cli.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100])
+    cli.add_argument('--repeat', type=int, default=20)
+    cli.add_argument('--intra-op-threads', type=int, default=None)
+    cli.add_argument('--inter-op-threads', type=int, default=None)
+    return vars(cli.parse_args())
+
+
+def build_model(n_features, width):
+    return tf.keras.models.Sequential([
+        tf.keras.layers.Input((n_features,)),
+        tf.keras.layers.Dense(width, activation='relu'),
+        tf.keras.layers.Dense(width, activation='relu'),
+        tf.keras.layers.Dense(1),
+    ])
+
+
+def main(n_features, width, batch_sizes, repeat, intra_op_threads, inter_op_threads):
+    cf.tensorflow_intra_op_threads = intra_op_threads
+    cf.tensorflow_inter_op_threads = inter_op_threads
+    # building the model initializes TensorFlow, after which the numbers of
+    # threads cannot be changed by load_h5
+    loading._import_tensorflow()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'model.h5')
+        tf.keras.models.save_model(build_model(n_features, width), path)
+        model = loading.load_h5(path)
+    compiled_predict = compile_model(model)
+    print(f'intra op threads: {tf.config.threading.get_intra_op_parallelism_threads()}, '
+          f'inter op threads: {tf.config.threading.get_inter_op_parallelism_threads()} '
+          f'(0 is one per core)')
+    print(f'{"batch":>6} {"predict (ms)":>13} {"compiled (ms)":>14} {"speedup":>8}')
+    X = np.random.RandomState(0).normal(size=(max(batch_sizes), n_features))
+    for batch_size in batch_sizes:
+        X_batch = X[:batch_size]
+        milliseconds = []
+        for predict in (lambda X: model.predict(X, verbose=0), compiled_predict):
+            predict(X_batch)
+            seconds = min(timeit.repeat(lambda: predict(X_batch), number=repeat, repeat=3))
+            milliseconds.append(1000 * seconds / repeat)
+        print(f'{batch_size:>6} {milliseconds[0]:>13.3f} {milliseconds[1]:>14.3f} '
+              f'{milliseconds[0] / milliseconds[1]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main(**init_cli())
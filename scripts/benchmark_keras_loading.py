@@ -0,0 +1,74 @@
+"""Compare the time to load a keras ``.h5`` model downloaded from S3 through a
+temporary file and directly from memory.
+
+The download itself is excluded: the model is read into memory once, as
+``porter.loading.load_s3`` would download it, and each strategy then loads the
+model from those bytes, either by writing them to a temporary file that is
+loaded with ``porter.loading.load_h5`` (as ``load_file`` did previously) or by
+passing them to ``load_h5`` as an in-memory file (as ``load_file`` now does).
+
+    $ python scripts/benchmark_keras_loading.py --size-mb 200 --repeat 5
+"""
+
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+
+import tensorflow as tf
+
+from porter import loading
+
+
+def init_cli():
+    """Build the CLI, parse the CLI arguments and return as dict."""
+    cli = argparse.ArgumentParser(description='benchmark loading keras models from memory')
+    cli.add_argument('--size-mb', type=int, default=100)
+    cli.add_argument('--repeat', type=int, default=5)
+    cli.add_argument('--directory', type=str, default=None,
+                     help='directory of the temporary files, defaults to the system default')
+    return vars(cli.parse_args())
+
+
+def build_model(size_mb):
+    """Return a model with about ``size_mb`` MB of float32 weights."""
+    width = 1024
+    n_layers = max(1, size_mb * 1024 * 1024 // (4 * width * width))
+    layers = [tf.keras.layers.Input((width,))]
+    layers += [tf.keras.layers.Dense(width) for _ in range(n_layers)]
+    return tf.keras.models.Sequential(layers)
+
+
+def load_via_temporary_file(content, directory):
+    with tempfile.NamedTemporaryFile(suffix='.h5', dir=directory) as tmp:
+        tmp.write(content)
+        tmp.flush()
+        return loading.load_h5(tmp.name)
+
+
+def load_in_memory(content, directory):
+    return loading.load_h5(io.BytesIO(content))
+
+
+def main(size_mb, repeat, directory):
+    with tempfile.TemporaryDirectory(dir=directory) as tmpdir:
+        path = os.path.join(tmpdir, 'model.h5')
+        tf.keras.models.save_model(build_model(size_mb), path)
+        with open(path, 'rb') as f:
+            content = f.read()
+    print(f'model size: {len(content) / 1024 ** 2:.0f} MB, repeat: {repeat}')
+    print(f'{"strategy":>16} {"median (s)":>11} {"min (s)":>8}')
+    for name, load in [('temporary file', load_via_temporary_file),
+                       ('in memory', load_in_memory)]:
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            load(content, directory)
+            seconds.append(time.perf_counter() - start)
+        print(f'{name:>16} {statistics.median(seconds):>11.3f} {min(seconds):>8.3f}')
+
+
+if __name__ == '__main__':
+    main(**init_cli())
@@ -0,0 +1,100 @@
+"""Compare the memory used by worker processes loading the same model with and
+without memory-mapping its arrays.
+
+Each worker process loads the model with ``porter.loading.load_file``, touches
+every page of its arrays (as predictions would) and reports its memory usage.
+The resident set size (RSS) counts shared pages once per process, while the
+proportional set size (PSS) divides shared pages between the processes sharing
+them, so the total PSS of all workers is the memory actually used.
+
+Requires Linux (memory usage is read from /proc/<pid>/smaps_rollup).
+
+    $ python scripts/benchmark_mmap_memory.py --workers 8 --size-mb 500
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+import joblib
+import numpy as np
+
+from porter import loading
+
+
+class EmbeddingModel:
+    """A stand-in for a model with large arrays, e.g. an embedding table."""
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def predict(self, X):
+        return self.embeddings[X].sum(axis=1)
+
+
+def init_cli():
+    """Build the CLI, parse the CLI arguments and return as dict."""
+    cli = argparse.ArgumentParser(description='benchmark memory-mapped model loading')
+    cli.add_argument('--workers', type=int, default=4)
+    cli.add_argument('--size-mb', type=int, default=200)
+    cli.add_argument('--directory', type=str, default=None,
+                     help='directory in which the model is saved, defaults to a temporary directory')
+    return vars(cli.parse_args())
+
+
+def memory_usage_mb(pid='self'):
+    """Return the RSS and PSS of process ``pid`` in MB."""
+    usage = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            fields = line.split()
+            if fields[0] in ('Rss:', 'Pss:'):
+                usage[fields[0][:-1].lower()] = int(fields[1]) / 1024
+    return usage['rss'], usage['pss']
+
+
+def worker(path, mmap_mode, loaded, done):
+    model = loading.load_file(path, mmap_mode=mmap_mode)
+    # touch every page, as a prediction using the whole table would
+    model.embeddings.sum()
+    loaded.set()
+    # keep the model alive until the parent has measured all workers
+    done.wait()
+
+
+def measure(path, workers, mmap_mode):
+    """Start ``workers`` processes loading ``path`` and return the total RSS
+    and PSS of the workers in MB."""
+    context = multiprocessing.get_context('spawn')
+    done = context.Event()
+    processes = []
+    for _ in range(workers):
+        loaded = context.Event()
+        process = context.Process(target=worker, args=(path, mmap_mode, loaded, done))
+        process.start()
+        processes.append((process, loaded))
+    for _, loaded in processes:
+        loaded.wait()
+    # the baseline memory of an idle interpreter is included, which is the
+    # same with and without mmap_mode
+    usages = [memory_usage_mb(process.pid) for process, _ in processes]
+    done.set()
+    for process, _ in processes:
+        process.join()
+    return sum(rss for rss, _ in usages), sum(pss for _, pss in usages)
+
+
+def main(workers, size_mb, directory):
+    with tempfile.TemporaryDirectory(dir=directory) as tmpdir:
+        path = os.path.join(tmpdir, 'model.joblib')
+        n_rows = size_mb * 1024 * 1024 // (8 * 128)
+        joblib.dump(EmbeddingModel(np.random.rand(n_rows, 128)), path)
+        print(f'model size: {os.path.getsize(path) / 1024 ** 2:.0f} MB, workers: {workers}')
+        print(f'{"mmap_mode":>10} {"total RSS (MB)":>15} {"total PSS (MB)":>15}')
+        for mmap_mode in (None, 'r'):
+            rss, pss = measure(path, workers, mmap_mode)
+            print(f'{str(mmap_mode):>10} {rss:>15.0f} {pss:>15.0f}')
+
+
+if __name__ == '__main__':
+    main(**init_cli())
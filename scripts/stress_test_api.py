@@ -7,6 +7,8 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests as rq
 
+from porter.schemas import synthetic_data
+
 
 def stress_tests(fn=None, tests=[]):
     """Register or return all registered stress tests."""
@@ -39,20 +41,44 @@ def init_cli():
     cli.add_argument('--max-requests', type=int, default=201)
     cli.add_argument('--max-requests-skip-by', type=int, default=40)
     cli.add_argument('--batch-request-size', type=int, default=250)
-    cli.add_argument('--example-input', type=str, default='example_api_input.json')
-    cli.add_argument('--example-bad-input', type=str, default='example_api_bad_input.json')
+    cli.add_argument('--example-input', type=str, default=None,
+                     help='file containing a batch request, by default requests are generated '
+                          'from the request schema documented by the app')
+    cli.add_argument('--example-bad-input', type=str, default=None)
+    cli.add_argument('--docs-json-url', type=str, default='/_docs.json')
+    cli.add_argument('--seed', type=int, default=0)
     args = cli.parse_args()
     args.root_url = f'http://{args.host}:{args.port}'
     args.prediction_url = f'{args.root_url}/{args.model_name}/prediction'
     args.alive_url = f'{args.root_url}/-/alive'
     args.ready_url = f'{args.root_url}/-/ready'
-    with open(args.example_input) as f:
-        args.data = f.read()
-    with open(args.example_bad_input) as f:
-        args.bad_data = f.read()
+    if args.example_input is not None:
+        with open(args.example_input) as f:
+            instance = json.load(f)[0]
+        args.make_batch = lambda size: [instance] * size
+    else:
+        args.make_batch = batch_generator(f'{args.root_url}{args.docs_json_url}',
+                                          f'/{args.model_name}/prediction', args.seed)
+    args.data = json.dumps(args.make_batch(1))
+    if args.example_bad_input is not None:
+        with open(args.example_bad_input) as f:
+            args.bad_data = f.read()
+    else:
+        args.bad_data = json.dumps([{'id': None}])
     return dict(vars(args).items())
 
 
+def batch_generator(docs_json_url, endpoint, seed):
+    """Return a function generating batch requests of a given size from the
+    request schema of ``endpoint`` documented at ``docs_json_url``."""
+    spec = rq.get(docs_json_url).json()
+    paths = {path.rstrip('/'): path_spec for path, path_spec in spec['paths'].items()}
+    request_body = paths[endpoint.rstrip('/')]['post']['requestBody']
+    schema = request_body['content']['application/json']['schema']
+    definitions = spec.get('components', {}).get('schemas', {})
+    return lambda size: synthetic_data(schema['items'], size, seed=seed, definitions=definitions)
+
+
 @stress_tests
 def health_endpoints(root_url, alive_url, ready_url, **kwargs):
     """Sending GET requests to health endpoints."""
@@ -99,12 +125,10 @@ def hammer(prediction_url, data, max_requests, max_requests_skip_by, **kwargs):
 
 
 @stress_tests
-def mallet(prediction_url, data, max_requests, max_requests_skip_by,
+def mallet(prediction_url, make_batch, max_requests, max_requests_skip_by,
            batch_request_size, **kwargs):
     """Sending lots of big(ger) requests to the app concurrently."""
-    # inflate the data
-    data = json.dumps([json.loads(data)[0]
-                       for _ in range(batch_request_size)])
+    data = json.dumps(make_batch(batch_request_size))
     def get_prediction(url, data):
         response = rq.post(url, data=data)
         return response.status_code
@@ -35,6 +35,9 @@ REQUIRED = [
 EXTRAS_REQUIRED = {
     'keras-utils': ['tensorflow>=1.4.0'],
     's3-utils': ['boto3>=1.7.65'],
+    'onnx-utils': ['onnxruntime>=1.4.0'],
+    'xgboost-utils': ['xgboost>=1.1.0'],
+    'lightgbm-utils': ['lightgbm>=2.2.0'],
 }
 
 EXTRAS_REQUIRED['all'] = [r for requirements in EXTRAS_REQUIRED.values() for r in requirements]
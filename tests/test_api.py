@@ -6,6 +6,7 @@ import unittest
 from unittest import mock
 
 from porter import api
+from porter import timing
 import werkzeug.exceptions as werkzeug_exc
 
 
@@ -166,6 +167,21 @@ class TestEncodeResponse(unittest.TestCase):
                 self.assertEqual(r.raw_data, self.data)
                 encode_response.assert_not_called()
 
+class TestStageTimer(unittest.TestCase):
+    def test_outside_request(self):
+        self.assertIs(api.stage_timer(), timing.NULL_TIMER)
+        # should be a no-op
+        api.set_stage_timer(timing.StageTimer())
+
+    def test_request_context(self):
+        app = api.App(__name__)
+        with app.test_request_context():
+            self.assertIs(api.stage_timer(), timing.NULL_TIMER)
+            timer = timing.StageTimer()
+            api.set_stage_timer(timer)
+            self.assertIs(api.stage_timer(), timer)
+
+
 class TestValidate(unittest.TestCase):
 
     def test_validate_url(self):
@@ -5,6 +5,8 @@ Tests for the `.app` attribute belonging to an instance of `porter.ModelService`
 
 import json
 import re
+import threading
+import time
 import warnings
 
 import unittest
@@ -14,7 +16,8 @@ import flask
 from werkzeug import exceptions as exc
 from porter import __version__
 from porter import constants as cn
-from porter.datascience import BaseModel, BasePostProcessor, BasePreProcessor
+from porter.datascience import (BaseModel, BasePostProcessor, BasePreProcessor,
+                                WrappedModel)
 from porter.services import ModelApp, BaseService, PredictionService
 import porter.schemas as sc
 
@@ -780,6 +783,274 @@ class TestAppErrorHandling(unittest.TestCase):
         self.assertTrue(expected['error']['traceback'].search(actual['error']['traceback']))
 
 
+class TestAppStageTimings(unittest.TestCase):
+    @classmethod
+    @mock.patch('porter.services.BaseService._ids', set())
+    def setUpClass(cls):
+        class Preprocessor(BasePreProcessor):
+            def process(self, X):
+                return X
+        class Model(BaseModel):
+            def predict(self, X):
+                return X['feature1'] * 2
+        def checks(X):
+            pass
+        prediction_service = PredictionService(
+            model=Model(),
+            name='timed-model',
+            api_version='v1',
+            preprocessor=Preprocessor(),
+            additional_checks=checks,
+            feature_schema=sc.Object(properties={'feature1': sc.Number()}),
+            validate_request_data=True)
+        cls.app = ModelApp([prediction_service]).app.test_client()
+        cls.data = json.dumps([{'id': 1, 'feature1': 1}, {'id': 2, 'feature1': 2}])
+
+    @mock.patch('porter.services.cf.record_stage_timings', True)
+    def test_server_timing_header(self):
+        mock_hook = mock.Mock()
+        with mock.patch('porter.services.cf.stage_timings_hook', mock_hook):
+            resp = self.app.post('/timed-model/v1/prediction', data=self.data,
+                                 headers={'X-Request-Start': 't=1000000000.0'})
+        self.assertEqual(resp.status_code, 200)
+        header = resp.headers['Server-Timing']
+        actual_stages = [metric.split(';')[0] for metric in header.split(', ')]
+        expected_stages = ['queue', 'decode', 'validate', 'dataframe', 'additional_checks',
+                           'preprocess', 'predict', 'serialize', 'total']
+        self.assertEqual(actual_stages, expected_stages)
+        self.assertTrue(all(re.match(r'^\w+;dur=\d+\.\d{3}$', metric)
+                            for metric in header.split(', ')))
+        mock_hook.assert_called_once()
+        service, timings = mock_hook.call_args[0]
+        self.assertEqual(service.name, 'timed-model')
+        self.assertEqual(list(timings), expected_stages)
+
+    @mock.patch('porter.services.cf.record_stage_timings', True)
+    @mock.patch('porter.services.cf.stage_timings_hook', mock.Mock(side_effect=Exception))
+    def test_failing_hook(self):
+        resp = self.app.post('/timed-model/v1/prediction', data=self.data)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_disabled(self):
+        resp = self.app.post('/timed-model/v1/prediction', data=self.data)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('Server-Timing', resp.headers)
+
+
+class TestAppWarmUp(unittest.TestCase):
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_blocking_warm_up(self):
+        model = mock.Mock()
+        model.predict.side_effect = lambda X: X['feature1']
+        prediction_service = PredictionService(
+            model=model, name='warm-model', api_version='v1',
+            feature_schema=sc.Object(properties={'feature1': sc.Number()}),
+            validate_request_data=True, warm_up=True)
+        app = ModelApp([prediction_service], background_warm_up=False).app.test_client()
+        model.predict.assert_called_once()
+        resp = app.get('/-/ready')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)['services']['/warm-model/v1/prediction']['status'], 'READY')
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_background_warm_up(self):
+        first_request = threading.Event()
+        finish_warm_up = threading.Event()
+        class Model(BaseModel):
+            def predict(self, X):
+                first_request.set()
+                finish_warm_up.wait(5)
+                return X['feature1']
+        prediction_service = PredictionService(
+            model=Model(), name='warm-model', api_version='v1',
+            warm_up=[[{'id': 1, 'feature1': 1}]])
+        app = ModelApp([prediction_service]).app.test_client()
+        self.assertTrue(first_request.wait(5))
+        resp = app.get('/-/ready')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(json.loads(resp.data)['services']['/warm-model/v1/prediction']['status'], 'WARMING')
+        self.assertEqual(app.get('/-/alive').status_code, 200)
+        finish_warm_up.set()
+        for _ in range(100):
+            if prediction_service.status == 'READY':
+                break
+            time.sleep(0.05)
+        self.assertEqual(app.get('/-/ready').status_code, 200)
+
+
+class TestAppCompileSchemas(unittest.TestCase):
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_compile_schemas(self):
+        prediction_service = PredictionService(
+            model=mock.Mock(), name='compiled-model', api_version='v1',
+            feature_schema=sc.Object(properties={'feature1': sc.Number()}),
+            validate_request_data=True)
+        model_app = ModelApp([prediction_service])
+        self.assertIsNone(prediction_service.request_schema._validator)
+        model_app.compile_schemas()
+        self.assertIsNotNone(prediction_service.request_schema._validator)
+
+
+class TestAppPartialBatch(unittest.TestCase):
+    def setUp(self):
+        ids_patcher = mock.patch('porter.services.BaseService._ids', set())
+        ids_patcher.start()
+        self.addCleanup(ids_patcher.stop)
+        class Model(BaseModel):
+            def predict(self, X):
+                return X['feature1'] * 2
+        def additional_checks(X):
+            if (X['feature1'] > 100).any():
+                raise ValueError('feature1 is too large')
+        self.additional_checks = mock.Mock(side_effect=additional_checks)
+        self.prediction_service = PredictionService(
+            model=Model(), name='partial-model', api_version='v1',
+            feature_schema=sc.Object(properties={'feature1': sc.Number()}),
+            validate_request_data=True, validate_response_data=False,
+            additional_checks=self.additional_checks, partial_batch=True)
+        self.app = ModelApp([self.prediction_service], expose_docs=True).app.test_client()
+
+    def post(self, data):
+        resp = self.app.post('/partial-model/v1/prediction', data=json.dumps(data))
+        self.assertEqual(resp.status_code, 200)
+        body = json.loads(resp.data)
+        self.prediction_service.response_schema.validate(body)
+        return body
+
+    def test_partial_batch(self):
+        data = [{'id': i, 'feature1': i} for i in range(64)]
+        data[3]['feature1'] = 'a'
+        data[5] = {'feature1': 1}
+        data[40]['feature1'] = 1000
+        body = self.post(data)
+        self.assertEqual(body['predictions'],
+                         [{'id': i, 'prediction': 2 * i} for i in range(64) if i not in (3, 5, 40)])
+        self.assertEqual(body['errors'], [
+            {'index': 3, 'id': 3, 'messages': ['Schema validation failed: data[3].feature1 must be number']},
+            {'index': 5, 'messages': ['Schema validation failed: data[5] must contain [\'id\'] properties']},
+            {'index': 40, 'id': 40, 'messages': ['feature1 is too large']},
+        ])
+        # the failing instance is found by splitting the batch
+        self.assertLess(self.additional_checks.call_count, 20)
+
+    def test_partial_batch_valid(self):
+        body = self.post([{'id': 1, 'feature1': 1}])
+        self.assertEqual(body['predictions'], [{'id': 1, 'prediction': 2}])
+        self.assertEqual(body['errors'], [])
+        self.additional_checks.assert_called_once()
+
+    def test_partial_batch_all_invalid(self):
+        body = self.post([{'id': 1, 'feature1': 1000}, {'id': 2}])
+        self.assertEqual(body['predictions'], [])
+        self.assertEqual([error['index'] for error in body['errors']], [0, 1])
+
+    def test_partial_batch_not_row_wise(self):
+        def additional_checks(X):
+            if (X['feature1'] > 100).any():
+                raise ValueError('feature1 is too large')
+            if X['id'].duplicated().any():
+                raise ValueError('ids are not unique')
+        self.additional_checks.side_effect = additional_checks
+        # instances failing only together fail the request
+        for data in [[{'id': 1, 'feature1': 1}, {'id': 1, 'feature1': 2}],
+                     [{'id': 1, 'feature1': 1}, {'id': 2, 'feature1': 1000},
+                      {'id': 1, 'feature1': 2}, {'id': 3, 'feature1': 1000}]]:
+            resp = self.app.post('/partial-model/v1/prediction', data=json.dumps(data))
+            self.assertEqual(resp.status_code, 422)
+            self.assertIn('ids are not unique', json.loads(resp.data)['error']['messages'])
+
+    def test_partial_batch_not_array(self):
+        resp = self.app.post('/partial-model/v1/prediction', data=json.dumps({'id': 1, 'feature1': 1}))
+        self.assertEqual(resp.status_code, 422)
+
+    def test_partial_batch_docs(self):
+        spec = json.loads(self.app.get('/_docs.json').data)
+        response = spec['paths']['/partial-model/v1/prediction']['post']['responses']['200']
+        properties = response['content']['application/json']['schema']['properties']
+        self.assertEqual(properties['errors']['items'], {'$ref': '#/components/schemas/InstanceError'})
+        self.assertIn('InstanceError', spec['components']['schemas'])
+
+    def test_partial_batch_requires_batch_prediction(self):
+        with self.assertRaisesRegex(ValueError, 'partial_batch'):
+            PredictionService(model=mock.Mock(), name='partial-model-single', api_version='v1',
+                              batch_prediction=False, partial_batch=True)
+
+
+class TestAppLazyLoading(unittest.TestCase):
+    @mock.patch('porter.services.BaseService._ids', set())
+    @mock.patch('porter.datascience.load_file')
+    def test_background_loading(self, mock_load_file):
+        finish_loading = threading.Event()
+        class Model(BaseModel):
+            def predict(self, X):
+                return X['feature1']
+        def load_file(*args, **kwargs):
+            finish_loading.wait(5)
+            return Model()
+        mock_load_file.side_effect = load_file
+        model = WrappedModel.from_file('model.pkl', lazy='background')
+        prediction_service = PredictionService(
+            model=model, name='lazy-model', api_version='v1')
+        app = ModelApp([prediction_service]).app.test_client()
+        resp = app.get('/-/ready')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(json.loads(resp.data)['services']['/lazy-model/v1/prediction']['status'], 'LOADING')
+        self.assertEqual(app.get('/-/alive').status_code, 200)
+        finish_loading.set()
+        for _ in range(100):
+            if prediction_service.status == 'READY':
+                break
+            time.sleep(0.05)
+        self.assertEqual(app.get('/-/ready').status_code, 200)
+        resp = app.post('/lazy-model/v1/prediction', data=json.dumps([{'id': 1, 'feature1': 2}]))
+        self.assertEqual(json.loads(resp.data)['predictions'], [{'id': 1, 'prediction': 2}])
+
+
+class TestAppMetrics(unittest.TestCase):
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_metrics(self):
+        class Model(BaseModel):
+            def predict(self, X):
+                return X['feature1'] * 2
+        prediction_service = PredictionService(
+            model=Model(),
+            name='metered-model',
+            api_version='v1',
+            feature_schema=sc.Object(properties={'feature1': sc.Number()}),
+            validate_request_data=True)
+        app = ModelApp([prediction_service], expose_metrics=True).app.test_client()
+        data = json.dumps([{'id': 1, 'feature1': 1}, {'id': 2, 'feature1': 2}])
+        self.assertEqual(app.post('/metered-model/v1/prediction', data=data).status_code, 200)
+        self.assertEqual(app.post('/metered-model/v1/prediction', data='[{"id": 1}]').status_code, 422)
+        self.assertEqual(app.get('/-/alive').status_code, 200)
+
+        resp = app.get('/-/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers['Content-Type'].startswith('text/plain'))
+        lines = resp.data.decode('utf-8').splitlines()
+        service = 'service="/metered-model/v1/prediction"'
+        expected_lines = [
+            f'porter_requests_total{{{service},method="POST",status="200"}} 1.0',
+            f'porter_requests_total{{{service},method="POST",status="422"}} 1.0',
+            'porter_requests_total{service="",method="GET",status="200"} 1.0',
+            f'porter_request_errors_total{{{service},status="422"}} 1.0',
+            f'porter_request_duration_seconds_count{{{service}}} 2.0',
+            f'porter_request_stage_duration_seconds_count{{{service},stage="predict"}} 1.0',
+            f'porter_request_stage_duration_seconds_count{{{service},stage="validate"}} 2.0',
+            f'porter_request_batch_size_sum{{{service}}} 2.0',
+            f'porter_request_validated_instances_total{{{service}}} 3.0',
+            f'porter_request_cpu_seconds_count{{{service}}} 2.0',
+        ]
+        for line in expected_lines:
+            self.assertIn(line, lines)
+        # timings are recorded for metrics, but not returned to the user
+        self.assertNotIn('Server-Timing', app.post('/metered-model/v1/prediction', data=data).headers)
+
+    def test_metrics_not_exposed(self):
+        app = ModelApp([]).app.test_client()
+        self.assertEqual(app.get('/-/metrics').status_code, 404)
+
+
 @mock.patch('porter.services.porter_responses.api.request_id', lambda: 123)
 @mock.patch('porter.services.cf.return_message_on_error', True)
 @mock.patch('porter.services.cf.return_traceback_on_error', False)
@@ -0,0 +1,176 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import joblib
+from s3transfer.manager import TransferManager
+
+from porter import loading
+from porter.artifact_cache import ArtifactCache
+
+
+class FakeS3Client:
+    """A local stand-in for the parts of a boto3 S3 client used by porter."""
+
+    def __init__(self, download_delay=0):
+        self.objects = {}
+        self.downloads = []
+        self.download_delay = download_delay
+        self.corrupt_downloads = False
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Bucket, Key] = Body
+
+    def head_object(self, Bucket, Key):
+        body = self.objects[Bucket, Key]
+        return {'ETag': '"%s"' % hashlib.md5(body).hexdigest(), 'ContentLength': len(body)}
+
+    def download_file(self, Bucket, Key, Filename, ExtraArgs=None, Config=None):
+        body = self.objects[Bucket, Key]
+        # as boto3, which rejects other arguments
+        for name in ExtraArgs or {}:
+            if name not in TransferManager.ALLOWED_DOWNLOAD_ARGS:
+                raise ValueError(f'Invalid extra_args key {name!r}')
+        with self._lock:
+            self.downloads.append((Bucket, Key))
+        time.sleep(self.download_delay)
+        if self.corrupt_downloads:
+            body = bytes(reversed(body))
+        with open(Filename, 'wb') as f:
+            f.write(body)
+
+
+class TestArtifactCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, 'cache')
+        self.client = FakeS3Client()
+        self.client.put_object(Bucket='bucket', Key='model.pkl', Body=b'model contents')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def get(self, cache, key):
+        with cache.get(self.client, 'bucket', key) as path:
+            return path
+
+    def test_get(self):
+        cache = ArtifactCache(self.directory)
+        path1 = self.get(cache, 'model.pkl')
+        path2 = self.get(ArtifactCache(self.directory), 'model.pkl')
+        self.assertEqual(path1, path2)
+        self.assertEqual(self.read(path1), b'model contents')
+        self.assertEqual(self.client.downloads, [('bucket', 'model.pkl')])
+
+    def test_get_new_version(self):
+        cache = ArtifactCache(self.directory)
+        path1 = self.get(cache, 'model.pkl')
+        self.client.put_object(Bucket='bucket', Key='model.pkl', Body=b'new contents')
+        path2 = self.get(cache, 'model.pkl')
+        self.assertNotEqual(path1, path2)
+        self.assertEqual(self.read(path2), b'new contents')
+        self.assertEqual(len(self.client.downloads), 2)
+
+    def test_get_corrupt_entry(self):
+        cache = ArtifactCache(self.directory)
+        path = self.get(cache, 'model.pkl')
+        with open(path, 'wb') as f:
+            f.write(b'garbage')
+        with self.assertLogs('porter.artifact_cache', level='WARNING'):
+            path = self.get(cache, 'model.pkl')
+        self.assertEqual(self.read(path), b'model contents')
+        self.assertEqual(len(self.client.downloads), 2)
+
+    def test_get_checksum_mismatch(self):
+        self.client.corrupt_downloads = True
+        cache = ArtifactCache(self.directory)
+        with self.assertRaisesRegex(ValueError, 'does not match its ETag'):
+            self.get(cache, 'model.pkl')
+        self.assertEqual([name for name in os.listdir(self.directory)
+                          if not name.endswith('.lock')], [])
+
+    def test_get_concurrently(self):
+        self.client.download_delay = 0.1
+        cache = ArtifactCache(self.directory)
+        paths = []
+        def get():
+            paths.append(self.get(cache, 'model.pkl'))
+        threads = [threading.Thread(target=get) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(len(paths), 4)
+        self.assertEqual(len(self.client.downloads), 1)
+
+    def test_evict(self):
+        for i in range(3):
+            self.client.put_object(Bucket='bucket', Key=f'{i}.pkl', Body=bytes(10))
+        cache = ArtifactCache(self.directory, max_bytes=25)
+        path0 = self.get(cache, '0.pkl')
+        path1 = self.get(cache, '1.pkl')
+        # make sure 0.pkl is the most recently used
+        os.utime(path1, (0, 0))
+        path0 = self.get(cache, '0.pkl')
+        path2 = self.get(cache, '2.pkl')
+        self.assertTrue(os.path.exists(path0))
+        self.assertFalse(os.path.exists(path1))
+        self.assertTrue(os.path.exists(path2))
+        # the latest object is kept even if it exceeds the size of the cache
+        cache.max_bytes = 0
+        cache.evict(keep=os.path.basename(path2))
+        self.assertFalse(os.path.exists(path0))
+        self.assertTrue(os.path.exists(path2))
+
+    def test_evict_entry_in_use(self):
+        for i in range(2):
+            self.client.put_object(Bucket='bucket', Key=f'{i}.pkl', Body=bytes(10))
+        cache = ArtifactCache(self.directory, max_bytes=15)
+        path0 = self.get(cache, '0.pkl')
+        in_use, evicted = threading.Event(), threading.Event()
+        contents = []
+        def load():
+            with cache.get(self.client, 'bucket', '0.pkl') as path:
+                in_use.set()
+                evicted.wait(5)
+                contents.append(self.read(path))
+        thread = threading.Thread(target=load)
+        thread.start()
+        in_use.wait(5)
+        # another worker caching a new object cannot evict the object in use
+        os.utime(path0, (0, 0))
+        path1 = self.get(ArtifactCache(self.directory, max_bytes=15), '1.pkl')
+        self.assertTrue(os.path.exists(path0))
+        evicted.set()
+        thread.join()
+        self.assertEqual(contents, [bytes(10)])
+        # unused entries are evicted
+        cache.evict(keep=os.path.basename(path1))
+        self.assertFalse(os.path.exists(path0))
+
+    @mock.patch('porter.loading.cf.artifact_cache_max_bytes', None)
+    def test_load_file(self):
+        buffer = io.BytesIO()
+        joblib.dump({'a': 1}, buffer)
+        self.client.put_object(Bucket='bucket', Key='model.pkl', Body=buffer.getvalue())
+        with mock.patch('porter.loading.cf.artifact_cache_dir', self.directory), \
+                mock.patch('porter.loading._get_s3_client', return_value=self.client):
+            for _ in range(2):
+                actual = loading.load_file('s3://bucket/model.pkl', 'key-id', 'secret')
+                self.assertEqual(actual, {'a': 1})
+        self.assertEqual(len(self.client.downloads), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from scipy import sparse
+from sklearn import compose, ensemble, linear_model, pipeline, preprocessing, svm, tree
+
+from porter.compiling import compile_model, compile_transformer
+
+
+class TestCompileModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(0)
+        cls.X = pd.DataFrame(rng.normal(size=(300, 5)), columns=list('abcde'))
+        cls.y = cls.X.to_numpy() @ rng.normal(size=5) + rng.normal(size=300)
+        cls.y_binary = cls.y > 0
+        cls.y_classes = np.array(['x', 'y', 'z'])[np.digitize(cls.y, [-1, 1])]
+        cls.X_test = pd.DataFrame(2 * rng.normal(size=(100, 5)), columns=list('abcde'))
+        cls.categorical = pd.DataFrame({
+            'color': rng.choice(['red', 'green', 'blue'], 300),
+            'size': rng.choice([1.0, 2.0, np.nan], 300),
+            'shape': rng.choice(['round', 'square'], 300),
+        })
+
+    def assert_same_predictions(self, model, X, exact=True):
+        compiled_predict = compile_model(model)
+        self.assertIsNotNone(compiled_predict)
+        for X_test in [X, X.iloc[:1], X.to_numpy()]:
+            expected = model.predict(X_test)
+            actual = compiled_predict(X_test)
+            self.assertEqual(actual.dtype, expected.dtype)
+            if exact:
+                np.testing.assert_array_equal(actual, expected)
+            else:
+                np.testing.assert_allclose(actual, expected, rtol=1e-12, atol=1e-12)
+
+    def test_linear_models(self):
+        for model in [linear_model.LinearRegression(), linear_model.Ridge(),
+                      linear_model.Lasso(alpha=0.01), linear_model.ElasticNet(alpha=0.01),
+                      linear_model.SGDRegressor(random_state=0)]:
+            with self.subTest(model=model):
+                self.assert_same_predictions(model.fit(self.X, self.y), self.X_test)
+        for model in [linear_model.LogisticRegression(), linear_model.SGDClassifier(random_state=0),
+                      linear_model.Perceptron(random_state=0), svm.LinearSVC(random_state=0)]:
+            for y in [self.y_binary, self.y_classes]:
+                with self.subTest(model=model, n_classes=len(set(y))):
+                    self.assert_same_predictions(model.fit(self.X, y), self.X_test)
+
+    def test_trees(self):
+        for model in [tree.DecisionTreeRegressor(random_state=0),
+                      ensemble.RandomForestRegressor(n_estimators=20, random_state=0),
+                      ensemble.ExtraTreesRegressor(n_estimators=20, random_state=0)]:
+            with self.subTest(model=model):
+                self.assert_same_predictions(model.fit(self.X, self.y), self.X_test)
+        for model in [tree.DecisionTreeClassifier(random_state=0),
+                      ensemble.RandomForestClassifier(n_estimators=20, random_state=0),
+                      ensemble.ExtraTreesClassifier(n_estimators=20, random_state=0)]:
+            for y in [self.y_binary, self.y_classes]:
+                with self.subTest(model=model, n_classes=len(set(y))):
+                    self.assert_same_predictions(model.fit(self.X, y), self.X_test)
+
+    def test_pipelines(self):
+        model = pipeline.make_pipeline(
+            preprocessing.StandardScaler(), preprocessing.MinMaxScaler(clip=True),
+            preprocessing.MaxAbsScaler(), 'passthrough', linear_model.LogisticRegression())
+        self.assert_same_predictions(model.fit(self.X, self.y_classes), self.X_test)
+        X_test = self.categorical.sample(50, random_state=1)
+        for encoder in [preprocessing.OneHotEncoder(handle_unknown='ignore'),
+                        preprocessing.OneHotEncoder(drop='first', sparse_output=False),
+                        preprocessing.OneHotEncoder(drop='if_binary')]:
+            with self.subTest(encoder=encoder):
+                model = pipeline.make_pipeline(encoder, linear_model.Ridge())
+                # the dense one hot encoding may change the rounding
+                self.assert_same_predictions(model.fit(self.categorical, self.y), X_test,
+                                             exact=False)
+        for encoder in [preprocessing.OrdinalEncoder(),
+                        preprocessing.OrdinalEncoder(handle_unknown='use_encoded_value',
+                                                     unknown_value=-1, encoded_missing_value=-2)]:
+            with self.subTest(encoder=encoder):
+                model = pipeline.make_pipeline(
+                    encoder, ensemble.RandomForestRegressor(n_estimators=5, random_state=0))
+                self.assert_same_predictions(model.fit(self.categorical, self.y), X_test)
+
+    def test_unknown_categories(self):
+        X_test = self.categorical.iloc[:3].copy()
+        X_test['color'] = 'purple'
+        model = pipeline.make_pipeline(preprocessing.OneHotEncoder(handle_unknown='ignore'),
+                                       linear_model.Ridge()).fit(self.categorical, self.y)
+        np.testing.assert_allclose(compile_model(model)(X_test), model.predict(X_test))
+        model = pipeline.make_pipeline(preprocessing.OneHotEncoder(),
+                                       linear_model.Ridge()).fit(self.categorical, self.y)
+        with self.assertRaisesRegex(ValueError, 'unknown categor'):
+            compile_model(model)(X_test)
+
+    def test_fallback(self):
+        model = linear_model.LinearRegression().fit(self.X, self.y)
+        compiled_predict = compile_model(model)
+        X_nan = self.X_test.copy()
+        X_nan.iloc[0, 0] = np.nan
+        with self.assertRaisesRegex(ValueError, 'NaN'):
+            compiled_predict(X_nan)
+        with self.assertRaisesRegex(ValueError, 'feature names'):
+            compiled_predict(self.X_test[list('edcba')])
+        with self.assertRaisesRegex(ValueError, 'features'):
+            compiled_predict(self.X_test.to_numpy()[:, :3])
+        X_float32 = self.X_test.to_numpy(dtype=np.float32)
+        np.testing.assert_array_equal(compiled_predict(X_float32), model.predict(X_float32))
+
+    def test_unsupported(self):
+        self.assertIsNone(compile_model(linear_model.HuberRegressor().fit(self.X, self.y)))
+        self.assertIsNone(compile_model(pipeline.make_pipeline(
+            preprocessing.PolynomialFeatures(), linear_model.Ridge()).fit(self.X, self.y)))
+        multi_output = tree.DecisionTreeRegressor().fit(self.X, np.c_[self.y, self.y])
+        self.assertIsNone(compile_model(multi_output))
+        self.assertIsNone(compile_model(linear_model.Ridge()))
+
+    def test_column_transformer_pipeline(self):
+        X = pd.concat([self.X, self.categorical], axis=1)
+        model = pipeline.make_pipeline(
+            compose.make_column_transformer(
+                (preprocessing.StandardScaler(), list('abc')),
+                (preprocessing.OneHotEncoder(handle_unknown='ignore'), ['color', 'size']),
+                remainder='passthrough', sparse_threshold=0),
+            ensemble.RandomForestClassifier(n_estimators=10, random_state=0))
+        model.fit(X.drop(columns='shape'), self.y_classes)
+        compiled_predict = compile_model(model)
+        # the ColumnTransformer selects columns by name
+        for X_test in [X, X.iloc[:1]]:
+            np.testing.assert_array_equal(compiled_predict(X_test), model.predict(X_test))
+
+
+class TestCompileTransformer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(0)
+        cls.X = pd.DataFrame({
+            'color': rng.choice(['red', 'green', 'blue'], 200),
+            'size': rng.choice([1.0, 2.0, np.nan], 200),
+            'shape': rng.choice(['round', 'square'], 200),
+            'weight': rng.normal(size=200),
+            'count': rng.randint(0, 10, 200),
+        })
+        cls.categorical = ['color', 'size', 'shape']
+        cls.numeric = ['weight', 'count']
+
+    def assert_same_output(self, transformer, X):
+        compiled_transform = compile_transformer(transformer)
+        self.assertIsNotNone(compiled_transform)
+        for X_test in [X, X.iloc[:1], X.sample(frac=1, random_state=1)]:
+            expected = transformer.transform(X_test)
+            actual = compiled_transform(X_test)
+            self.assertIs(type(actual), type(expected))
+            self.assertEqual(actual.dtype, expected.dtype)
+            if sparse.issparse(expected):
+                self.assertEqual(actual.indices.dtype, expected.indices.dtype)
+                actual, expected = actual.toarray(), expected.toarray()
+            np.testing.assert_array_equal(actual, expected)
+
+    def test_scalers(self):
+        X = self.X[self.numeric]
+        for transformer in [preprocessing.StandardScaler(),
+                            preprocessing.StandardScaler(with_mean=False),
+                            preprocessing.MinMaxScaler(feature_range=(-1, 1), clip=True),
+                            preprocessing.MaxAbsScaler()]:
+            with self.subTest(transformer=transformer):
+                self.assert_same_output(transformer.fit(X), X)
+
+    def test_encoders(self):
+        X = self.X[self.categorical]
+        for transformer in [preprocessing.OneHotEncoder(),
+                            preprocessing.OneHotEncoder(sparse_output=False, dtype=np.int8),
+                            preprocessing.OneHotEncoder(drop='first'),
+                            preprocessing.OrdinalEncoder(),
+                            preprocessing.OrdinalEncoder(encoded_missing_value=-1)]:
+            with self.subTest(transformer=transformer):
+                self.assert_same_output(transformer.fit(X), X)
+
+    def test_column_transformer(self):
+        for transformer in [
+                compose.make_column_transformer(
+                    (preprocessing.StandardScaler(), self.numeric),
+                    (preprocessing.OneHotEncoder(), self.categorical)),
+                compose.make_column_transformer(
+                    (preprocessing.OneHotEncoder(sparse_output=False), ['color']),
+                    ('drop', ['size']), remainder='passthrough'),
+                compose.make_column_transformer(
+                    (preprocessing.OrdinalEncoder(), ['color', 'shape']),
+                    ('passthrough', ['weight']),
+                    remainder=preprocessing.MinMaxScaler()),
+                pipeline.make_pipeline(
+                    compose.make_column_transformer(
+                        (preprocessing.OrdinalEncoder(), self.categorical),
+                        remainder='passthrough'),
+                    preprocessing.StandardScaler())]:
+            with self.subTest(transformer=transformer):
+                self.assert_same_output(transformer.fit(self.X), self.X)
+        # columns are selected by name
+        X = self.X[self.X.columns[::-1]].assign(other=1)
+        self.assert_same_output(transformer, X)
+
+    def test_fallback(self):
+        transformer = compose.make_column_transformer(
+            (preprocessing.OneHotEncoder(), self.categorical)).fit(self.X)
+        compiled_transform = compile_transformer(transformer)
+        with self.assertRaisesRegex(ValueError, 'columns are missing'):
+            compiled_transform(self.X.drop(columns='color'))
+        X = self.X.iloc[:2].assign(color='purple')
+        with self.assertRaisesRegex(ValueError, 'unknown categor'):
+            compiled_transform(X)
+
+    def test_unsupported(self):
+        transformer = preprocessing.StandardScaler().set_output(transform='pandas')
+        self.assertIsNone(compile_transformer(transformer.fit(self.X[self.numeric])))
+        self.assertIsNone(compile_transformer(
+            preprocessing.PolynomialFeatures().fit(self.X[self.numeric])))
+        self.assertIsNone(compile_transformer(preprocessing.OneHotEncoder(
+            max_categories=2).fit(self.X[self.categorical])))
+
+
+class TestCompileKerasModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.X = np.random.RandomState(0).normal(size=(1500, 5))
+        cls.model = tf.keras.models.Sequential([
+            tf.keras.layers.Input((5,)),
+            tf.keras.layers.Dense(8, activation='relu'),
+            tf.keras.layers.Dropout(0.5),
+            tf.keras.layers.Dense(2),
+        ])
+
+    def test_predict(self):
+        compiled_predict = compile_model(self.model)
+        self.assertIsNotNone(compiled_predict)
+        # batches of all sizes, including batches that are split
+        for X in [self.X, self.X[:1], self.X[:7], self.X.tolist()[:3],
+                  pd.DataFrame(self.X[:3]), self.X.astype(np.float32)]:
+            expected = self.model.predict(np.asarray(X), verbose=0)
+            actual = compiled_predict(X)
+            self.assertEqual(actual.dtype, expected.dtype)
+            np.testing.assert_allclose(actual, expected, rtol=1e-6, atol=1e-6)
+
+    def test_fallback(self):
+        with mock.patch.object(self.model, 'predict') as mock_predict:
+            compiled_predict = compile_model(self.model)
+            for X in [self.X[:, :3], self.X[:0], np.array([['a'] * 5])]:
+                self.assertIs(compiled_predict(X), mock_predict.return_value)
+                mock_predict.assert_called_with(X)
+
+    def test_unsupported(self):
+        inputs = [tf.keras.layers.Input((5,)), tf.keras.layers.Input((3,))]
+        outputs = tf.keras.layers.Dense(1)(tf.keras.layers.Concatenate()(inputs))
+        self.assertIsNone(compile_model(tf.keras.Model(inputs, outputs)))
+
+        class Subclassed(tf.keras.Model):
+            def call(self, X):
+                return X
+        self.assertIsNone(compile_model(Subclassed()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,25 @@
+import pickle
+import threading
+import time
 import unittest
 from unittest import mock
 
+import numpy as np
+from sklearn import linear_model, preprocessing
+
 from porter.datascience import (BaseModel, BasePostProcessor, BasePreProcessor,
                                 WrappedModel, WrappedTransformer)
 
 
+class AddOne:
+    # defined at module level so that it can be pickled
+    def predict(self, X):
+        return X + 1
+
+    def transform(self, X):
+        return X + 1
+
+
 class TestBaseModel(unittest.TestCase):
     def test_abc(self):
         class A(BaseModel): pass
@@ -27,6 +42,118 @@ class TestWrappedModel(unittest.TestCase):
     def test_from_file_keras(self):
         pass
 
+    @mock.patch('porter.datascience.load_files')
+    def test_from_files(self, mock_load_files):
+        class A:
+            def predict(self, X):
+                pass
+        objs = [A(), A()]
+        mock_load_files.return_value = objs
+        progress = mock.Mock()
+        models = WrappedModel.from_files(['a.pkl', 'b.pkl'], max_workers=2, progress=progress)
+        self.assertEqual([model.model for model in models], objs)
+        mock_load_files.assert_called_once_with(
+            ['a.pkl', 'b.pkl'], max_workers=2, progress=progress,
+            s3_access_key_id=None, s3_secret_access_key=None, mmap_mode=None, shared=False)
+
+    @mock.patch('porter.datascience.load_file')
+    def test_from_file_lazy(self, mock_load_file):
+        class A:
+            def predict(self, X):
+                return X + 1
+        mock_load_file.return_value = A()
+        model = WrappedModel.from_file('a.pkl')
+        self.assertTrue(model.loaded)
+        self.assertFalse(model.loading)
+        for lazy in ('request', 'background'):
+            mock_load_file.reset_mock()
+            model = WrappedModel.from_file('a.pkl', lazy=lazy)
+            mock_load_file.assert_not_called()
+            self.assertFalse(model.loaded)
+            self.assertEqual(model.loading, lazy == 'background')
+            self.assertEqual(model.predict(1), 2)
+            self.assertTrue(model.loaded)
+            self.assertFalse(model.loading)
+            model.load()
+            mock_load_file.assert_called_once_with('a.pkl', None, None, mmap_mode=None,
+                                                   shared=False)
+        with self.assertRaisesRegex(ValueError, 'lazy must be'):
+            WrappedModel.from_file('a.pkl', lazy='later')
+
+    @mock.patch('porter.datascience.load_file')
+    def test_from_file_shared(self, mock_load_file):
+        class A:
+            def predict(self, X):
+                return X + 1
+        mock_load_file.return_value = A()
+        model1 = WrappedModel.from_file('a.pkl', shared=True)
+        model2 = WrappedModel.from_file('b.pkl', shared=True)
+        mock_load_file.assert_called_with('b.pkl', None, None, mmap_mode=None, shared=True)
+        self.assertIsNot(model1, model2)
+        self.assertIs(model1.model, model2.model)
+
+    @mock.patch('porter.datascience.load_file')
+    def test_lazy_load_concurrently(self, mock_load_file):
+        class A:
+            def predict(self, X):
+                return X
+        def load_file(*args, **kwargs):
+            time.sleep(0.05)
+            return A()
+        mock_load_file.side_effect = load_file
+        model = WrappedModel.from_file('a.pkl', lazy='background')
+        threads = [threading.Thread(target=model.load) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        mock_load_file.assert_called_once()
+        self.assertTrue(model.loaded)
+
+    @mock.patch('porter.datascience.compiling.compile_model')
+    @mock.patch('porter.datascience.load_file')
+    def test_compile(self, mock_load_file, mock_compile_model):
+        mock_model = mock.Mock()
+        mock_load_file.return_value = mock_model
+        model = WrappedModel.from_file('a.pkl', lazy='request', compile=True)
+        mock_compile_model.assert_not_called()
+        self.assertEqual(model.predict(1), mock_compile_model.return_value.return_value)
+        mock_compile_model.assert_called_once_with(mock_model)
+        mock_model.predict.assert_not_called()
+        # unsupported models are used as they are
+        mock_compile_model.return_value = None
+        model.model = mock_model
+        self.assertEqual(model.predict(1), mock_model.predict.return_value)
+        model = WrappedModel(mock_model)
+        model.predict(1)
+        self.assertEqual(mock_compile_model.call_count, 2)
+
+    @mock.patch('porter.datascience.load_file', lambda *args, **kwargs: AddOne())
+    def test_pickle(self):
+        model = WrappedModel.from_file('a.pkl', lazy='request')
+        model.load()
+        unpickled = pickle.loads(pickle.dumps(model))
+        self.assertIsInstance(unpickled.model, AddOne)
+        # the state of wrappers pickled by earlier versions
+        model = WrappedModel.__new__(WrappedModel)
+        model.__setstate__({'model': AddOne()})
+        self.assertIsInstance(model.model, AddOne)
+        self.assertEqual(model.predict(1), 2)
+
+    def test_pickle_compiled(self):
+        X, y = np.arange(6.0).reshape(3, 2), np.arange(3.0)
+        model = WrappedModel(linear_model.LinearRegression().fit(X, y), compile=True)
+        unpickled = pickle.loads(pickle.dumps(model))
+        self.assertIsNotNone(unpickled._compiled_predict)
+        np.testing.assert_array_equal(unpickled.predict(X), model.predict(X))
+
+    @mock.patch('porter.datascience.load_file', lambda *args, **kwargs: object())
+    def test_lazy_model_validation(self):
+        model = WrappedModel.from_file('a.pkl', lazy='request')
+        with self.assertRaisesRegex(TypeError, 'model must have a .predict'):
+            model.load()
+        self.assertFalse(model.loaded)
+
     def test_model_validation(self):
         class A:
             pass
@@ -67,6 +194,57 @@ class TestWrappedTransformer(unittest.TestCase):
         expected = 2
         self.assertEqual(actual, expected)
 
+    @mock.patch('porter.datascience.compiling.compile_transformer')
+    def test_compile(self, mock_compile_transformer):
+        mock_transformer = mock.Mock()
+        processor = WrappedTransformer(mock_transformer, compile=True)
+        mock_compile_transformer.assert_called_once_with(mock_transformer)
+        self.assertEqual(processor.process(1), mock_compile_transformer.return_value.return_value)
+        mock_transformer.transform.assert_not_called()
+        # unsupported transformers are used as they are
+        mock_compile_transformer.return_value = None
+        processor.transformer = mock_transformer
+        self.assertEqual(processor.process(1), mock_transformer.transform.return_value)
+
+    @mock.patch('porter.datascience.load_file')
+    def test_from_file_lazy(self, mock_load_file):
+        class A:
+            def transform(self, X):
+                return X + 1
+        mock_load_file.return_value = A()
+        processor = WrappedTransformer.from_file('a.pkl', lazy='background')
+        mock_load_file.assert_not_called()
+        self.assertTrue(processor.loading)
+        self.assertEqual(processor.process(1), 2)
+        self.assertFalse(processor.loading)
+
+    @mock.patch('porter.datascience.load_file', lambda *args, **kwargs: AddOne())
+    def test_pickle(self):
+        processor = WrappedTransformer.from_file('a.pkl', lazy='background')
+        processor.load()
+        self.assertIsInstance(pickle.loads(pickle.dumps(processor)).transformer, AddOne)
+        processor = WrappedTransformer.__new__(WrappedTransformer)
+        processor.__setstate__({'transformer': AddOne()})
+        self.assertIsInstance(processor.transformer, AddOne)
+        self.assertEqual(processor.process(1), 2)
+
+    def test_pickle_compiled(self):
+        X = np.arange(6.0).reshape(3, 2)
+        processor = WrappedTransformer(preprocessing.StandardScaler().fit(X), compile=True)
+        unpickled = pickle.loads(pickle.dumps(processor))
+        self.assertIsNotNone(unpickled._compiled_transform)
+        np.testing.assert_array_equal(unpickled.process(X), processor.process(X))
+
+    @mock.patch('porter.datascience.load_files')
+    def test_from_files(self, mock_load_files):
+        class A:
+            def transform(self, X):
+                pass
+        objs = [A(), A()]
+        mock_load_files.return_value = objs
+        processors = WrappedTransformer.from_files(['a.pkl', 'b.pkl'])
+        self.assertEqual([processor.transformer for processor in processors], objs)
+
     def test_transformer_validation(self):
         class A:
             pass
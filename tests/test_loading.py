@@ -1,6 +1,14 @@
+import gc
+import importlib.util
+import io
 import os
+import shutil
 import tempfile
+import threading
 import unittest
+import weakref
+import zipfile
+from unittest import mock
 
 import boto3
 import numpy as np
@@ -10,6 +18,12 @@ from porter import loading
 import joblib
 
 
+class Model:
+    # defined at module level so that it can be pickled
+    def __init__(self, value):
+        self.value = value
+
+
 class BaseTestLoading(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -108,6 +122,98 @@ class TestLoadingKeras(BaseTestLoading):
         self.assertTrue(np.allclose(actual_predictions, expected_predictions))
 
 
+class TestLoadingKerasInMemory(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.X = np.random.rand(10, 20).astype('float32')
+        cls.model = tf.keras.models.Sequential([
+            tf.keras.layers.Input((20,)),
+            tf.keras.layers.Dense(20),
+            tf.keras.layers.Dense(1)
+        ])
+        cls.predictions = cls.model.predict(cls.X, verbose=0)
+        with tempfile.NamedTemporaryFile(suffix='.h5') as tmp:
+            tf.keras.models.save_model(cls.model, tmp.name)
+            with open(tmp.name, 'rb') as f:
+                cls.h5_content = f.read()
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def zip_saved_model(self, subdirectory=''):
+        directory = os.path.join(self.tmpdir.name, 'saved_model', subdirectory)
+        if hasattr(self.model, 'export'):
+            self.model.export(directory, verbose=False)
+        else:
+            tf.saved_model.save(self.model, directory)
+        archive = shutil.make_archive(os.path.join(self.tmpdir.name, 'model'), 'zip',
+                                      os.path.join(self.tmpdir.name, 'saved_model'))
+        shutil.rmtree(os.path.join(self.tmpdir.name, 'saved_model'))
+        return archive
+
+    def test_load_h5_stream(self):
+        loaded_model = loading.load_h5(io.BytesIO(self.h5_content))
+        self.assertTrue(np.allclose(loaded_model.predict(self.X, verbose=0), self.predictions))
+
+    def test_load_h5_stream_without_legacy_loader(self):
+        # keras has moved its private modules before
+        with mock.patch.dict('sys.modules', {'keras.src.legacy.saving': None}), \
+                self.assertLogs('porter.loading', 'WARNING'):
+            loaded_model = loading.load_h5(io.BytesIO(self.h5_content))
+        self.assertTrue(np.allclose(loaded_model.predict(self.X, verbose=0), self.predictions))
+
+    def test_load_file_s3_h5_in_memory(self):
+        def download_fileobj(bucket, key, stream, Config):
+            stream.write(self.h5_content)
+        mock_client = mock.Mock()
+        mock_client.download_fileobj.side_effect = download_fileobj
+        with mock.patch('porter.loading._get_s3_client', return_value=mock_client), \
+                mock.patch('porter.loading.cf.artifact_cache_dir', None):
+            loaded_model = loading.load_file('s3://bucket/model.h5', 'key-id', 'secret')
+        self.assertTrue(np.allclose(loaded_model.predict(self.X, verbose=0), self.predictions))
+        mock_client.download_file.assert_not_called()
+
+    def test_load_saved_model_zip(self):
+        archive = self.zip_saved_model()
+        loaded_model = loading.load_file(archive)
+        self.assertTrue(np.allclose(loaded_model.predict(self.X), self.predictions, atol=1e-6))
+        with open(archive, 'rb') as f:
+            loaded_model = loading.load_saved_model(io.BytesIO(f.read()))
+        self.assertTrue(np.allclose(loaded_model.predict(self.X), self.predictions, atol=1e-6))
+
+    def test_load_saved_model_zip_subdirectory(self):
+        archive = self.zip_saved_model('model')
+        loaded_model = loading.load_saved_model(archive)
+        self.assertTrue(np.allclose(loaded_model.predict(self.X), self.predictions, atol=1e-6))
+
+    def test_threads(self):
+        threading_config = mock.Mock()
+        threading_config.get_intra_op_parallelism_threads.return_value = 0
+        threading_config.get_inter_op_parallelism_threads.return_value = 2
+        with mock.patch('tensorflow.config.threading', threading_config), \
+                mock.patch('porter.loading.cf.tensorflow_intra_op_threads', 1), \
+                mock.patch('porter.loading.cf.tensorflow_inter_op_threads', 2):
+            loaded_model = loading.load_h5(io.BytesIO(self.h5_content))
+        threading_config.set_intra_op_parallelism_threads.assert_called_once_with(1)
+        threading_config.set_inter_op_parallelism_threads.assert_not_called()
+        self.assertTrue(np.allclose(loaded_model.predict(self.X, verbose=0), self.predictions))
+        # TensorFlow has been initialized by the tests
+        with mock.patch('porter.loading.cf.tensorflow_intra_op_threads', 1), \
+                self.assertLogs('porter.loading', 'WARNING') as logs:
+            loading.load_h5(io.BytesIO(self.h5_content))
+        self.assertIn('cannot use 1 intra_op threads', logs.output[0])
+
+    def test_load_saved_model_fail(self):
+        archive = os.path.join(self.tmpdir.name, 'model.zip')
+        with zipfile.ZipFile(archive, 'w') as f:
+            f.writestr('model.pkl', b'')
+        with self.assertRaisesRegex(ValueError, 'does not contain a SavedModel'):
+            loading.load_file(archive)
+
+
 class TestLoadingS3(BaseTestLoading):
     def test_load_s3(self):
         content = 'foo bar baz'
@@ -145,5 +251,254 @@ class TestLoadingS3(BaseTestLoading):
         self.assertEqual(actual_key, expected_key)
 
 
+
+class TestLoadFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(4):
+            path = os.path.join(self.tmpdir.name, f'obj{i}.pkl')
+            joblib.dump({'i': i}, path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_files(self):
+        calls = []
+        actual = loading.load_files(self.paths, max_workers=2,
+                                    progress=lambda *args: calls.append(args))
+        self.assertEqual(actual, [{'i': i} for i in range(4)])
+        self.assertEqual([call[:2] for call in calls], [(i, 4) for i in range(1, 5)])
+        self.assertEqual(sorted(call[2].path for call in calls), self.paths)
+        for call in calls:
+            self.assertGreaterEqual(call[2].fetch_seconds, 0)
+            self.assertGreaterEqual(call[2].load_seconds, 0)
+        self.assertEqual(loading.load_files([]), [])
+
+    def test_load_files_concurrently(self):
+        # each load blocks until all files are being loaded, i.e. this only
+        # succeeds if the files are loaded concurrently
+        barrier = threading.Barrier(4, timeout=5)
+        joblib_load = joblib.load
+        def blocking_load(path, mmap_mode=None):
+            barrier.wait()
+            return joblib_load(path, mmap_mode)
+        with mock.patch('porter.loading.joblib.load', blocking_load):
+            actual = loading.load_files(self.paths, max_workers=4)
+        self.assertEqual(actual, [{'i': i} for i in range(4)])
+
+    def test_load_file_mmap(self):
+        path = os.path.join(self.tmpdir.name, 'arrays.joblib')
+        joblib.dump({'weights': np.arange(10.0)}, path)
+        actual = loading.load_file(path, mmap_mode='r')
+        self.assertIsInstance(actual['weights'], np.memmap)
+        self.assertEqual(actual['weights'].mode, 'r')
+        self.assertEqual(actual['weights'].tolist(), list(range(10)))
+        with self.assertRaises(ValueError):
+            actual['weights'][0] = 1
+        actual = loading.load_files([path], mmap_mode='r')[0]
+        self.assertIsInstance(actual['weights'], np.memmap)
+        actual = loading.load_file(path)
+        self.assertNotIsInstance(actual['weights'], np.memmap)
+
+    @mock.patch('porter.loading._shared_objects', weakref.WeakValueDictionary())
+    def test_load_file_shared(self):
+        paths = [os.path.join(self.tmpdir.name, f'model{i}.pkl') for i in range(3)]
+        for path, value in zip(paths, [1, 1, 2]):
+            joblib.dump(Model(value), path)
+        model = loading.load_file(paths[0], shared=True)
+        # files with the same content share a single object
+        self.assertIs(loading.load_file(paths[1], shared=True), model)
+        self.assertIsNot(loading.load_file(paths[2], shared=True), model)
+        self.assertIsNot(loading.load_file(paths[1]), model)
+        # the loader options are part of the key
+        self.assertIsNot(loading.load_file(paths[1], shared=True, mmap_mode='r'), model)
+        models = loading.load_files(paths, shared=True, max_workers=3)
+        self.assertIs(models[0], model)
+        self.assertIs(models[1], model)
+        self.assertEqual(models[2].value, 2)
+        # objects are freed once no longer referenced
+        self.assertEqual(len(loading._shared_objects), 2)
+        del model, models
+        gc.collect()
+        self.assertEqual(len(loading._shared_objects), 0)
+        self.assertEqual(loading._shared_key_locks, {})
+
+    def test_load_file_shared_not_weakrefable(self):
+        actual1 = loading.load_file(self.paths[0], shared=True)
+        actual2 = loading.load_file(self.paths[0], shared=True)
+        self.assertEqual(actual1, actual2)
+        self.assertIsNot(actual1, actual2)
+
+    def test_load_files_fail(self):
+        unknown_path = os.path.join(self.tmpdir.name, 'model.txt')
+        with open(unknown_path, 'w') as f:
+            f.write('foo bar baz')
+        with self.assertRaisesRegex(ValueError, 'unkown file type'):
+            loading.load_files(self.paths + [unknown_path])
+        with self.assertRaisesRegex(ValueError, 's3_access_key_id'):
+            loading.load_files(['s3://bucket/model.pkl'])
+
+
+
+class TestLoaderRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        # loaders registered by the tests are discarded
+        patcher = mock.patch('porter.loading._loaders', list(loading._loaders))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, filename, content):
+        path = os.path.join(self.tmpdir.name, filename)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_register_loader_extension(self):
+        path = self.write('model.CSV', b'a,b')
+        loader = mock.Mock()
+        loading.register_loader(loader, extensions=['.csv'])
+        self.assertIs(loading.load_file(path), loader.return_value)
+        loader.assert_called_once_with(path)
+        # registered loaders replace the built-in loaders
+        path = self.write('model.pkl', b'')
+        loading.register_loader(loader, extensions=['.pkl'], accepts_mmap_mode=True)
+        loading.load_file(path, mmap_mode='r')
+        loader.assert_called_with(path, mmap_mode='r')
+
+    def test_register_loader_sniff(self):
+        path = self.write('model', b'MYFORMAT\x00\x01')
+        loader = mock.Mock()
+        sniff = mock.Mock(side_effect=lambda header: header.startswith(b'MYFORMAT'))
+        loading.register_loader(loader, sniff=sniff)
+        self.assertIs(loading.load_file(path), loader.return_value)
+        sniff.assert_called_once_with(b'MYFORMAT\x00\x01')
+        # files with a known extension are not sniffed
+        path = self.write('model.pkl', b'MYFORMAT')
+        with self.assertRaises(Exception):
+            loading.load_file(path)
+        sniff.assert_called_once()
+
+    def test_register_loader_fail(self):
+        with self.assertRaisesRegex(ValueError, 'at least one'):
+            loading.register_loader(mock.Mock())
+        with self.assertRaisesRegex(ValueError, 'must start with'):
+            loading.register_loader(mock.Mock(), extensions=['pkl'])
+
+    def test_sniff_builtin(self):
+        path = os.path.join(self.tmpdir.name, 'model')
+        joblib.dump({'a': 1}, path)
+        self.assertEqual(loading.load_file(path), {'a': 1})
+        joblib.dump({'a': 2}, path, compress=3)
+        self.assertEqual(loading.load_file(path), {'a': 2})
+        joblib.dump({'a': 3}, path, compress='gzip')
+        self.assertEqual(loading.load_file(path), {'a': 3})
+        path = self.write('model.bin', b'\x89HDF\r\n\x1a\n\x00')
+        with mock.patch('porter.loading.load_h5') as mock_load_h5:
+            loading.register_loader(mock_load_h5, sniff=loading._sniff_h5)
+            self.assertIs(loading.load_file(path), mock_load_h5.return_value)
+        path = self.write('model.txt', b'tree\nversion=v3\n')
+        with mock.patch('porter.loading.load_lightgbm') as mock_load_lightgbm:
+            loading.register_loader(mock_load_lightgbm, sniff=loading._sniff_lightgbm)
+            self.assertIs(loading.load_file(path), mock_load_lightgbm.return_value)
+
+
+class TestOnnxModel(unittest.TestCase):
+    def test_predict(self):
+        session = mock.Mock()
+        session.get_inputs.return_value = [mock.Mock(type='tensor(float)')]
+        session.get_inputs.return_value[0].name = 'X'
+        session.run.return_value = [np.array([[1.0], [2.0]])]
+        model = loading.OnnxModel(session)
+        actual = model.predict([[1, 2], [3, 4]])
+        self.assertEqual(actual.tolist(), [1.0, 2.0])
+        X = session.run.call_args[0][1]['X']
+        self.assertEqual(X.dtype, np.float32)
+        self.assertEqual(X.tolist(), [[1, 2], [3, 4]])
+        self.assertEqual(model.transform([[1, 2], [3, 4]]).shape, (2, 1))
+
+    @unittest.skipUnless(importlib.util.find_spec('onnxruntime')
+                         and importlib.util.find_spec('skl2onnx'),
+                         'requires onnxruntime and skl2onnx')
+    def test_load_file_onnx(self):
+        import skl2onnx
+        from skl2onnx.common.data_types import FloatTensorType
+        X = np.random.rand(10, 3)
+        model = sklearn.linear_model.LinearRegression().fit(X, X.sum(axis=1))
+        onnx_model = skl2onnx.convert_sklearn(model, initial_types=[('X', FloatTensorType([None, 3]))])
+        with tempfile.NamedTemporaryFile(suffix='.onnx') as tmp:
+            tmp.write(onnx_model.SerializeToString())
+            tmp.flush()
+            loaded_model = loading.load_file(tmp.name)
+        self.assertTrue(np.allclose(loaded_model.predict(X), model.predict(X), atol=1e-5))
+
+
+class TestLoadingBoosters(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.X = np.random.rand(50, 3)
+        cls.y = cls.X.sum(axis=1)
+
+    @unittest.skipUnless(importlib.util.find_spec('xgboost'), 'requires xgboost')
+    def test_load_file_xgboost(self):
+        import xgboost
+        model = xgboost.XGBRegressor(n_estimators=5).fit(self.X, self.y)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'model.ubj')
+            model.save_model(path)
+            loaded_model = loading.load_file(path)
+        self.assertIsInstance(loaded_model, loading.XGBoostModel)
+        self.assertTrue(np.allclose(loaded_model.predict(self.X), model.predict(self.X)))
+
+    @unittest.skipUnless(importlib.util.find_spec('lightgbm'), 'requires lightgbm')
+    def test_load_file_lightgbm(self):
+        import lightgbm
+        model = lightgbm.LGBMRegressor(n_estimators=5).fit(self.X, self.y)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # lightgbm models are identified by their content
+            path = os.path.join(tmpdir, 'model.txt')
+            model.booster_.save_model(path)
+            loaded_model = loading.load_file(path)
+        self.assertTrue(np.allclose(loaded_model.predict(self.X), model.predict(self.X)))
+
+
+class TestDownloadS3(unittest.TestCase):
+    def setUp(self):
+        loading._s3_clients.clear()
+
+    def test_load_file_s3_streams_to_disk(self):
+        downloaded = []
+        def download_file(bucket, key, filename, Config):
+            self.assertEqual((bucket, key), ('bucket', 'models/model.pkl'))
+            self.assertEqual(Config.max_concurrency, loading.cf.s3_max_concurrency)
+            joblib.dump({'a': 1}, filename)
+            downloaded.append(filename)
+        mock_client = mock.Mock()
+        mock_client.download_file.side_effect = download_file
+        with mock.patch('porter.loading._get_s3_client', return_value=mock_client):
+            actual = loading.load_file('s3://bucket/models/model.pkl', 'key-id', 'secret')
+        self.assertEqual(actual, {'a': 1})
+        self.assertTrue(downloaded[0].endswith('model.pkl'))
+        # the temporary file is removed once the object has been loaded
+        self.assertFalse(os.path.exists(downloaded[0]))
+        mock_client.download_fileobj.assert_not_called()
+
+    @mock.patch('boto3.session.Session')
+    def test_get_s3_client(self, mock_session):
+        mock_session.return_value.client.side_effect = lambda *args, **kwargs: mock.Mock()
+        client1 = loading._get_s3_client('key-id', 'secret')
+        client2 = loading._get_s3_client('key-id', 'secret')
+        client3 = loading._get_s3_client('other-key-id', 'secret')
+        self.assertIs(client1, client2)
+        self.assertIsNot(client1, client3)
+        config = mock_session.return_value.client.call_args[1]['config']
+        self.assertEqual(config.max_pool_connections, loading.cf.s3_max_concurrency)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from porter import metrics
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_counter(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.counter('requests_total', 'Total requests.', ['status'])
+        counter.inc(status=200)
+        counter.inc(2, status=200)
+        counter.inc(status=500)
+        actual = registry.render()
+        expected = (
+            '# HELP requests_total Total requests.\n'
+            '# TYPE requests_total counter\n'
+            'requests_total{status="200"} 3.0\n'
+            'requests_total{status="500"} 1.0\n'
+        )
+        self.assertEqual(actual, expected)
+
+    def test_counter_bad_labels(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.counter('requests_total', 'Total requests.', ['status'])
+        with self.assertRaisesRegex(ValueError, 'labels of requests_total'):
+            counter.inc(service='foo')
+
+    def test_histogram(self):
+        registry = metrics.MetricsRegistry()
+        histogram = registry.histogram('latency', 'Latency.', ['service'], buckets=[0.1, 1])
+        histogram.observe(0.05, service='a')
+        histogram.observe(0.5, service='a')
+        histogram.observe(5, service='a')
+        actual = registry.render()
+        expected = (
+            '# HELP latency Latency.\n'
+            '# TYPE latency histogram\n'
+            'latency_bucket{service="a",le="0.1"} 1.0\n'
+            'latency_bucket{service="a",le="1.0"} 2.0\n'
+            'latency_bucket{service="a",le="+Inf"} 3.0\n'
+            'latency_sum{service="a"} 5.55\n'
+            'latency_count{service="a"} 3.0\n'
+        )
+        self.assertEqual(actual, expected)
+
+    def test_label_escaping(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.counter('c', 'A\ncounter.', ['name'])
+        counter.inc(name='a "quoted"\\name')
+        actual = registry.render()
+        expected = (
+            '# HELP c A\\ncounter.\n'
+            '# TYPE c counter\n'
+            'c{name="a \\"quoted\\"\\\\name"} 1.0\n'
+        )
+        self.assertEqual(actual, expected)
+
+
+def _increment_in_child(directory, n):
+    registry = metrics.MetricsRegistry(directory)
+    counter = registry.counter('requests_total', 'Total requests.', ['status'])
+    for _ in range(n):
+        counter.inc(status=200)
+    # force the file to grow beyond its initial size
+    for i in range(3000):
+        counter.inc(status=f'unique-{os.getpid()}-{i}')
+
+
+class TestMultiprocessMetrics(unittest.TestCase):
+    def test_aggregate_processes(self):
+        context = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as directory:
+            processes = [context.Process(target=_increment_in_child, args=(directory, n))
+                         for n in (1, 2, 3)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            registry = metrics.MetricsRegistry(directory)
+            counter = registry.counter('requests_total', 'Total requests.', ['status'])
+            counter.inc(status=200)
+            values = registry.collect()
+            self.assertEqual(len(os.listdir(directory)), 4)
+        self.assertEqual(values[('requests_total', (('status', '200'),))], 7)
+        self.assertEqual(len(values), 1 + 3 * 3000)
+
+    def test_reopen_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'values.db')
+            values = metrics._MmapValues(path)
+            values.inc('a', 1)
+            values.inc('b', 2)
+            values = metrics._MmapValues(path)
+            values.inc('a', 1)
+            actual = metrics._read_mmap_file(path)
+        self.assertEqual(actual, [('a', 2.0), ('b', 2.0)])
+
+
+class TestAppMetrics(unittest.TestCase):
+    def test_observe_request(self):
+        app_metrics = metrics.AppMetrics()
+        app_metrics.observe_request('/model/v1/prediction', 'POST', 200, 0.2, 0.1,
+                                    stage_timings={'predict': 0.1, 'total': 0.2}, batch_size=10,
+                                    validated_count=3)
+        app_metrics.observe_request('/model/v1/prediction', 'POST', 422, 0.01, 0.01)
+        values = app_metrics.registry.collect()
+        service = ('service', '/model/v1/prediction')
+        self.assertEqual(values[('porter_requests_total', (service, ('method', 'POST'), ('status', '200')))], 1)
+        self.assertEqual(values[('porter_request_errors_total', (service, ('status', '422')))], 1)
+        self.assertNotIn(('porter_request_errors_total', (service, ('status', '200'))), values)
+        self.assertEqual(values[('porter_request_duration_seconds_count', (service,))], 2)
+        self.assertEqual(values[('porter_request_stage_duration_seconds_count', (service, ('stage', 'predict')))], 1)
+        self.assertNotIn(('porter_request_stage_duration_seconds_count', (service, ('stage', 'total'))), values)
+        self.assertEqual(values[('porter_request_batch_size_sum', (service,))], 10)
+        self.assertEqual(values[('porter_request_validated_instances_total', (service,))], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import gc
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from porter import preload
+from porter.datascience import BaseModel
+from porter.services import ModelApp, PredictionService
+
+
+SMAPS = """\
+5610fde69000-7ffdd4ec4000 ---p 00000000 00:00 0                          [rollup]
+Rss:                1252 kB
+Pss:                 375 kB
+Pss_Dirty:           100 kB
+Shared_Clean:       1112 kB
+Shared_Dirty:          0 kB
+Private_Clean:        40 kB
+Private_Dirty:       100 kB
+Referenced:         1252 kB
+"""
+
+
+class TestPreloadApp(unittest.TestCase):
+    def tearDown(self):
+        gc.unfreeze()
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_preload_app(self):
+        gc_enabled_in_factory = []
+        finish_warm_up = threading.Event()
+        class Model(BaseModel):
+            def predict(self, X):
+                finish_warm_up.wait(5)
+                return X['feature1']
+        def factory():
+            gc_enabled_in_factory.append(gc.isenabled())
+            prediction_service = PredictionService(
+                model=Model(), name='preloaded', api_version='v1',
+                warm_up=[[{'id': 1, 'feature1': 1}]])
+            return ModelApp([prediction_service])
+        threading.Timer(0.1, finish_warm_up.set).start()
+        model_app = preload.preload_app(factory)
+        self.assertEqual(gc_enabled_in_factory, [False])
+        self.assertTrue(gc.isenabled())
+        self.assertGreater(gc.get_freeze_count(), 0)
+        self.assertEqual(model_app.services[0].status, 'READY')
+
+    def test_preload_app_no_freeze(self):
+        model_app = mock.Mock()
+        actual = preload.preload_app(lambda: model_app, freeze_gc=False)
+        self.assertIs(actual, model_app)
+        model_app.wait_for_warm_up.assert_called_once()
+        model_app.warm_up.assert_called_once()
+        self.assertEqual(gc.get_freeze_count(), 0)
+
+
+class TestMemoryUsage(unittest.TestCase):
+    def test_parse_smaps(self):
+        actual = preload._parse_smaps(SMAPS.splitlines())
+        expected = {
+            'rss': 1252 * 1024,
+            'pss': 375 * 1024,
+            'shared_clean': 1112 * 1024,
+            'shared_dirty': 0,
+            'private_clean': 40 * 1024,
+            'private_dirty': 100 * 1024,
+        }
+        self.assertEqual(actual, expected)
+        self.assertEqual(preload.memory_usage_summary(actual),
+                         'rss=1.2MB pss=0.4MB shared=1.1MB private=0.1MB')
+
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps'), 'requires /proc')
+    def test_memory_usage(self):
+        usage = preload.memory_usage()
+        self.assertGreater(usage['rss'], 0)
+        self.assertEqual(preload.memory_usage(os.getpid()).keys(), usage.keys())
+
+    @mock.patch('porter.preload.memory_usage', lambda: {'rss': 1})
+    def test_memory_reporter(self):
+        reports = []
+        reporter = preload.MemoryReporter(interval=0.01, callback=reports.append).start()
+        time.sleep(0.1)
+        reporter.stop()
+        n_reports = len(reports)
+        self.assertGreater(n_reports, 1)
+        self.assertEqual(reports[0], {'rss': 1})
+        time.sleep(0.05)
+        self.assertEqual(len(reports), n_reports)
+
+
+if __name__ == '__main__':
+    unittest.main()
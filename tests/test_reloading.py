@@ -0,0 +1,136 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import joblib
+
+from porter import loading, reloading
+from porter.datascience import WrappedModel
+
+
+class ConstantModel:
+    # defined at module level so that it can be pickled
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, X):
+        return [self.value] * len(X)
+
+
+class TestArtifactVersion(unittest.TestCase):
+    def test_local_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'model.pkl')
+            with open(path, 'w') as f:
+                f.write('a')
+            os.utime(path, ns=(0, 1))
+            version1 = reloading.artifact_version(path)
+            self.assertEqual(version1, reloading.artifact_version(path))
+            os.utime(path, ns=(0, 2))
+            self.assertNotEqual(version1, reloading.artifact_version(path))
+
+    @mock.patch('porter.reloading.loading._get_s3_client')
+    def test_s3(self, mock_get_s3_client):
+        mock_client = mock_get_s3_client.return_value
+        mock_client.head_object.return_value = {'ETag': '"abc"'}
+        self.assertEqual(reloading.artifact_version('s3://bucket/model.pkl', 'id', 'secret'), 'abc')
+        mock_client.head_object.assert_called_once_with(Bucket='bucket', Key='model.pkl')
+        mock_get_s3_client.assert_called_once_with('id', 'secret')
+        mock_client.head_object.return_value = {'ETag': '"abc"', 'VersionId': 'v2'}
+        self.assertEqual(reloading.artifact_version('s3://bucket/model.pkl', 'id', 'secret'), 'v2')
+
+
+class TestArtifactWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'model.pkl')
+        self.dump(ConstantModel(1), ns=1)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def dump(self, model, ns):
+        joblib.dump(model, self.path)
+        os.utime(self.path, ns=(0, ns))
+
+    def test_check(self):
+        service = mock.Mock()
+        watcher = reloading.ArtifactWatcher(service, model=self.path)
+        self.assertFalse(watcher.check())
+        service.reload.assert_not_called()
+        self.dump(ConstantModel(2), ns=2)
+        self.assertTrue(watcher.check())
+        kwargs = service.reload.call_args[1]
+        self.assertIsInstance(kwargs['model'], WrappedModel)
+        self.assertEqual(kwargs['model'].predict([0]), [2])
+        self.assertEqual(kwargs['meta'], {'model_version': watcher.versions['model']})
+        self.assertFalse(watcher.check())
+        service.reload.assert_called_once()
+
+    @mock.patch('porter.datascience.compiling.compile_model')
+    def test_check_options(self, mock_compile_model):
+        service = mock.Mock()
+        service.model = WrappedModel.from_file(self.path, lazy='request', mmap_mode='r',
+                                               compile=True)
+        watcher = reloading.ArtifactWatcher(service, model=self.path)
+        self.dump(ConstantModel(2), ns=2)
+        with mock.patch('porter.datascience.load_file', wraps=loading.load_file) as mock_load_file:
+            watcher.check()
+            model = service.reload.call_args[1]['model']
+            # the new model is loaded with the options of the current model
+            self.assertFalse(model.loaded)
+            self.assertEqual(model.predict([0]), mock_compile_model.return_value.return_value)
+        mock_load_file.assert_called_once_with(self.path, None, None, mmap_mode='r',
+                                               shared=False)
+        self.assertEqual(mock_compile_model.call_args[0][0].value, 2)
+
+    def test_check_loader(self):
+        service = mock.Mock()
+        loader = mock.Mock()
+        watcher = reloading.ArtifactWatcher(service, model=self.path, postprocessor=self.path,
+                                            loader=loader)
+        self.dump(ConstantModel(2), ns=2)
+        watcher.check()
+        loader.assert_has_calls([mock.call('model', self.path),
+                                 mock.call('postprocessor', self.path)])
+        service.reload.assert_called_once_with(
+            model=loader.return_value, postprocessor=loader.return_value,
+            meta={'model_version': watcher.versions['model'],
+                  'postprocessor_version': watcher.versions['postprocessor']})
+
+    def test_start(self):
+        service = mock.Mock()
+        reloaded = threading.Event()
+        service.reload.side_effect = lambda **kwargs: reloaded.set()
+        watcher = reloading.ArtifactWatcher(service, model=self.path, interval=0.01)
+        watcher.start()
+        watcher.start()
+        self.dump(ConstantModel(2), ns=2)
+        self.assertTrue(reloaded.wait(5))
+        watcher.stop()
+        service.reload.assert_called_once()
+
+    def test_start_load_failure(self):
+        service = mock.Mock()
+        loader = mock.Mock(side_effect=[ValueError('broken'), mock.Mock()])
+        reloaded = threading.Event()
+        service.reload.side_effect = lambda **kwargs: reloaded.set()
+        watcher = reloading.ArtifactWatcher(service, model=self.path, interval=0.01, loader=loader)
+        self.dump(ConstantModel(2), ns=2)
+        with self.assertLogs('porter.reloading', level='ERROR'):
+            watcher.start()
+            # the failed reload is retried
+            self.assertTrue(reloaded.wait(5))
+        watcher.stop()
+
+    def test_init_fail(self):
+        with self.assertRaisesRegex(ValueError, 'at least one'):
+            reloading.ArtifactWatcher(mock.Mock())
+        with self.assertRaisesRegex(ValueError, '`loader` is required'):
+            reloading.ArtifactWatcher(mock.Mock(), postprocessor=self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,11 +8,19 @@ to_openapi() must be working as well.
 
 """
 
+import os
+import tempfile
 import unittest
+from unittest import mock
+
+import fastjsonschema
+import numpy as np
+import pandas as pd
 
 from porter.schemas import (String, Number, Integer, Boolean,
                             Array, Object,
                             RequestSchema, ResponseSchema)
+from porter.schemas import openapi
 
 
 class TestString(unittest.TestCase):
@@ -118,6 +126,185 @@ class TestArray(unittest.TestCase):
                 ValueError, r'Schema validation failed: data\[1\] must be bigger'):
             a.validate([1, -1, 2])
 
+class TestNumpy(unittest.TestCase):
+    def test_scalars(self):
+        Integer().validate(np.int32(1))
+        Number().validate(np.int64(1))
+        Number().validate(np.float32(1.5))
+        Boolean().validate(np.bool_(True))
+        String().validate(np.str_('a'))
+        with self.assertRaisesRegex(ValueError, 'Schema validation failed: data must be integer'):
+            Integer().validate(np.float64(1.5))
+        with self.assertRaisesRegex(ValueError, 'Schema validation failed: data must be number'):
+            Number().validate(np.bool_(True))
+        with self.assertRaisesRegex(ValueError, 'Schema validation failed: data must be bigger'):
+            Integer(additional_params=dict(minimum=0)).validate(np.int8(-1))
+
+    def test_arrays(self):
+        a = Array(item_type=Integer(additional_params=dict(minimum=0)))
+        self.assertIsNotNone(a._validate_columns)
+        for data in [np.arange(5), np.arange(5, dtype='uint8'), np.arange(5.0),
+                     pd.Series(np.arange(5)), list(np.arange(5)), []]:
+            self.assertTrue(a._validate_columns(data))
+            a.validate(data)
+        for data, message in [(np.array([0, -1]), r'data\[1\] must be bigger'),
+                              (np.array([0, 0.5]), r'data\[1\] must be integer'),
+                              (np.array([True]), r'data\[0\] must be integer'),
+                              (np.zeros((2, 2)), r'data\[0\] must be integer')]:
+            self.assertFalse(a._validate_columns(data))
+            with self.assertRaisesRegex(ValueError, f'Schema validation failed: {message}'):
+                a.validate(data)
+        a = Array(item_type=String(additional_params=dict(enum=['x', 'y'])))
+        a.validate(np.array(['x', 'y']))
+        a.validate(pd.Series(['x', 'y'], dtype=object))
+        with self.assertRaisesRegex(ValueError, r'data\[1\] must be one of'):
+            a.validate(np.array(['x', 'z']))
+        # unsupported constraints are checked by fastjsonschema
+        a = Array(item_type=Number(), additional_params=dict(maxItems=1))
+        a.validate(np.array([1.5]))
+        with self.assertRaisesRegex(ValueError, 'must contain less than or equal to 1 items'):
+            a.validate(np.array([1.5, 2.5]))
+
+    def test_objects(self):
+        item = Object(properties={'id': Integer(), 'a': Number(additional_params=dict(minimum=0)),
+                                  'b': String()}, required=['id', 'a'])
+        a = Array(item_type=item)
+        frame = pd.DataFrame({'id': [1, 2], 'a': [0.5, 1.5], 'b': ['x', 'y']})
+        records = [{'id': np.int64(i), 'a': np.float64(i)} for i in range(3)]
+        for data in [frame, frame[['id', 'a']], records]:
+            self.assertTrue(a._validate_columns(data))
+            a.validate(data)
+        for data, message in [(frame.assign(a=[0.5, -1]), r'data\[1\].a must be bigger'),
+                              (frame[['id', 'b']], r'data\[0\] must contain'),
+                              (frame.assign(b=[1, 2]), r'data\[0\].b must be string')]:
+            self.assertFalse(a._validate_columns(data))
+            with self.assertRaisesRegex(ValueError, f'Schema validation failed: {message}'):
+                a.validate(data)
+        # nested NumPy objects are converted before being validated by
+        # fastjsonschema
+        Object(properties={'a': Array(item_type=Array(item_type=Number())), 'b': item}).validate(
+            {'a': np.ones((2, 2)), 'b': {'id': np.int16(1), 'a': np.float16(1)}})
+
+    def test_object_of_arrays(self):
+        # e.g. batch prediction responses
+        a = Array(item_type=Object(properties={'id': Integer(), 'prediction': Number()}))
+        o = Object(properties={'request_id': String(), 'predictions': a})
+        data = {'request_id': 'a',
+                'predictions': [{'id': i, 'prediction': p} for i, p in enumerate(np.arange(3.0))]}
+        self.assertTrue(o._validate_properties(data))
+        o.validate(data)
+        data['predictions'][1]['prediction'] = 'a'
+        self.assertFalse(o._validate_properties(data))
+        with self.assertRaisesRegex(ValueError, r'data.predictions\[1\].prediction must be number'):
+            o.validate(data)
+        with self.assertRaisesRegex(ValueError, 'data must contain'):
+            o.validate({'request_id': 'a'})
+
+    def test_to_builtin(self):
+        data = {'a': [1, 2.5, 'x', {'b': True}]}
+        self.assertIs(openapi._to_builtin(data), data)
+        converted = openapi._to_builtin({'a': np.arange(2), 'b': [np.float32(1.5)], 'c': 1})
+        self.assertEqual(converted, {'a': [0, 1], 'b': [1.5], 'c': 1})
+        self.assertEqual([type(value) for value in converted['a']], [int, int])
+        self.assertEqual(openapi._to_builtin(pd.DataFrame({'a': [1], 'b': ['x']})), [{'a': 1, 'b': 'x'}])
+
+
+class TestArrayOfObjects(unittest.TestCase):
+    def setUp(self):
+        self.item = Object(properties={
+            'id': Integer(),
+            'a': Number(additional_params=dict(minimum=0, exclusiveMaximum=10)),
+            'b': String(additional_params=dict(enum=['x', 'y'])),
+            'c': Boolean(),
+            'd': Integer(additional_params=dict(maximum=5)),
+        }, required=['id', 'a', 'b', 'c'])
+        self.a = Array(item_type=self.item)
+        self.valid = [{'id': i, 'a': 0.5 * i, 'b': 'x', 'c': True, 'd': 1} for i in range(5)]
+
+    def test_validate_columns(self):
+        self.assertIsNotNone(self.a._validate_columns)
+        self.assertTrue(self.a._validate_columns(self.valid))
+        self.a.validate(self.valid)
+        # optional properties can be missing and integers can be integral floats
+        self.valid[0].pop('d')
+        self.valid[1]['id'] = 1.0
+        self.assertTrue(self.a._validate_columns(self.valid))
+        self.a.validate(self.valid)
+
+    def test_validate_columns_invalid(self):
+        # the first failing row is reported as by fastjsonschema
+        cases = [
+            (3, 'id', 'foo', r'data\[3\].id must be integer'),
+            (3, 'id', True, r'data\[3\].id must be integer'),
+            (2, 'id', 1.5, r'data\[2\].id must be integer'),
+            (1, 'a', -1, r'data\[1\].a must be bigger than or equal to 0'),
+            (3, 'a', 10, r'data\[3\].a must be smaller than 10'),
+            (2, 'b', 'z', r'data\[2\].b must be one of'),
+            (0, 'c', 1, r'data\[0\].c must be boolean'),
+            (3, 'd', 6, r'data\[3\].d must be smaller than or equal to 5'),
+            (1, 'a', None, r'data\[1\].a must be number'),
+        ]
+        for row, name, value, message in cases:
+            data = [dict(item) for item in self.valid]
+            data[row][name] = value
+            # a later row failing on an earlier property is not reported
+            data[4]['id'] = 'bar'
+            self.assertFalse(self.a._validate_columns(data))
+            with self.assertRaisesRegex(ValueError, f'Schema validation failed: {message}'):
+                self.a.validate(data)
+        data = self.valid + [{'id': 5, 'a': 1, 'b': 'x'}]
+        with self.assertRaisesRegex(ValueError, r'data\[5\] must contain'):
+            self.a.validate(data)
+        with self.assertRaisesRegex(ValueError, r'data\[1\] must be object'):
+            self.a.validate([self.valid[0], 1])
+
+    def test_validate_columns_fallback(self):
+        # values that cannot be checked column-wise are checked by fastjsonschema
+        self.valid[0]['d'] = -2 ** 70
+        self.assertFalse(self.a._validate_columns(self.valid))
+        self.a.validate(self.valid)
+        self.assertFalse(self.a._validate_columns([]))
+        self.a.validate([])
+        # as are constructs that cannot be checked column-wise
+        for item in [Object(properties={'a': String(additional_params=dict(minLength=1))}),
+                     Object(properties={'a': Array(item_type=Integer())}),
+                     Object(properties={'a': Integer()}, additional_params=dict(minProperties=1))]:
+            self.assertIsNone(Array(item_type=item)._validate_columns)
+        self.assertIsNone(Array(item_type=self.item, additional_params=dict(minItems=1))._validate_columns)
+
+    def test_validate_sample(self):
+        data = [dict(self.valid[0], id=i) for i in range(1000)]
+        with mock.patch.object(self.item, 'validate', wraps=self.item.validate) as mock_validate:
+            self.assertEqual(self.a.validate_sample(data, 10), 10)
+        self.assertEqual(mock_validate.call_count, 10)
+        # rows failing the type check are validated in addition to the sample
+        data[500]['a'] = '1'
+        data[600].pop('b')
+        data[700]['d'] = None
+        self.assertEqual(self.a._screen(data), {500, 600, 700})
+        with mock.patch('porter.schemas.openapi.random.sample', return_value=[1, 2]):
+            with self.assertRaisesRegex(ValueError, r'Schema validation failed: data\[500\].a must be number'):
+                self.a.validate_sample(data, 2)
+            # constraints other than types are only checked for sampled rows
+            data = [dict(self.valid[0], id=i) for i in range(1000)]
+            data[500]['a'] = -1
+            self.assertEqual(self.a.validate_sample(data, 2), 2)
+            data[2]['a'] = -1
+            with self.assertRaisesRegex(ValueError, r'Schema validation failed: data\[2\].a must be bigger'):
+                self.a.validate_sample(data, 2)
+        with self.assertRaisesRegex(ValueError, r'data\[1\] must be object'):
+            self.a.validate_sample([self.valid[0], 1, self.valid[1]], 2)
+
+    def test_validate_sample_all(self):
+        # small arrays and unsupported schemas are validated in full
+        self.assertEqual(self.a.validate_sample(self.valid, 5), 5)
+        with self.assertRaisesRegex(ValueError, 'must be array'):
+            self.a.validate_sample({'id': 1}, 5)
+        a = Array(item_type=self.item, additional_params=dict(maxItems=3))
+        with self.assertRaisesRegex(ValueError, 'must contain less than or equal to 3 items'):
+            a.validate_sample(self.valid, 1)
+
+
 class TestObject(unittest.TestCase):
 
     def setUp(self):
@@ -240,6 +427,115 @@ class TestObject(unittest.TestCase):
             ))
 
 
+class TestCompilation(unittest.TestCase):
+    @mock.patch.dict('porter.schemas.openapi._validators', clear=True)
+    def test_lazy_compilation(self):
+        with mock.patch('porter.schemas.openapi.fastjsonschema.compile',
+                        wraps=fastjsonschema.compile) as mock_compile:
+            o1 = Object(properties=dict(a=Integer(), b=String()))
+            o2 = Object(properties=dict(a=Integer(), b=String()))
+            mock_compile.assert_not_called()
+            o1.validate(dict(a=1, b='b'))
+            mock_compile.assert_called_once()
+            # identical schemas share a validator
+            with self.assertRaisesRegex(ValueError, 'Schema validation failed: data.a must be integer'):
+                o2.validate(dict(a='1', b='b'))
+            mock_compile.assert_called_once()
+            o3 = Object(properties=dict(a=Integer(), b=Number()))
+            o3.validate(dict(a=1, b=1))
+            self.assertEqual(mock_compile.call_count, 2)
+
+    def test_to_openapi_memoized(self):
+        b = Object(properties=dict(bb=Integer()), reference_name='B')
+        a = Object(properties=dict(b=b), reference_name='A')
+        with mock.patch.object(b, '_customized_openapi', wraps=b._customized_openapi) as mock_b:
+            expected = (
+                {'$ref': '#/components/schemas/A'},
+                {'A': {'type': 'object', 'description': None,
+                       'properties': {'b': {'$ref': '#/components/schemas/B'}},
+                       'required': ('b',)},
+                 'B': {'type': 'object', 'description': None,
+                       'properties': {'bb': {'type': 'integer', 'description': None}},
+                       'required': ('bb',)}})
+            self.assertEqual(a.to_openapi(), expected)
+            # the references of nested objects are returned by later calls
+            self.assertEqual(a.to_openapi(), expected)
+            self.assertEqual(Array(item_type=a).to_openapi()[1], expected[1])
+            self.assertEqual(b.to_openapi()[1], {'B': expected[1]['B']})
+            mock_b.assert_called_once()
+            a.validate(dict(b=dict(bb=1)))
+            with self.assertRaisesRegex(ValueError, 'data.b.bb must be integer'):
+                a.validate(dict(b=dict(bb='1')))
+            self.assertEqual(mock_b.call_count, 2)
+
+
+class TestValidatorCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for patcher in [mock.patch('porter.config.schema_cache_dir', self.tmpdir.name),
+                        mock.patch.dict('porter.schemas.openapi._validators', clear=True)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cache(self):
+        obj = Object(properties=dict(a=Integer(additional_params=dict(minimum=0))))
+        obj.compile()
+        filenames = sorted(os.listdir(self.tmpdir.name))
+        self.assertEqual(len(filenames), 2)
+        self.assertTrue(filenames[0].startswith('validator_'))
+        self.assertTrue(filenames[0].endswith('.bin'))
+        self.assertTrue(filenames[1].endswith('.py'))
+        # a new process loads the cached code without generating it
+        openapi._validators.clear()
+        obj = Object(properties=dict(a=Integer(additional_params=dict(minimum=0))))
+        with mock.patch('porter.schemas.openapi.fastjsonschema.compile_to_code') as mock_compile_to_code, \
+                mock.patch('porter.schemas.openapi.fastjsonschema.compile') as mock_compile:
+            obj.validate(dict(a=1))
+            with self.assertRaisesRegex(ValueError, 'Schema validation failed: data.a must be bigger'):
+                obj.validate(dict(a=-1))
+        mock_compile_to_code.assert_not_called()
+        mock_compile.assert_not_called()
+        # corrupt bytecode is regenerated
+        with open(os.path.join(self.tmpdir.name, filenames[0]), 'wb') as f:
+            f.write(b'corrupt')
+        openapi._validators.clear()
+        obj = Object(properties=dict(a=Integer(additional_params=dict(minimum=0))))
+        with self.assertRaisesRegex(ValueError, 'Schema validation failed: data.a must be bigger'):
+            obj.validate(dict(a=-1))
+        # the version of fastjsonschema is part of the key
+        openapi._validators.clear()
+        with mock.patch('porter.schemas.openapi.fastjsonschema.VERSION', '0.0.0'):
+            Object(properties=dict(a=Integer(additional_params=dict(minimum=0)))).compile()
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 4)
+
+    def test_cache_schema_id(self):
+        # the generated function is named after the id
+        for _ in range(2):
+            openapi._validators.clear()
+            obj = Object(properties=dict(a=Integer()), additional_params={'id': 'http://x'})
+            with self.assertRaisesRegex(ValueError, 'Schema validation failed: data.a must be integer'):
+                obj.validate(dict(a='1'))
+
+    def test_cache_write_fails(self):
+        with mock.patch('porter.schemas.openapi.os.replace', side_effect=OSError('full')), \
+                self.assertLogs('porter.schemas.openapi', level='WARNING'):
+            Object(properties=dict(a=Integer())).compile()
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_cache_not_writable(self):
+        path = os.path.join(self.tmpdir.name, 'file')
+        open(path, 'w').close()
+        with mock.patch('porter.config.schema_cache_dir', path), \
+                self.assertLogs('porter.schemas.openapi', level='WARNING'):
+            obj = Object(properties=dict(a=Integer()))
+            obj.compile()
+        with self.assertRaisesRegex(ValueError, 'Schema validation failed: data.a must be integer'):
+            obj.validate(dict(a='1'))
+
+
 class TestRequestSchema(unittest.TestCase):
     def test_request_body(self):
         # check that obj's schema is properly located within request body
@@ -0,0 +1,71 @@
+import unittest
+
+from porter.schemas import (Array, Boolean, Integer, Number, Object, String,
+                            synthetic_data)
+
+
+class TestSyntheticData(unittest.TestCase):
+    def setUp(self):
+        self.schema = Object(properties={
+            'id': Integer(),
+            'a': Number(additional_params={'minimum': 3, 'exclusiveMaximum': 3.5}),
+            'b': Integer(additional_params={'exclusiveMinimum': -2, 'maximum': 0}),
+            'c': String(additional_params={'enum': ['x', 'y']}),
+            'd': Boolean(),
+            'e': Array(item_type=String(additional_params={'minLength': 10}),
+                       additional_params={'minItems': 2, 'maxItems': 4}),
+            'f': Object(properties={'g': Integer(additional_params={'maximum': -1000})}),
+            'h': String(additional_params={'maxLength': 2}),
+        }, required=['id', 'a', 'b', 'c', 'd', 'e', 'f'])
+
+    def test_valid(self):
+        data = synthetic_data(self.schema, size=1000)
+        self.assertEqual(len(data), 1000)
+        Array(item_type=self.schema).validate(data)
+        self.assertEqual({row['b'] for row in data}, {-1, 0})
+        self.assertEqual({row['c'] for row in data}, {'x', 'y'})
+        self.assertEqual({row['d'] for row in data}, {True, False})
+        self.assertEqual({len(row['e']) for row in data}, {2, 3, 4})
+        # optional properties are left out of some objects
+        self.assertTrue(0 < sum('h' in row for row in data) < 1000)
+        self.schema.validate(synthetic_data(self.schema))
+
+    def test_deterministic(self):
+        self.assertEqual(synthetic_data(self.schema, size=10, seed=1),
+                         synthetic_data(self.schema, size=10, seed=1))
+        self.assertNotEqual(synthetic_data(self.schema, size=10, seed=1),
+                            synthetic_data(self.schema, size=10, seed=2))
+        self.assertEqual(synthetic_data(self.schema, seed=1),
+                         synthetic_data(self.schema, size=1, seed=1)[0])
+
+    def test_openapi_schema(self):
+        item = Object(properties={'a': Integer(additional_params={'minimum': 5})},
+                      reference_name='Item')
+        schema, definitions = Array(item_type=item).to_openapi()
+        self.assertEqual(schema['items'], {'$ref': '#/components/schemas/Item'})
+        data = synthetic_data(schema, size=5, definitions=definitions)
+        Array(item_type=Array(item_type=item)).validate(data)
+
+    def test_draft4_exclusive_bounds(self):
+        schema = {'type': 'integer', 'minimum': 0, 'exclusiveMinimum': True,
+                  'maximum': 2, 'exclusiveMaximum': True}
+        self.assertEqual(set(synthetic_data(schema, size=100)), {1})
+
+    def test_empty_arrays(self):
+        schema = Array(item_type=Integer(), additional_params={'maxItems': 0})
+        self.assertEqual(synthetic_data(schema, size=3), [[], [], []])
+
+    def test_unsatisfiable(self):
+        for schema in [Integer(additional_params={'minimum': 1, 'maximum': 0}),
+                       Integer(additional_params={'exclusiveMinimum': 0, 'exclusiveMaximum': 1}),
+                       Number(additional_params={'minimum': 1, 'exclusiveMaximum': 1}),
+                       String(additional_params={'minLength': 10, 'maxLength': 5}),
+                       Array(item_type=Integer(), additional_params={'minItems': 2, 'maxItems': 1})]:
+            with self.assertRaisesRegex(ValueError, 'satisfies'):
+                synthetic_data(schema)
+        with self.assertRaisesRegex(ValueError, 'cannot generate data'):
+            synthetic_data({'type': 'null'})
+
+
+if __name__ == '__main__':
+    unittest.main()
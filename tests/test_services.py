@@ -1,3 +1,5 @@
+import itertools
+import threading
 import time
 import warnings
 
@@ -10,9 +12,10 @@ import pandas as pd
 import porter.responses as porter_responses
 from porter import __version__
 from porter import constants as cn
-from porter.services import (BaseService, ModelApp,
-                             PredictionService,
-                             StatefulRoute, serve_error_message)
+from porter.services import (BaseService, EnsemblePredictionService,
+                             ModelApp, PredictionService,
+                             StatefulRoute, _concat_predictions,
+                             serve_error_message)
 from porter import schemas
 
 
@@ -392,6 +395,55 @@ class TestPredictionServicePredict(unittest.TestCase):
         )
         _ = prediction_service._predict()
 
+    @mock.patch('porter.services.api.request_json')
+    @mock.patch('porter.services.api.get_model_context', lambda: None)
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test__predict_chunked(self, mock_request_json):
+        mock_request_json.return_value = [{'id': i, 'feature1': i} for i in range(10)]
+        chunk_lengths = []
+        class Model:
+            def predict(self, X):
+                chunk_lengths.append(len(X))
+                return (X['feature1'] * 2).values
+        class Postprocessor:
+            def process(self, X_input, X_preprocessed, preds):
+                return list(preds + X_input['id'].values)
+        expected = [{'id': i, 'prediction': 3 * i} for i in range(10)]
+        for workers in (1, 3):
+            chunk_lengths.clear()
+            prediction_service = PredictionService(
+                model=Model(),
+                name=f'chunked-{workers}',
+                api_version='v1',
+                postprocessor=Postprocessor(),
+                batch_chunk_size=4,
+                batch_chunk_workers=workers,
+            )
+            actual = prediction_service._predict().data['predictions']
+            self.assertEqual(actual, expected)
+            self.assertEqual(sorted(chunk_lengths), [2, 4, 4])
+
+    @mock.patch('porter.services.api.request_json')
+    @mock.patch('porter.services.api.get_model_context', lambda: None)
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test__predict_chunked_small_batch(self, mock_request_json):
+        mock_request_json.return_value = [{'id': 1}, {'id': 2}]
+        model = mock.Mock()
+        model.predict.return_value = pd.Series([1, 2])
+        prediction_service = PredictionService(
+            model=model, name='foo', api_version='bar', batch_chunk_size=2)
+        _ = prediction_service._predict()
+        model.predict.assert_called_once()
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_concat_predictions(self):
+        actual = _concat_predictions([pd.Series([1, 2]), pd.Series([3])])
+        self.assertEqual(actual.tolist(), [1, 2, 3])
+        actual = _concat_predictions([np.array([[1], [2]]), np.array([[3]])])
+        self.assertEqual(actual.tolist(), [[1], [2], [3]])
+        actual = _concat_predictions([[{'a': 1}], [{'a': 2}]])
+        self.assertEqual(actual, [{'a': 1}, {'a': 2}])
+
     @mock.patch('porter.services.BaseService._ids', set())
     def test_constructor(self):
         prediction_service = PredictionService(
@@ -405,6 +457,270 @@ class TestPredictionServicePredict(unittest.TestCase):
                     model=None, name='foo', api_version='bar', meta=object())
         with self.assertRaisesRegex(ValueError, '.*callable.*'):
             prediction_service = PredictionService(model=None, additional_checks=1)
+        with self.assertRaisesRegex(ValueError, '.*batch_chunk_size.*'):
+            prediction_service = PredictionService(model=None, batch_chunk_size=0)
+        with self.assertRaisesRegex(ValueError, '.*batch_chunk_workers.*'):
+            prediction_service = PredictionService(model=None, batch_chunk_workers=0)
+
+
+class TestPredictionServiceWarmUp(unittest.TestCase):
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_warm_up(self):
+        payload = [{'id': 1, 'feature1': 2}]
+        prediction_service = PredictionService(
+            model=mock.Mock(), name='foo', api_version='v1', warm_up=[payload])
+        self.assertEqual(prediction_service.status, 'WARMING')
+        mock_client = mock.Mock()
+        mock_client.post.return_value.status_code = 200
+        prediction_service.warm_up(mock_client)
+        self.assertEqual(prediction_service.status, 'READY')
+        mock_client.post.assert_called_once_with('/foo/v1/prediction', data='[{"id": 1, "feature1": 2}]')
+        # warming up again is a no-op
+        prediction_service.warm_up(mock_client)
+        mock_client.post.assert_called_once()
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_warm_up_failed_request(self):
+        prediction_service = PredictionService(
+            model=mock.Mock(), name='foo', api_version='v1', warm_up=[{}])
+        mock_client = mock.Mock()
+        mock_client.post.return_value.status_code = 422
+        with self.assertLogs('porter.services', level='WARNING'):
+            prediction_service.warm_up(mock_client)
+        self.assertEqual(prediction_service.status, 'READY')
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_no_warm_up(self):
+        prediction_service = PredictionService(model=mock.Mock(), name='foo', api_version='v1')
+        self.assertEqual(prediction_service.status, 'READY')
+        self.assertEqual(prediction_service.warm_up_payloads, [])
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_loading(self):
+        model = mock.Mock(loading=True)
+        preprocessor = mock.Mock(loading=False)
+        prediction_service = PredictionService(
+            model=model, preprocessor=preprocessor, name='foo', api_version='v1',
+            warm_up=[[]])
+        self.assertEqual(prediction_service.status, 'LOADING')
+        def load():
+            model.loading = False
+        model.load.side_effect = load
+        prediction_service.load()
+        model.load.assert_called_once()
+        preprocessor.load.assert_not_called()
+        self.assertEqual(prediction_service.status, 'WARMING')
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_generated_warm_up_payloads(self):
+        feature_schema = schemas.Object(properties={
+            'a': schemas.Number(additional_params={'minimum': 3}),
+            'b': schemas.Integer(additional_params={'exclusiveMaximum': 10}),
+            'c': schemas.String(additional_params={'enum': ['x', 'y']}),
+            'd': schemas.Boolean(),
+            'e': schemas.Array(item_type=schemas.String()),
+        })
+        prediction_service = PredictionService(
+            model=mock.Mock(), name='foo', api_version='v1',
+            feature_schema=feature_schema, warm_up=True)
+        payload, = prediction_service.warm_up_payloads
+        self.assertEqual(len(payload), 1)
+        prediction_service.request_schema.validate(payload)
+        expected = payload
+        prediction_service = PredictionService(
+            model=mock.Mock(), name='bar', api_version='v1', batch_prediction=False,
+            feature_schema=feature_schema, warm_up=True)
+        self.assertEqual(prediction_service.warm_up_payloads, expected)
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_generated_warm_up_payloads_requires_feature_schema(self):
+        with self.assertRaisesRegex(ValueError, 'feature_schema'):
+            PredictionService(model=mock.Mock(), name='foo', api_version='v1', warm_up=True)
+
+
+class TestPredictionServiceReload(unittest.TestCase):
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_reload(self):
+        model1, model2, preprocessor = mock.Mock(), mock.Mock(), mock.Mock()
+        prediction_service = PredictionService(
+            model=model1, preprocessor=preprocessor, name='foo', api_version='v1',
+            meta={'a': 'b'})
+        prediction_service.reload(model=model2, meta={'model_version': '2'})
+        self.assertIs(prediction_service.model, model2)
+        self.assertIs(prediction_service.preprocessor, preprocessor)
+        self.assertEqual(prediction_service.meta['a'], 'b')
+        self.assertEqual(prediction_service.meta['model_version'], '2')
+        self.assertIn('reloaded_at', prediction_service.meta)
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_reload_warm_up(self):
+        model1, model2 = mock.Mock(), mock.Mock()
+        model2.predict.return_value = [1]
+        prediction_service = PredictionService(
+            model=model1, name='foo', api_version='v1', batch_prediction=False,
+            warm_up=[{'id': 1, 'feature1': 2}])
+        prediction_service.reload(model=model2)
+        X = model2.predict.call_args[0][0]
+        self.assertEqual(X.to_dict('records'), [{'id': 1, 'feature1': 2}])
+        model1.predict.assert_not_called()
+        # the current model is kept if the new one fails to warm up
+        model3 = mock.Mock()
+        model3.predict.side_effect = ValueError('broken')
+        with self.assertRaisesRegex(ValueError, 'broken'):
+            prediction_service.reload(model=model3)
+        self.assertIs(prediction_service.model, model2)
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_reload_in_flight_request(self):
+        predicting = threading.Event()
+        finish_predicting = threading.Event()
+        class OldModel:
+            def predict(self, X):
+                predicting.set()
+                finish_predicting.wait(5)
+                return X['feature1'] * 0
+        class NewModel:
+            def predict(self, X):
+                return X['feature1']
+        class Preprocessor:
+            def __init__(self, offset):
+                self.offset = offset
+            def process(self, X):
+                return X + self.offset
+        prediction_service = PredictionService(
+            model=OldModel(), preprocessor=Preprocessor(0), name='foo', api_version='v1')
+        client = ModelApp([prediction_service]).app.test_client()
+        responses = []
+        def post():
+            responses.append(client.post('/foo/v1/prediction', data='[{"id": 1, "feature1": 2}]'))
+        thread = threading.Thread(target=post)
+        thread.start()
+        self.assertTrue(predicting.wait(5))
+        prediction_service.reload(model=NewModel(), preprocessor=Preprocessor(1))
+        finish_predicting.set()
+        thread.join()
+        post()
+        self.assertEqual([response.get_json()['predictions'][0]['prediction'] for response in responses],
+                         [0, 3])
+        self.assertIn('reloaded_at', responses[1].get_json()['model_context']['model_meta'])
+        ready = client.get('/-/ready').get_json()
+        self.assertIn('reloaded_at', ready['services']['/foo/v1/prediction']['model_context']['model_meta'])
+
+
+class _ScaleModel:
+    # defined at module level so that it can be pickled
+    def __init__(self, scale):
+        self.scale = scale
+
+    def predict(self, X):
+        return X['feature1'].values * self.scale
+
+
+@mock.patch('porter.responses.api.request_id', lambda: 123)
+class TestEnsemblePredictionService(unittest.TestCase):
+    @mock.patch('porter.services.api.request_json')
+    @mock.patch('porter.services.api.get_model_context', lambda: None)
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test__predict(self, mock_request_json):
+        mock_request_json.return_value = [{'id': i, 'feature1': i} for i in range(3)]
+        # each model blocks until all models were called, i.e. this only
+        # succeeds if the models are called concurrently
+        barrier = threading.Barrier(3, timeout=5)
+        class Model(_ScaleModel):
+            def predict(self, X):
+                barrier.wait()
+                return super().predict(X)
+        preprocessor = mock.Mock()
+        preprocessor.process.side_effect = lambda X: X
+        prediction_service = EnsemblePredictionService(
+            models=[Model(1), Model(2), Model(6)], name='ensemble', api_version='v1',
+            preprocessor=preprocessor)
+        actual = prediction_service._predict().data['predictions']
+        self.assertEqual(actual, [{'id': i, 'prediction': 3 * i} for i in range(3)])
+        preprocessor.process.assert_called_once()
+
+    @mock.patch('porter.services.api.request_json')
+    @mock.patch('porter.services.api.get_model_context', lambda: None)
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test__predict_reducers(self, mock_request_json):
+        mock_request_json.return_value = [{'id': 1, 'feature1': 1}]
+        models = [_ScaleModel(1), _ScaleModel(2), _ScaleModel(6)]
+        for i, (kwargs, expected) in enumerate([
+                ({'reducer': 'median'}, 2),
+                ({'reducer': 'min'}, 1),
+                ({'reducer': 'max'}, 6),
+                ({'weights': [1, 1, 0]}, 1.5),
+                ({'reducer': lambda preds: preds[-1]}, 6)]):
+            prediction_service = EnsemblePredictionService(
+                models=models, name=f'ensemble-{i}', api_version='v1', **kwargs)
+            actual = prediction_service._predict().data['predictions']
+            self.assertEqual(actual, [{'id': 1, 'prediction': expected}])
+
+    @mock.patch('porter.services.api.request_json')
+    @mock.patch('porter.services.api.get_model_context', lambda: None)
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test__predict_process_pool(self, mock_request_json):
+        mock_request_json.return_value = [{'id': i, 'feature1': i} for i in range(3)]
+        prediction_service = EnsemblePredictionService(
+            models=[_ScaleModel(1), _ScaleModel(2), _ScaleModel(6)], name='ensemble',
+            api_version='v1', ensemble_executor='process', ensemble_workers=2)
+        try:
+            actual = prediction_service._predict().data['predictions']
+        finally:
+            prediction_service._get_ensemble_pool().shutdown()
+        self.assertEqual(actual, [{'id': i, 'prediction': 3 * i} for i in range(3)])
+
+    @mock.patch('porter.services.api.request_json')
+    @mock.patch('porter.services.api.get_model_context', lambda: None)
+    @mock.patch('porter.services.BaseService._ids', set())
+    @mock.patch('porter.services._process_pool_initializer', False)
+    def test__predict_processes_without_initializer(self, mock_request_json):
+        mock_request_json.return_value = [{'id': i, 'feature1': i} for i in range(3)]
+        prediction_service = EnsemblePredictionService(
+            models=[_ScaleModel(1), _ScaleModel(2), _ScaleModel(6)], name='ensemble',
+            api_version='v1', ensemble_executor='process', ensemble_workers=2)
+        try:
+            actual = prediction_service._predict().data['predictions']
+        finally:
+            prediction_service._get_ensemble_pool().shutdown()
+        self.assertEqual(actual, [{'id': i, 'prediction': 3 * i} for i in range(3)])
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_reload(self):
+        prediction_service = EnsemblePredictionService(
+            models=[_ScaleModel(1)], name='ensemble', api_version='v1')
+        with self.assertRaisesRegex(ValueError, 'cannot be reloaded'):
+            prediction_service.reload(model=_ScaleModel(2), meta={'model_version': '2'})
+        self.assertNotIn('reloaded_at', prediction_service.meta)
+        preprocessor = mock.Mock()
+        prediction_service.reload(preprocessor=preprocessor)
+        self.assertIs(prediction_service.preprocessor, preprocessor)
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_loading(self):
+        models = [mock.Mock(loading=False), mock.Mock(loading=True)]
+        prediction_service = EnsemblePredictionService(models=models, name='foo', api_version='v1')
+        self.assertEqual(prediction_service.status, 'LOADING')
+        prediction_service.load()
+        models[0].load.assert_not_called()
+        models[1].load.assert_called_once()
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_constructor_fail(self):
+        with self.assertRaisesRegex(ValueError, '`models`'):
+            EnsemblePredictionService(models=[], name='foo', api_version='v1')
+        with self.assertRaisesRegex(ValueError, '`reducer`'):
+            EnsemblePredictionService(models=[1], reducer='mode', name='foo', api_version='v1')
+        with self.assertRaisesRegex(ValueError, '`weights`'):
+            EnsemblePredictionService(models=[1], reducer='max', weights=[1], name='foo', api_version='v1')
+        with self.assertRaisesRegex(ValueError, '`weights`'):
+            EnsemblePredictionService(models=[1], reducer=np.max, weights=[1], name='foo', api_version='v1')
+        with self.assertRaisesRegex(ValueError, '`weights`'):
+            EnsemblePredictionService(models=[1], weights=[1, 2], name='foo', api_version='v1')
+        with self.assertRaisesRegex(ValueError, '`ensemble_executor`'):
+            EnsemblePredictionService(models=[1], ensemble_executor='fiber', name='foo', api_version='v1')
+        with self.assertRaisesRegex(ValueError, '`ensemble_workers`'):
+            EnsemblePredictionService(models=[1], ensemble_workers=0, name='foo', api_version='v1')
 
 
 class TestPredictionServiceSchemas(unittest.TestCase):
@@ -680,6 +996,62 @@ class TestPredictionServiceSchemas(unittest.TestCase):
         with self.assertRaises(werkzeug_exc.UnprocessableEntity):
             prediction_service.get_post_data()
 
+    @mock.patch('porter.services.BaseService._ids', set())
+    @mock.patch('porter.services.api.set_validated_count')
+    @mock.patch('porter.services.api.request_json')
+    def test_get_post_data_validation_sample(self, mock_request_json, mock_set_validated_count):
+        feature_schema = schemas.Object(properties=dict(x=schemas.Integer()))
+        prediction_service = PredictionService(
+            model=mock.Mock(), name='sampled', api_version='v1',
+            feature_schema=feature_schema, validate_request_data=True,
+            validation_sample_size=5)
+        mock_request_json.return_value = [{'id': i, 'x': i} for i in range(100)]
+        mock_request_json.return_value[50]['x'] = 'a'
+        with self.assertRaisesRegex(werkzeug_exc.UnprocessableEntity, r'data\[50\].x must be integer'):
+            prediction_service.get_post_data()
+        # invalid requests are counted too, the invalid instance is validated
+        # in addition to the sample unless it was sampled
+        self.assertIn(mock_set_validated_count.call_args[0][0], (5, 6))
+        mock_set_validated_count.reset_mock()
+        mock_request_json.return_value[50]['x'] = 50
+        prediction_service.get_post_data()
+        mock_set_validated_count.assert_called_once_with(5)
+        for validation_sample_size in (0, 10.5):
+            with self.assertRaisesRegex(ValueError, 'validation_sample_size'):
+                PredictionService(model=mock.Mock(), name='sampled', api_version='v2',
+                                  validation_sample_size=validation_sample_size)
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    @mock.patch('porter.services.api.set_validated_count')
+    @mock.patch('porter.services.api.request_json')
+    def test_get_post_data_validated_count(self, mock_request_json, mock_set_validated_count):
+        feature_schema = schemas.Object(properties=dict(x=schemas.Integer()))
+        prediction_service = PredictionService(
+            model=mock.Mock(), name='validated', api_version='v1',
+            feature_schema=feature_schema, validate_request_data=True)
+        mock_request_json.return_value = [{'id': i, 'x': 'a'} for i in range(3)]
+        with self.assertRaises(werkzeug_exc.UnprocessableEntity):
+            prediction_service.get_post_data()
+        mock_set_validated_count.assert_called_once_with(3)
+
+    @mock.patch('porter.services.BaseService._ids', set())
+    def test_compile_schemas(self):
+        feature_schema = schemas.Object(properties=dict(x=schemas.Integer()))
+        for validate_request_data, validate_response_data in itertools.product([True, False], repeat=2):
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                prediction_service = PredictionService(
+                    model=mock.Mock(), name='compile',
+                    api_version=f'{validate_request_data}-{validate_response_data}',
+                    feature_schema=feature_schema,
+                    validate_request_data=validate_request_data,
+                    validate_response_data=validate_response_data)
+            prediction_service.compile_schemas()
+            self.assertEqual(prediction_service.request_schema._validator is not None,
+                             validate_request_data)
+            self.assertEqual(prediction_service.response_schema._validator is not None,
+                             validate_response_data)
+
 
 class TestModelApp(unittest.TestCase):
     @mock.patch('porter.services.schemas.make_openapi_spec')
@@ -0,0 +1,64 @@
+import unittest
+from unittest import mock
+
+from porter import timing
+
+
+class TestStageTimer(unittest.TestCase):
+    @mock.patch('porter.timing.time.perf_counter')
+    def test_time(self, mock_perf_counter):
+        mock_perf_counter.side_effect = [1.0, 1.5, 2.0, 2.25, 3.0, 3.5]
+        timer = timing.StageTimer()
+        with timer.time('predict'):
+            pass
+        with timer.time('preprocess'):
+            pass
+        # stages recorded more than once are summed
+        with timer.time('predict'):
+            pass
+        timer.record('queue', 0.1)
+        actual = timer.timings
+        expected = {'predict': 1.0, 'preprocess': 0.25, 'queue': 0.1}
+        self.assertEqual(actual, expected)
+        self.assertEqual(list(actual), ['predict', 'preprocess', 'queue'])
+
+    def test_time_records_on_error(self):
+        timer = timing.StageTimer()
+        with self.assertRaises(ValueError):
+            with timer.time('predict'):
+                raise ValueError
+        self.assertEqual(list(timer.timings), ['predict'])
+
+    def test_server_timing_header(self):
+        timer = timing.StageTimer()
+        timer.record('decode', 0.0012)
+        timer.record('predict', 0.5)
+        actual = timer.server_timing_header()
+        expected = 'decode;dur=1.200, predict;dur=500.000'
+        self.assertEqual(actual, expected)
+
+    def test_null_timer(self):
+        timer = timing.NULL_TIMER
+        with timer.time('predict'):
+            timer.record('queue', 1)
+        self.assertFalse(timer.enabled)
+        self.assertEqual(timer.timings, {})
+        self.assertEqual(timer.server_timing_header(), '')
+
+
+class TestParseRequestStart(unittest.TestCase):
+    def test_units(self):
+        now = 1600000010.0
+        self.assertAlmostEqual(timing.parse_request_start('t=1600000009.5', now), 0.5)
+        self.assertAlmostEqual(timing.parse_request_start('1600000009500', now), 0.5)
+        self.assertAlmostEqual(timing.parse_request_start('t=1600000009500000', now), 0.5)
+
+    def test_clock_skew(self):
+        self.assertEqual(timing.parse_request_start('t=1600000011', 1600000010.0), 0.0)
+
+    def test_invalid(self):
+        self.assertIsNone(timing.parse_request_start('t=yesterday', 1600000010.0))
+
+
+if __name__ == '__main__':
+    unittest.main()